@@ -1,51 +1,115 @@
-import json
 import os
 import sys
 import time
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+from session_store import SessionStore
+from driver_pool import create_driver
+from form_macro import fill_and_submit
+from utils import APP_INDEX_URL, wait_until, click_and_await, url_not_contains, POLL_INTERVAL
+from tracing import traced
+from config_handler import ConfigHandler
+from events import default_bus, LOGIN, MFA, ACTIVE, COMPLETED, ERROR
+from utils import wait_for_page_load as wait_for_ready_state
+
+# CDP Network.setCookies 接受的Cookie字段
+CDP_COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+
+# 获取验证码、备用验证码输入框、提交和信任设备按钮的定位（与PAGE_STATE_SCRIPT中的判断一致）
+GET_CODE_XPATH = "//button[contains(text(), '获取')]"
+CODE_INPUT_XPATH = "//input[@placeholder='请输入' or @placeholder='请输入验证码' or contains(@placeholder, '验证码')]"
+SUBMIT_XPATH = "//button[contains(text(), '登录') or contains(text(), '提交') or contains(text(), '确认')]"
+TRUST_XPATH = "//button[contains(@class, 'trust-device-button') or contains(., '信任此设备')]"
+
+# 一次性读取认证相关的页面状态（页面内容在浏览器中判断，不传输page_source）
+PAGE_STATE_SCRIPT = """
+function visible(el) { return !!el && !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length); }
+function byId(id) { var el = document.getElementById(id); return visible(el); }
+function byXpath(xpath) {
+    var r = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (var i = 0; i < r.snapshotLength; i++) { if (visible(r.snapshotItem(i))) { return true; } }
+    return false;
+}
+var html = document.documentElement ? document.documentElement.outerHTML : '';
+var messages = [];
+var nodes = document.querySelectorAll('[class*=toast], [class*=message], [class*=msg], [class*=error], [class*=alert], [role=alert]');
+for (var i = 0; i < nodes.length && messages.length < 5; i++) {
+    var text = (nodes[i].innerText || '').trim();
+    if (text && text.length <= 200 && visible(nodes[i]) && messages.indexOf(text) < 0) { messages.push(text); }
+}
+var getCode = document.getElementById('getDynamicCode');
+return {
+    url: location.href,
+    ready_state: document.readyState,
+    mfa_page: html.indexOf('多因子认证') >= 0,
+    mfa_marker: html.indexOf('多因子') >= 0,
+    code_hint: html.indexOf('验证码') >= 0 && html.indexOf('登录') >= 0,
+    login_form: !!document.getElementById('username'),
+    code_input: byId('dynamicCode'),
+    code_input_alt: byXpath(arguments[0]),
+    get_code: visible(getCode) && !getCode.disabled,
+    get_code_alt: byXpath(arguments[1]),
+    submit: byId('reAuthSubmitBtn'),
+    submit_alt: byXpath(arguments[2]),
+    trust: byXpath(arguments[3]),
+    success: html.indexOf('成功') >= 0,
+    messages: messages
+};
+"""
 
 class Authentication:
-    def __init__(self, driver=None, config_path=None, user_key=None, headless=False):
+    def __init__(self, driver=None, config_path=None, user_key=None, headless=False, session_store=None, driver_pool=None,
+                 event_bus=None, config_view=None):
         """
         初始化认证模块
         
         参数:
-            driver: WebDriver实例，如果为None则创建新实例
+            driver: WebDriver实例，如果为None则从浏览器池获取或创建新实例
             config_path: 配置文件路径
             user_key: 用户配置键名
             headless: 是否以无头模式运行
+            session_store: 会话Cookie缓存，如果为None则使用默认的本地缓存
+            driver_pool: 预热的WebDriver池，关闭时将浏览器归还到池中
+            event_bus: 发布登录和多因子验证步骤事件的EventBus，默认为events.default_bus
+            config_view: 用户的只读配置视图（ConfigHandler.view），提供时忽略config_path和user_key
         """
         self.driver = driver
+        self.events = event_bus or default_bus
+        self.driver_pool = None
         self.user_key = user_key
         self.is_logged_in = False
         self.config = None
+        self.view = config_view
+        
+        # 加载配置（使用调用方的配置视图或共享的配置服务，不重复解析文件）
+        if config_view is not None:
+            self.config = config_view.config
+            self.user_key = config_view.user_key
+        elif config_path:
+            self.config = ConfigHandler.shared().load(config_path)
         
-        # 加载配置
-        if config_path:
-            with open(self.resource_path(config_path), 'r', encoding='utf-8') as f:
-                self.config = json.load(f)
+        # 会话缓存（配置中 session_cache 为 false 时禁用）
+        if self.config and self.config.get('session_cache') is False:
+            self.session_store = None
+        else:
+            self.session_store = session_store or SessionStore()
         
         # 创建新WebDriver如果未提供
-        if self.driver is None:
-            options = Options()
-            
-            if headless:
-                options.add_argument("--headless")
-                
-            options.add_argument("--disable-gpu")
-            options.add_argument("--no-sandbox")
-            self.driver = webdriver.Chrome(options=options)
+        if self.driver is None and driver_pool is not None:
+            self.driver = driver_pool.acquire(headless)
+            self.driver_pool = driver_pool
+            self.should_quit_driver = False
+        elif self.driver is None:
+            self.driver = create_driver(headless)
             self.should_quit_driver = True
         else:
             self.should_quit_driver = False
         
-        # 设置WebDriverWait
-        self.wait = WebDriverWait(self.driver, 10)
+        # 设置WebDriverWait（短轮询间隔）
+        self.wait = WebDriverWait(self.driver, 10, poll_frequency=POLL_INTERVAL)
     
     @staticmethod
     def resource_path(relative_path):
@@ -61,12 +125,148 @@ class Authentication:
 
     def wait_for_page_load(self, timeout=30):
         """等待页面加载完成"""
-        wait = WebDriverWait(self.driver, timeout)
+        return wait_for_ready_state(self.driver, timeout)
+
+    def click_and_wait_stale(self, element, timeout=10, name=None):
+        """
+        点击会触发页面跳转的按钮，等待旧页面被替换
+
+        返回:
+            bool: 页面是否在超时前发生了跳转
+        """
         try:
-            wait.until(lambda d: d.execute_script('return document.readyState') == 'complete')
+            click_and_await(self.driver, element, EC.staleness_of(element), timeout, name)
+            return True
+        except TimeoutException:
+            return False
+    
+    def get_all_cookies(self):
+        """获取浏览器中所有域的Cookie（webvpn和CAS）"""
+        try:
+            return self.driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']
+        except Exception:
+            # 非Chrome驱动时只能获取当前域的Cookie
+            return self.driver.get_cookies()
+    
+    def save_session(self, callback=None):
+        """登录成功后保存会话Cookie"""
+        if not self.session_store or not self.user_key:
+            return False
+        try:
+            cookies = self.get_all_cookies()
+            if self.session_store.save(self.user_key, cookies):
+                if callback: callback("已保存会话缓存")
+                return True
         except Exception as e:
-            logging.warning(f"页面加载超时: {e}")
+            logging.warning(f"保存会话Cookie失败: {e}")
+        return False
+    
+    def restore_cookies(self, url, callback=None):
+        """
+        在打开页面之前将缓存的Cookie写回浏览器
+        
+        参数:
+            url: 即将打开的页面URL（CDP不可用时用于定位Cookie所属域）
+            callback: 回调函数，用于报告状态更新
+        
+        返回:
+            bool: 是否写入了缓存的Cookie
+        """
+        if not self.session_store or not self.user_key:
+            return False
+        cookies = self.session_store.load(self.user_key)
+        if not cookies:
+            return False
+        
+        try:
+            # 通过CDP直接写入所有域的Cookie，无需先打开页面
+            params = [{k: c[k] for k in CDP_COOKIE_FIELDS if k in c} for c in cookies]
+            self.driver.execute_cdp_cmd('Network.setCookies', {'cookies': params})
+        except Exception:
+            # 回退方案：先打开目标域，再逐个添加Cookie
+            try:
+                self.driver.get(url)
+                for cookie in cookies:
+                    cookie = {k: v for k, v in cookie.items() if k in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry')}
+                    try:
+                        self.driver.add_cookie(cookie)
+                    except Exception:
+                        pass
+            except Exception as e:
+                logging.warning(f"恢复会话Cookie失败: {e}")
+                return False
+        
+        if callback: callback("已载入缓存的会话")
+        return True
     
+    def probe_page_state(self):
+        """
+        通过一次execute_script读取认证相关的页面状态
+
+        返回:
+            dict: url、ready_state、mfa_page（含“多因子认证”）、mfa_marker（含“多因子”）、
+                  code_hint（同时含“验证码”和“登录”）、login_form（有用户名输入框）、
+                  code_input / code_input_alt（验证码输入框）、get_code / get_code_alt（获取验证码按钮）、
+                  submit / submit_alt（提交按钮）、trust（信任此设备按钮）、success（含“成功”）、
+                  messages（页面上的提示/错误信息）
+        """
+        return self.driver.execute_script(PAGE_STATE_SCRIPT, CODE_INPUT_XPATH, GET_CODE_XPATH, SUBMIT_XPATH, TRUST_XPATH)
+
+    @staticmethod
+    def needs_mfa(state):
+        """页面状态是否为多因子认证页面"""
+        return state['mfa_page'] or state['code_input'] or (state['code_hint'] and state['get_code_alt'])
+
+    def is_session_valid(self):
+        """检查当前页面是否已处于登录状态（未跳转到登录页）"""
+        state = self.probe_page_state()
+        return "login" not in state['url'] and not state['login_form']
+    
+    def restore_session(self, url, callback=None):
+        """
+        尝试使用缓存的会话跳过登录
+        
+        返回:
+            bool: 会话是否有效
+        """
+        if not self.restore_cookies(url, callback):
+            return False
+        
+        try:
+            self.driver.get(url)
+            self.wait_for_page_load()
+            if self.is_session_valid():
+                self.is_logged_in = True
+                if callback: callback("会话缓存有效，已跳过登录，登录成功")
+                return True
+        except Exception as e:
+            logging.warning(f"验证会话缓存时出错: {e}")
+        
+        # 会话已失效，清理后走完整登录流程
+        if callback: callback("会话缓存已失效，重新登录")
+        self.discard_session()
+        return False
+    
+    def discard_session(self):
+        """删除失效的会话缓存并清空浏览器Cookie"""
+        if self.session_store and self.user_key:
+            self.session_store.clear(self.user_key)
+        try:
+            self.driver.delete_all_cookies()
+        except Exception:
+            pass
+    
+    def get_user_config(self):
+        """当前用户的配置（预约配置在reserveUrl下，签到配置在顶层），找不到时返回None"""
+        if self.view is not None:
+            return self.view.user
+        if not self.config or not self.user_key:
+            return None
+        if self.user_key in self.config.get('reserveUrl', {}):
+            return self.config['reserveUrl'][self.user_key]
+        return self.config.get(self.user_key)
+    
+    @traced('auth.login')
     def login(self, username=None, password=None, url=None, callback=None):
         """
         执行登录操作
@@ -82,30 +282,23 @@ class Authentication:
         """
         try:
             # 从配置中获取参数（如果未提供）
+            user_config = self.get_user_config()
             if username is None and self.config and self.user_key:
+                if user_config is None:
+                    if callback: callback(f"错误: 无法找到用户名配置")
+                    return False
                 try:
-                    # 尝试不同的配置路径
-                    if 'reserveUrl' in self.config and self.user_key in self.config['reserveUrl']:
-                        username = self.config['reserveUrl'][self.user_key]['username']
-                    elif self.user_key in self.config:
-                        username = self.config[self.user_key]['username']
-                    else:
-                        if callback: callback(f"错误: 无法找到用户名配置")
-                        return False
+                    username = user_config['username']
                 except Exception as e:
                     if callback: callback(f"获取用户名配置时出错: {str(e)}")
                     return False
             
             if password is None and self.config and self.user_key:
+                if user_config is None:
+                    if callback: callback(f"错误: 无法找到密码配置")
+                    return False
                 try:
-                    # 尝试不同的配置路径
-                    if 'reserveUrl' in self.config and self.user_key in self.config['reserveUrl']:
-                        password = self.config['reserveUrl'][self.user_key]['password']
-                    elif self.user_key in self.config:
-                        password = self.config[self.user_key]['password']
-                    else:
-                        if callback: callback(f"错误: 无法找到密码配置")
-                        return False
+                    password = user_config['password']
                 except Exception as e:
                     if callback: callback(f"获取密码配置时出错: {str(e)}")
                     return False
@@ -113,7 +306,7 @@ class Authentication:
             # 使用默认URL或从配置中获取
             if url is None:
                 # 默认登录URL
-                url = "https://webvpn3.hebau.edu.cn/https/77726476706e69737468656265737421f5ff40902b7e60557c099ce29d51367b21a6/qljfwapp/sys/lwAppointmentPublicPlace/*default/index.do"
+                url = APP_INDEX_URL
                 
                 # 尝试从配置中获取URL
                 if self.config and 'url' in self.config:
@@ -123,123 +316,106 @@ class Authentication:
                 
                 if callback: callback(f"使用URL: {url}")
             
+            self.events.emit(LOGIN, ACTIVE, user=self.user_key)
+            
+            # 优先尝试复用缓存的会话
+            if self.restore_session(url, callback):
+                self.events.emit(LOGIN, COMPLETED, user=self.user_key, restored=True)
+                return True
+            
             # 打开登录页面
             if callback: callback("正在打开登录页面...")
             self.driver.get(url)
             self.wait_for_page_load()
             
-            # 等待用户名输入框出现
+            # 等待登录表单出现后一次填写用户名、密码并提交，等待提交后的页面替换
             if callback: callback("正在登录...")
-            username_input = self.wait.until(
-                EC.presence_of_element_located((By.ID, 'username'))
+            fill_and_submit(
+                self.driver, 'login',
+                [(By.ID, 'username', username), (By.ID, 'password', password)],
+                (By.ID, 'login_submit'), timeout=10, submit_timeout=15
             )
-            
-            # 输入用户名和密码
-            username_input.clear()
-            username_input.send_keys(username)
-            
-            password_input = self.driver.find_element(By.ID, 'password')
-            password_input.clear()
-            password_input.send_keys(password)
-            
-            # 点击登录按钮
-            login_button = self.driver.find_element(By.ID, 'login_submit')
-            login_button.click()
-            
-            # 等待页面加载
-            time.sleep(3)  # 短暂等待，让登录过程开始
             self.wait_for_page_load()
             
-            # 检查是否需要多因子验证
-            if self.check_for_mfa(callback):
+            # 一次读取页面状态，判断是否需要多因子验证以及是否登录成功
+            state = self.probe_page_state()
+            if self.check_for_mfa(callback, state):
                 if callback: callback("需要多因子验证")
+                self.events.emit(MFA, ACTIVE, user=self.user_key)
                 return "MFA_REQUIRED"
             
             # 验证登录是否成功
-            if "login" not in self.driver.current_url:
+            if "login" not in state['url']:
                 self.is_logged_in = True
+                self.save_session(callback)
                 if callback: callback("登录成功")
+                self.events.emit(LOGIN, COMPLETED, user=self.user_key)
                 return True
             else:
-                if callback: callback("登录失败，请检查用户名和密码")
+                detail = f": {'；'.join(state['messages'])}" if state['messages'] else "，请检查用户名和密码"
+                if callback: callback(f"登录失败{detail}")
+                self.events.emit(LOGIN, ERROR, user=self.user_key)
                 return False
             
         except Exception as e:
             if callback: callback(f"登录过程中出错: {str(e)}")
             logging.error(f"登录失败: {e}")
+            self.events.emit(LOGIN, ERROR, user=self.user_key, error=str(e))
             return False
     
-    def check_for_mfa(self, callback=None):
+    @traced('auth.check_for_mfa')
+    def check_for_mfa(self, callback=None, state=None):
         """
-        检查是否需要多因子验证
+        检查是否需要多因子验证，需要时点击获取验证码按钮
         
         参数:
             callback: 回调函数，用于报告状态更新
+            state: 已读取的页面状态（probe_page_state），为None时重新读取
         
         返回:
             bool: 是否需要多因子验证
         """
         try:
-            # 检查页面标题或内容是否包含多因子验证相关文字
-            if "多因子认证" in self.driver.page_source:
+            state = state or self.probe_page_state()
+            if not self.needs_mfa(state):
+                return False
+            
+            if state['mfa_page']:
                 if callback: callback("检测到多因子认证页面")
-                
-                # 尝试点击获取验证码按钮
+            elif state['code_input']:
+                if callback: callback("找到验证码输入框")
+            else:
+                if callback: callback("页面包含验证码和登录字样，可能是多因子认证页面")
+            
+            # 获取验证码按钮可能稍后才渲染，只轮询页面状态
+            if not (state['get_code'] or state['get_code_alt']):
                 try:
-                    # 等待获取验证码按钮出现
-                    get_code_button = WebDriverWait(self.driver, 5).until(
-                        EC.element_to_be_clickable((By.ID, 'getDynamicCode'))
+                    state = wait_until(
+                        self.driver,
+                        lambda driver: (lambda s: s if s['get_code'] or s['get_code_alt'] else None)(self.probe_page_state()),
+                        timeout=5, name='mfa_get_code'
                     )
-                    if callback: callback("点击获取验证码按钮")
-                    get_code_button.click()
+                except TimeoutException:
+                    if callback: callback("未找到获取验证码按钮")
                     return True
-                except Exception as e:
-                    if callback: callback(f"点击获取验证码按钮失败: {e}")
-                    logging.error(f"点击获取验证码按钮失败: {e}")
-                    # 尝试其他可能的按钮
-                    try:
-                        # 尝试通过文本内容找到获取验证码按钮
-                        buttons = self.driver.find_elements(By.XPATH, "//button[contains(text(), '获取验证码') or contains(text(), '获取')]")
-                        if buttons:
-                            if callback: callback("找到替代的获取验证码按钮")
-                            buttons[0].click()
-                            return True
-                    except Exception as e2:
-                        if callback: callback(f"尝试替代按钮也失败: {e2}")
-                        logging.error(f"尝试替代按钮也失败: {e2}")
-            
-            # 检查是否有其他多因子验证的元素（适配不同的多因子页面）
             
-            # 检查方法1: 通过ID检查验证码输入框
             try:
-                code_input = self.driver.find_element(By.ID, 'dynamicCode')
-                if code_input.is_displayed():
-                    if callback: callback("找到验证码输入框")
-                    # 找到获取验证码按钮并点击
-                    get_code_buttons = self.driver.find_elements(By.XPATH, "//button[contains(text(), '获取')]")
-                    if get_code_buttons:
-                        get_code_buttons[0].click()
-                        if callback: callback("点击获取验证码按钮")
-                    return True
-            except:
-                pass
-            
-            # 检查方法2: 通过页面标题或内容
-            if "验证码" in self.driver.page_source and "登录" in self.driver.page_source:
-                if callback: callback("页面包含验证码和登录字样，可能是多因子认证页面")
-                # 尝试找到并点击获取验证码按钮
-                buttons = self.driver.find_elements(By.XPATH, "//button[contains(text(), '获取')]")
-                if buttons:
-                    buttons[0].click()
-                    if callback: callback("点击获取验证码按钮")
-                    return True
-            
-            return False
+                if state['get_code']:
+                    self.driver.find_element(By.ID, 'getDynamicCode').click()
+                else:
+                    if callback: callback("找到替代的获取验证码按钮")
+                    self.driver.find_element(By.XPATH, GET_CODE_XPATH).click()
+                if callback: callback("点击获取验证码按钮")
+            except Exception as e:
+                if callback: callback(f"点击获取验证码按钮失败: {e}")
+                logging.error(f"点击获取验证码按钮失败: {e}")
+            return True
         except Exception as e:
             if callback: callback(f"检查多因子验证时出错: {e}")
             logging.error(f"检查多因子验证时出错: {e}")
             return False
     
+    @traced('auth.submit_verification_code')
     def submit_verification_code(self, code, callback=None):
         """
         提交多因子验证码
@@ -254,94 +430,75 @@ class Authentication:
         try:
             if callback: callback(f"正在提交验证码: {code}")
             
-            # 先尝试通过ID找到验证码输入框
+            # 等待验证码输入框出现（只轮询页面状态）
             try:
-                code_input = WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.ID, 'dynamicCode'))
+                state = wait_until(
+                    self.driver,
+                    lambda driver: (lambda s: s if s['code_input'] or s['code_input_alt'] else None)(self.probe_page_state()),
+                    timeout=10, name='mfa_code_input'
                 )
+            except TimeoutException:
+                if callback: callback("未找到验证码输入框")
+                self.events.emit(MFA, ERROR, user=self.user_key, error="未找到验证码输入框")
+                return False
+            
+            if state['code_input']:
+                code_field = (By.ID, 'dynamicCode', code)
                 if callback: callback("找到验证码输入框(通过ID)")
-            except:
-                if callback: callback("未通过ID找到验证码输入框，尝试其他方法")
-                # 尝试通过placeholder找到验证码输入框
-                code_input = WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.XPATH, "//input[@placeholder='请输入' or @placeholder='请输入验证码' or contains(@placeholder, '验证码')]"))
-                )
+            else:
+                code_field = (By.XPATH, CODE_INPUT_XPATH, code)
                 if callback: callback("找到验证码输入框(通过placeholder)")
-            
-            # 输入验证码
-            code_input.clear()
-            code_input.send_keys(code)
-            
-            # 点击登录/提交按钮
-            # 先尝试通过ID找到按钮
-            try:
-                submit_button = self.driver.find_element(By.ID, 'reAuthSubmitBtn')
+            if state['submit']:
+                submit_button = (By.ID, 'reAuthSubmitBtn')
                 if callback: callback("找到提交按钮(通过ID)")
-            except:
-                if callback: callback("未通过ID找到提交按钮，尝试其他方法")
-                # 尝试通过文本内容找到按钮
-                submit_button = self.driver.find_element(By.XPATH, "//button[contains(text(), '登录') or contains(text(), '提交') or contains(text(), '确认')]")
+            else:
+                submit_button = (By.XPATH, SUBMIT_XPATH)
                 if callback: callback("找到提交按钮(通过文本)")
             
-            submit_button.click()
+            # 一次填写验证码并点击提交按钮
+            fill_and_submit(self.driver, 'mfa', [code_field], submit_button, timeout=5, submit_timeout=10)
             if callback: callback("已点击提交按钮")
-            
-            # 等待页面加载
-            time.sleep(2)
             self.wait_for_page_load()
             
-            # 尝试找到并点击"信任此设备"按钮
-            try:
-                # 尝试多种方式找到信任此设备按钮
-                trust_buttons = []
+            # 提交后出现"信任此设备"按钮时点击
+            state = self.probe_page_state()
+            if state['trust']:
                 try:
-                    # 通过class查找
-                    trust_buttons = self.driver.find_elements(By.CLASS_NAME, 'trust-device-button')
-                except:
-                    pass
-                
-                if not trust_buttons:
-                    try:
-                        # 通过文本内容查找
-                        trust_buttons = self.driver.find_elements(By.XPATH, "//button[contains(., '信任此设备')]")
-                    except:
-                        pass
-                
-                if not trust_buttons:
-                    try:
-                        # 通过完整XPath查找
-                        trust_buttons = self.driver.find_elements(By.XPATH, "//button[@class='trust-device-button trust-device-sub-btn']")
-                    except:
-                        pass
-                
-                if trust_buttons:
                     if callback: callback("找到'信任此设备'按钮，点击中...")
-                    trust_buttons[0].click()
-                    time.sleep(1)  # 等待按钮点击效果
+                    self.click_and_wait_stale(self.driver.find_element(By.XPATH, TRUST_XPATH), timeout=5, name='trust_device')
                     if callback: callback("已点击'信任此设备'按钮")
-                else:
-                    if callback: callback("未找到'信任此设备'按钮，继续验证流程")
-            except Exception as e:
-                if callback: callback(f"处理'信任此设备'按钮时出错: {e}")
-                logging.warning(f"处理'信任此设备'按钮时出错: {e}")
-                # 继续流程，不要因为这个错误而中断
+                except Exception as e:
+                    if callback: callback(f"处理'信任此设备'按钮时出错: {e}")
+                    logging.warning(f"处理'信任此设备'按钮时出错: {e}")
+                    # 继续流程，不要因为这个错误而中断
+            else:
+                if callback: callback("未找到'信任此设备'按钮，继续验证流程")
             
-            # 等待页面加载
-            time.sleep(1)
+            # 等待跳出登录页（最多几秒，失败时直接进入判断）
+            try:
+                wait_until(self.driver, url_not_contains("login"), timeout=5, name='mfa_redirect')
+            except TimeoutException:
+                pass
             self.wait_for_page_load()
             
             # 检查是否验证成功
-            if "login" not in self.driver.current_url and "多因子" not in self.driver.page_source:
+            state = self.probe_page_state()
+            if "login" not in state['url'] and not state['mfa_marker']:
                 self.is_logged_in = True
+                self.save_session(callback)
                 if callback: callback("验证成功")
+                self.events.emit(MFA, COMPLETED, user=self.user_key)
                 return True
             else:
-                if callback: callback("验证失败")
+                detail = f": {'；'.join(state['messages'])}" if state['messages'] else ""
+                if callback: callback(f"验证失败{detail}")
+                self.events.emit(MFA, ERROR, user=self.user_key)
                 return False
                 
         except Exception as e:
             if callback: callback(f"提交验证码时出错: {str(e)}")
             logging.error(f"验证码提交失败: {e}")
+            self.events.emit(MFA, ERROR, user=self.user_key, error=str(e))
             return False
     
     def logout(self):
@@ -359,7 +516,10 @@ class Authentication:
     
     def close(self):
         """关闭WebDriver"""
-        if self.should_quit_driver and self.driver:
+        if self.driver_pool and self.driver:
+            self.driver_pool.release(self.driver)
+            self.driver = None
+        elif self.should_quit_driver and self.driver:
             self.driver.quit()
 
 # 如果直接运行该模块，执行测试
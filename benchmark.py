@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import logging
+
+from mock_server import MockLibraryServer
+from driver_pool import create_driver
+from reserve import LibraryReserve
+from utils import wait_stats_summary
+from form_macro import form_stats
+from tracing import percentile, format_summary, export_chrome_trace
+
+# 统计的阶段（按流程顺序）
+PHASES = ('login', 'mfa', 'navigate', 'select_area', 'select_seat', 'confirm')
+
+def write_reserve_config(server, directory, seat_label='A101'):
+    """生成指向模拟服务器的预约配置文件，返回文件路径"""
+    config = {
+        'reserveUrl': {
+            'bench': {
+                'username': 'bench',
+                'password': 'bench',
+                'real_name': '测试',
+                'phone_number': '10000000000',
+                'seat_xpath': f"//p[@class='grid-cell-info' and text()='{seat_label}']",
+            }
+        },
+        'selectArea': "//button[@id='selectArea']",
+        'eastC': "//button[@id='eastC']",
+        'confirmButton': "//button[@id='confirmButton']",
+        'url': server.app_url,
+        'app_url': server.app_url,
+        'session_cache': False,
+        'httpEngine': {'base_url': server.base_url + '/app/'},
+    }
+    path = os.path.join(directory, 'reserveConfig.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return path
+
+def run_once(server, config_path, driver):
+    """
+    执行一次完整的登录+预约流程，记录各阶段耗时
+
+    返回:
+        (各阶段耗时秒数的dict, 是否预约成功)
+    """
+    server.state.reset()
+    driver.delete_all_cookies()
+    timings = {}
+
+    def timed(phase, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[phase] = time.perf_counter() - start
+        return result
+
+    reserver = LibraryReserve(driver=driver, user_key='bench', config_path=config_path)
+    login_result = timed('login', reserver.auth.login)
+    if login_result == "MFA_REQUIRED":
+        timed('mfa', reserver.auth.submit_verification_code, server.state.mfa_code)
+    if not reserver.auth.is_logged_in:
+        return timings, False
+
+    url = reserver.build_reservation_url(1)
+    timed('navigate', reserver.navigate_to_slot, url)
+    timed('select_area', reserver.select_area)
+    success, status, _ = timed('select_seat', reserver.select_seat)
+    if status == 2:
+        return timings, True
+    if not success:
+        return timings, False
+    return timings, timed('confirm', reserver.confirm_reservation)
+
+def summarize(samples):
+    """汇总多次运行的阶段耗时（毫秒）"""
+    summary = {}
+    for phase in PHASES:
+        values = [s[phase] * 1000 for s in samples if phase in s]
+        if values:
+            summary[phase] = {
+                'mean_ms': round(sum(values) / len(values), 1),
+                'p50_ms': round(percentile(values, 50), 1),
+                'max_ms': round(max(values), 1),
+            }
+    return summary
+
+def compare(summary, baseline, tolerance=0.2, min_delta_ms=50):
+    """
+    与基线比较，返回变慢的阶段列表
+
+    参数:
+        tolerance: 允许的相对增幅
+        min_delta_ms: 允许的绝对增幅（毫秒），避免噪声误报
+    """
+    regressions = []
+    for phase, stats in summary.items():
+        base = baseline.get(phase)
+        if not base:
+            continue
+        delta = stats['p50_ms'] - base['p50_ms']
+        if delta > min_delta_ms and delta > base['p50_ms'] * tolerance:
+            regressions.append((phase, base['p50_ms'], stats['p50_ms']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="基于本地模拟服务器的登录/预约耗时基准测试")
+    parser.add_argument('--runs', type=int, default=3, help="运行次数")
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟服务器每个请求的延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="随机延迟上限（秒）")
+    parser.add_argument('--contention', type=float, default=0.0, help="空座被抢走的概率")
+    parser.add_argument('--headless', action='store_true', help="无头模式运行浏览器")
+    parser.add_argument('--baseline', default='bench_baseline.json', help="基线文件路径")
+    parser.add_argument('--save-baseline', action='store_true', help="将本次结果保存为基线")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的相对变慢比例")
+    parser.add_argument('--trace', help="把各步骤耗时导出为Chrome trace文件")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s - %(levelname)s: %(message)s')
+
+    server = MockLibraryServer(latency=args.latency, jitter=args.jitter,
+                               contention=args.contention, booked_ratio=0.0, seed=0).start()
+    driver = create_driver(args.headless)
+    samples = []
+    failures = 0
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = write_reserve_config(server, directory)
+            for i in range(args.runs):
+                timings, ok = run_once(server, config_path, driver)
+                samples.append(timings)
+                failures += 0 if ok else 1
+                phases = ", ".join(f"{p}={timings[p] * 1000:.0f}ms" for p in PHASES if p in timings)
+                print(f"第{i + 1}次: {'成功' if ok else '失败'}  {phases}")
+    finally:
+        driver.quit()
+        server.stop()
+
+    summary = summarize(samples)
+    print("\n阶段          平均(ms)   p50(ms)   最大(ms)")
+    for phase, stats in summary.items():
+        print(f"{phase:<12} {stats['mean_ms']:>9} {stats['p50_ms']:>9} {stats['max_ms']:>9}")
+
+    print("\n等待            次数   总计(ms)   最大(ms)")
+    for name, stats in sorted(wait_stats_summary().items()):
+        print(f"{name:<16} {stats['count']:>4} {stats['total_ms']:>10} {stats['max_ms']:>10}")
+
+    print("\n表单      脚本填写(ms)   逐个输入(ms)   请求数   节省(ms)")
+    for name, stats in sorted(form_stats().items()):
+        print(f"{name:<8} {str(stats['macro_ms']):>12} {str(stats['typed_ms']):>13} {stats['round_trips']:>8} {str(stats['saved_ms']):>10}")
+
+    print("\n" + format_summary())
+    if args.trace:
+        export_chrome_trace(args.trace)
+        print(f"已导出跟踪记录: {args.trace}")
+
+    exit_code = 1 if failures else 0
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\n已保存基线: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, tolerance=args.tolerance)
+        for phase, before, after in regressions:
+            print(f"⚠️ {phase} 变慢: {before}ms -> {after}ms")
+        if regressions:
+            exit_code = 1
+        else:
+            print("\n与基线相比没有明显变慢")
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
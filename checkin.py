@@ -1,16 +1,21 @@
-import json
 import logging
 import os
 import sys
 import time
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support import expected_conditions as EC
 
 from auth import Authentication
+from utils import APP_INDEX_URL, wait_until, click_and_await
+from tracing import traced
+from config_handler import ConfigHandler, ConfigView, FrozenDict
+from events import OPERATION, ACTIVE, COMPLETED, ERROR
+from reservation_plan import DEFAULT_PLACE
 
 class LibraryCheckin:
-    def __init__(self, driver=None, user_key=None, config_path='checkinConfig.json', callback=None, headless=False):
+    def __init__(self, driver=None, user_key=None, config_path='checkinConfig.json', callback=None, headless=False, driver_pool=None, session_store=None,
+                 event_bus=None, config_view=None):
         """
         初始化图书馆签到类
         
@@ -19,31 +24,39 @@ class LibraryCheckin:
             user_key: 用户配置键名
             config_path: 配置文件路径
             callback: 回调函数，用于报告状态更新
+            driver_pool: 预热的WebDriver池，未提供driver时从池中获取浏览器
+            session_store: 共享的会话Cookie缓存，为None时使用默认的本地缓存
+            event_bus: 发布步骤事件的EventBus，默认为events.default_bus
+            config_view: 用户的只读配置视图（ConfigHandler.view），提供时忽略user_key和config_path
         """
-        self.user_key = user_key
         self.callback = callback or (lambda msg: None)  # 默认回调为空函数
         
-        # 加载配置
-        try:
-            with open(self.resource_path(config_path), 'r', encoding='utf-8') as f:
-                self.config = json.load(f)
-            self.callback(f"成功加载签到配置文件")
-        except Exception as e:
-            error_msg = f"加载签到配置文件失败: {e}"
-            self.callback(error_msg)
-            logging.error(error_msg)
-            self.config = {}
+        # 从共享的配置服务获取配置（文件未修改时不会重新解析）
+        if config_view is None:
+            try:
+                config_view = ConfigHandler.shared().view('checkin', user_key, config_path)
+                self.callback(f"成功加载签到配置文件")
+            except Exception as e:
+                error_msg = f"加载签到配置文件失败: {e}"
+                self.callback(error_msg)
+                logging.error(error_msg)
+                config_view = ConfigView(config_path, 'checkin', user_key, FrozenDict(), None)
+        self.view = config_view
+        self.user_key = user_key = config_view.user_key
+        self.config = config_view.config
         
         # 初始化认证模块
-        self.auth = Authentication(driver=driver, config_path=config_path, user_key=user_key, headless=headless)
+        self.auth = Authentication(driver=driver, headless=headless, session_store=session_store,
+                                   driver_pool=driver_pool, event_bus=event_bus, config_view=config_view)
         self.driver = self.auth.driver
+        self.events = self.auth.events
         
         # 获取座位ID
         try:
-            if user_key in self.config:
-                self.seat_id = self.config[user_key]['seat_id']
-                self.username = self.config[user_key]['username']
-                self.password = self.config[user_key]['password']
+            if config_view.user is not None:
+                self.seat_id = config_view.user['seat_id']
+                self.username = config_view.user['username']
+                self.password = config_view.user['password']
                 self.callback(f"成功加载用户 {user_key} 的签到配置")
             else:
                 error_msg = f"错误: 在配置中找不到用户 {user_key}"
@@ -61,13 +74,27 @@ class LibraryCheckin:
             self.password = None
         
         # 构建签到URL
+        self.place_id = DEFAULT_PLACE['PALCE_ID']
+        self.checkin_url = None
         if self.seat_id:
-            self.checkin_url = f"https://webvpn3.hebau.edu.cn/https/77726476706e69737468656265737421f5ff40902b7e60557c099ce29d51367b21a6/qljfwapp/sys/lwAppointmentPublicPlace/*default/index.do?placeId=fb9dedd807fc48a59dc19338a50ea099&seatId={self.seat_id}#/checkinBySeat"
-            self.callback(f"座位ID: {self.seat_id}")
+            self.set_seat(self.seat_id)
         else:
-            self.checkin_url = None
             self.callback("警告: 未设置座位ID，无法构建签到URL")
     
+    def set_seat(self, seat_id, place_id=None):
+        """
+        设置签到的座位（例如预约到的替代座位）并重新构建签到URL
+
+        参数:
+            seat_id: 座位data-id
+            place_id: 场所ID，为None时保持不变
+        """
+        self.seat_id = seat_id
+        self.place_id = place_id or self.place_id
+        app_url = self.config.get('app_url', APP_INDEX_URL)
+        self.checkin_url = f"{app_url}?placeId={self.place_id}&seatId={self.seat_id}#/checkinBySeat"
+        self.callback(f"座位ID: {self.seat_id}")
+    
     @staticmethod
     def resource_path(relative_path):
         """ 获取资源绝对路径（支持外部文件）"""
@@ -80,87 +107,117 @@ class LibraryCheckin:
         
         return os.path.join(base_path, relative_path)
     
+    @traced('checkin.perform_check_in')
     def perform_check_in(self):
         """执行签到操作"""
         try:
             self.callback("正在执行签到操作...")
+            self.events.emit(OPERATION, ACTIVE, user=self.user_key)
             
             # 检查当前URL是否包含#/checkinBySeat
             current_url = self.driver.current_url
-            if "#/checkinBySeat" not in current_url:
+            if "#/checkinBySeat" not in current_url or f"seatId={self.seat_id}" not in current_url:
                 self.callback("当前URL不是签到页面，正在修正...")
-                if "?" in current_url:
-                    correct_url = current_url.split("#")[0] + "#/checkinBySeat"
-                else:
-                    correct_url = f"{current_url}?placeId=fb9dedd807fc48a59dc19338a50ea099&seatId={self.seat_id}#/checkinBySeat"
-                self.driver.get(correct_url)
+                self.driver.get(self.checkin_url)
                 self.auth.wait_for_page_load()
             
             # 等待签到按钮出现
-            check_in_button = WebDriverWait(self.driver, 20).until(
-                EC.element_to_be_clickable((By.XPATH, "/html/body/div[1]/div/div[2]/div/button"))
+            check_in_button = wait_until(
+                self.driver, EC.element_to_be_clickable((By.XPATH, "/html/body/div[1]/div/div[2]/div/button")),
+                timeout=20, name='checkin_button'
             )
             
-            # 点击签到按钮
-            check_in_button.click()
-            self.callback("签到成功")
-            
-            # 等待确认
+            # 点击签到按钮并等待确认
             try:
                 # 查找可能的成功消息元素（根据实际页面元素调整）
-                WebDriverWait(self.driver, 5).until(
-                    EC.presence_of_element_located((By.XPATH, "//div[contains(text(), '成功') or contains(text(), '签到成功')]"))
+                click_and_await(
+                    self.driver, check_in_button,
+                    EC.presence_of_element_located((By.XPATH, "//div[contains(text(), '成功') or contains(text(), '签到成功')]")),
+                    timeout=5, name='checkin_result'
                 )
-            except:
+            except TimeoutException:
                 pass  # 即使没有确认消息也继续执行
+            self.callback("签到成功")
+            self.events.emit(OPERATION, COMPLETED, user=self.user_key)
             
             return True
         except Exception as e:
             error_msg = f"签到失败: {e}"
             self.callback(error_msg)
             logging.error(error_msg)
+            self.events.emit(OPERATION, ERROR, user=self.user_key, error=str(e))
             return False
     
+    def open_checkin_page(self):
+        """
+        打开签到页面
+
+        返回:
+            bool: 是否停留在签到页面（False表示被重定向到登录页）
+        """
+        self.driver.get(self.checkin_url)
+        self.auth.wait_for_page_load()
+        return "login" not in self.auth.probe_page_state()['url']
+
+    def prepare(self):
+        """
+        登录并打开签到页面，但不点击签到（定时签到时提前调用）
+
+        返回:
+            True: 已在签到页面
+            False: 失败
+            "MFA_REQUIRED": 需要多因子验证
+        """
+        # 检查是否有签到URL
+        if not self.checkin_url:
+            self.callback("错误: 未设置签到URL，无法继续")
+            return False
+            
+        # 写回缓存的会话Cookie，有效时可直接进入签到页
+        restored = self.auth.restore_cookies(self.checkin_url, callback=self.callback)
+
+        # 打开签到页面
+        self.callback("正在打开签到页面...")
+        if self.open_checkin_page():
+            self.auth.is_logged_in = True
+            return True
+
+        # 需要登录
+        if restored:
+            # 缓存的会话已失效，避免登录时再次尝试
+            self.auth.discard_session()
+        self.callback("需要登录")
+        if not self.username or not self.password:
+            self.callback("错误: 用户名或密码未设置，无法登录")
+            return False
+            
+        login_result = self.auth.login(
+            username=self.username,
+            password=self.password,
+            callback=self.callback,
+            url=self.checkin_url
+        )
+        
+        # 处理多因子验证
+        if login_result == "MFA_REQUIRED":
+            self.callback("等待验证码输入...")
+            return "MFA_REQUIRED"
+        
+        # 检查登录是否成功
+        if not self.auth.is_logged_in:
+            self.callback("登录失败，无法继续签到")
+            return False
+        
+        # 再次打开签到页面
+        self.open_checkin_page()
+        return True
+
     def run(self):
         """执行完整的签到流程"""
         try:
-            # 检查是否有签到URL
-            if not self.checkin_url:
-                self.callback("错误: 未设置签到URL，无法继续")
-                return False
-                
-            # 打开签到页面
-            self.callback("正在打开签到页面...")
-            self.driver.get(self.checkin_url)
-            self.auth.wait_for_page_load()
-            
-            # 检查是否需要登录
-            if "login" in self.driver.current_url:
-                self.callback("需要登录")
-                if not self.username or not self.password:
-                    self.callback("错误: 用户名或密码未设置，无法登录")
-                    return False
-                    
-                login_result = self.auth.login(
-                    username=self.username,
-                    password=self.password,
-                    callback=self.callback,
-                    url=self.checkin_url
-                )
-                
-                # 处理多因子验证
-                if login_result == "MFA_REQUIRED":
-                    self.callback("等待验证码输入...")
-                    return "MFA_REQUIRED"
-                
-                # 检查登录是否成功
-                if not self.auth.is_logged_in:
-                    self.callback("登录失败，无法继续签到")
-                    return False
-                
-                # 再次打开签到页面
-                self.driver.get(self.checkin_url)
-                self.auth.wait_for_page_load()
+            prepared = self.prepare()
+            if prepared is not True:
+                return prepared
             
             # 执行签到
             checkin_result = self.perform_check_in()
@@ -193,8 +250,7 @@ class LibraryCheckin:
                 self.callback("错误: 未设置签到URL，无法继续")
                 return False
                 
-            self.driver.get(self.checkin_url)
-            self.auth.wait_for_page_load()
+            self.open_checkin_page()
             
             # 执行签到
             return self.perform_check_in()
@@ -0,0 +1,410 @@
+import datetime
+import json
+import os
+import threading
+import logging
+
+from checkin import LibraryCheckin
+from config_handler import ConfigHandler, DEFAULT_PATHS
+from reservation_plan import parse_slot_table, slot_table_for
+from utils import resource_path
+
+def configured_slot_starts():
+    """预约配置中各时间段的开始时间 {索引: HH:MM}（读取失败时使用默认时间段表）"""
+    try:
+        table = slot_table_for(ConfigHandler.shared().load(DEFAULT_PATHS['reserve']))
+    except Exception as e:
+        logging.warning(f"读取预约时间段表失败，使用默认时间段: {e}")
+        table = parse_slot_table()
+    return {index: start for index, start, end in table}
+
+def slot_start(date_str, time_index, start=None):
+    """
+    时间段在指定日期的开始时刻
+
+    参数:
+        start: 预约时记录的开始时间 HH:MM，为None时按预约配置的时间段表查找
+    """
+    start = start or configured_slot_starts()[time_index]
+    day = datetime.date.fromisoformat(date_str)
+    return datetime.datetime.combine(day, datetime.datetime.strptime(start, '%H:%M').time())
+
+def has_checkin_user(user_key, config_path='checkinConfig.json'):
+    """签到配置中是否有该用户（预约成功的时段按预约配置中的用户键名在签到配置中查找账号）"""
+    try:
+        return user_key in ConfigHandler.shared().users('checkin', config_path)
+    except Exception as e:
+        logging.warning(f"读取签到配置失败: {e}")
+        return False
+
+def reservation_entries(reserver):
+    """
+    一次预约中成功的时间段及签到所需的信息（可以序列化后在其他进程中加入签到时间表）
+
+    返回:
+        list: [{'date_str', 'time_index', 'start', 'seat_id', 'place_id'}, ...]（参数与CheckinTimeline.add一致）
+    """
+    plan = reserver.plan
+    entries = []
+    for date_str, time_index in reserver.reserved_slots():
+        spec = plan.get(time_index) if plan else None
+        entries.append({
+            'date_str': date_str,
+            'time_index': time_index,
+            'start': spec.start if spec else None,
+            'seat_id': reserver.reserved_seat_id(time_index),
+            'place_id': spec.params['PALCE_ID'] if spec else None,
+        })
+    return entries
+
+class CheckinTimeline:
+    """
+    按用户记录已预约成功的时间段及其签到状态（checkin_timeline.json）
+
+    格式: {用户: [{"date": "YYYY-MM-DD", "slot": 1, "start": "08:00", "seat_id": "...", "place_id": "...",
+                  "status": "pending" | "done" | "missed" | "failed"}, ...]}
+    （start 为预约时的时间段开始时间，没有时按时间段表查找；seat_id/place_id 为预约到的座位和场所，
+    没有时使用签到配置中的座位）
+    """
+
+    def __init__(self, path='checkin_timeline.json'):
+        self.path = resource_path(path)
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except Exception as e:
+            logging.warning(f"读取签到时间表失败: {e}")
+            self.entries = {}
+        return self.entries
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def add(self, user_key, date_str, time_index, start=None, seat_id=None, place_id=None):
+        """添加一个需要签到的时间段（已存在时只补充座位），返回是否新增"""
+        with self.lock:
+            entries = self.entries.setdefault(user_key, [])
+            for entry in entries:
+                if entry['date'] == date_str and entry['slot'] == time_index:
+                    if seat_id and entry.get('seat_id') != seat_id and entry['status'] == 'pending':
+                        entry['seat_id'] = seat_id
+                        if place_id:
+                            entry['place_id'] = place_id
+                        self.save()
+                    return False
+            entry = {'date': date_str, 'slot': time_index, 'status': 'pending'}
+            if start:
+                entry['start'] = start
+            if seat_id:
+                entry['seat_id'] = seat_id
+                if place_id:
+                    entry['place_id'] = place_id
+            entries.append(entry)
+            entries.sort(key=lambda e: (e['date'], e['slot']))
+            self.save()
+            return True
+
+    def record_reservations(self, user_key, reserver):
+        """
+        记录一次预约中成功的时间段
+
+        参数:
+            user_key: 签到配置中的用户键名
+            reserver: 执行过预约的LibraryReserve实例
+
+        返回:
+            新增的时间段数量
+        """
+        added = 0
+        for reservation in reservation_entries(reserver):
+            if self.add(user_key, **reservation):
+                added += 1
+        return added
+
+    def mark(self, user_key, entry, status):
+        """更新时间段的签到状态"""
+        with self.lock:
+            entry['status'] = status
+            self.save()
+
+    def pending(self, user_key, now=None, window_seconds=1800):
+        """
+        用户尚未签到且未过签到截止时间的时间段（按开始时间排序）
+
+        截止时间已过的时间段会被标记为missed
+        """
+        now = now or datetime.datetime.now()
+        result = []
+        with self.lock:
+            for entry in list(self.entries.get(user_key, [])):
+                if entry['status'] != 'pending':
+                    continue
+                start = slot_start(entry['date'], entry['slot'], entry.get('start'))
+                if start + datetime.timedelta(seconds=window_seconds) < now:
+                    self.mark(user_key, entry, 'missed')
+                    logging.warning(f"用户 {user_key} 错过了 {entry['date']} 第{entry['slot']}个时段的签到")
+                    continue
+                result.append((start, entry))
+        result.sort(key=lambda item: item[0])
+        return result
+
+    def prune(self, keep_days=7, now=None):
+        """删除过早的记录"""
+        now = now or datetime.datetime.now()
+        cutoff = (now.date() - datetime.timedelta(days=keep_days)).isoformat()
+        with self.lock:
+            for user_key in list(self.entries):
+                self.entries[user_key] = [e for e in self.entries[user_key] if e['date'] >= cutoff]
+                if not self.entries[user_key]:
+                    del self.entries[user_key]
+            self.save()
+
+class CheckinScheduler:
+    """
+    根据签到时间表自动签到
+
+    每个用户一个线程：在时间段开始前prewarm_seconds从浏览器池取出浏览器并登录到签到页，
+    到开始时刻点击签到；相邻时间段间隔较短时保留浏览器并定时刷新保持会话，
+    间隔较长时把浏览器归还到池中（会话保存在会话缓存中，下次无需重新登录）。
+    线程等待期间再次调用schedule会唤醒线程，重新选择最早的待签到时间段。
+    """
+
+    def __init__(self, timeline, driver_pool=None, session_store=None, config_path='checkinConfig.json',
+                 callback=None, headless=True, mfa_provider=None, prewarm_seconds=180,
+                 window_seconds=1800, keep_browser_gap=1800, keepalive_interval=600, retry_interval=30):
+        """
+        初始化签到调度器
+
+        参数:
+            timeline: CheckinTimeline签到时间表
+            driver_pool: 共享的浏览器池
+            session_store: 共享的会话缓存
+            config_path: 签到配置文件路径
+            callback: 回调函数，用于报告状态更新
+            headless: 是否以无头模式运行
+            mfa_provider: 需要验证码时调用的函数 mfa_provider(user_key) -> 验证码或None
+            prewarm_seconds: 提前登录的秒数
+            window_seconds: 时间段开始后允许签到的秒数
+            keep_browser_gap: 与下一个时间段间隔不超过该秒数时保留浏览器
+            keepalive_interval: 保留浏览器期间刷新签到页的间隔（秒）
+            retry_interval: 签到失败后重试的间隔（秒）
+        """
+        self.timeline = timeline
+        self.driver_pool = driver_pool
+        self.session_store = session_store
+        self.config_path = config_path
+        self.callback = callback or (lambda msg: None)
+        self.headless = headless
+        self.mfa_provider = mfa_provider
+        self.prewarm_seconds = prewarm_seconds
+        self.window_seconds = window_seconds
+        self.keep_browser_gap = keep_browser_gap
+        self.keepalive_interval = keepalive_interval
+        self.retry_interval = retry_interval
+
+        self.threads = {}
+        self.wakeups = {}  # 用户 -> 时间表有更新时设置的Event
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def log(self, user_key, message):
+        self.callback(f"[定时签到 {user_key}] {message}")
+
+    def _wait_until(self, when, wakeup=None):
+        """
+        等待到指定时刻，收到停止信号时返回False
+
+        参数:
+            wakeup: 被设置时提前返回True的Event（调用方需要检查是否已到指定时刻）
+        """
+        remaining = (when - datetime.datetime.now()).total_seconds()
+        if remaining > 0:
+            if wakeup is None:
+                return not self.stopping.wait(remaining)
+            if wakeup.wait(remaining):
+                wakeup.clear()
+        return not self.stopping.is_set()
+
+    def _open_session(self, user_key, entry=None):
+        """创建签到实例并登录到entry中预约到的座位的签到页，失败时返回None"""
+        try:
+            config_view = ConfigHandler.shared().view('checkin', user_key, self.config_path)
+        except Exception as e:
+            logging.error(f"读取用户 {user_key} 的签到配置失败: {e}")
+            return None
+        handler = LibraryCheckin(
+            config_view=config_view,
+            callback=lambda message: self.log(user_key, message),
+            headless=self.headless, driver_pool=self.driver_pool, session_store=self.session_store
+        )
+        if entry is not None:
+            self._use_entry_seat(handler, entry)
+        try:
+            prepared = handler.prepare()
+        except Exception as e:
+            logging.error(f"用户 {user_key} 准备签到时出错: {e}")
+            prepared = False
+        if prepared == "MFA_REQUIRED":
+            code = self.mfa_provider(user_key) if self.mfa_provider else None
+            if code and handler.auth.submit_verification_code(code, callback=handler.callback):
+                handler.open_checkin_page()
+                prepared = True
+            else:
+                self.log(user_key, "需要验证码但未获得有效验证码，无法登录")
+                prepared = False
+        if prepared is not True:
+            handler.close()
+            return None
+        return handler
+
+    @staticmethod
+    def _use_entry_seat(handler, entry):
+        """签到到时间表记录的预约座位（没有记录时保留签到配置中的座位）"""
+        if entry.get('seat_id'):
+            handler.set_seat(entry['seat_id'], entry.get('place_id'))
+
+    def _open_session_until(self, user_key, start, entry):
+        """登录到签到页，失败时每隔retry_interval重试到签到截止时间；仍失败时标记为failed并返回None"""
+        deadline = start + datetime.timedelta(seconds=self.window_seconds)
+        while not self.stopping.is_set():
+            handler = self._open_session(user_key, entry)
+            if handler is not None:
+                return handler
+            retry_at = datetime.datetime.now() + datetime.timedelta(seconds=self.retry_interval)
+            if retry_at > deadline:
+                break
+            self.log(user_key, f"登录签到页失败，{self.retry_interval}秒后重试")
+            if not self._wait_until(retry_at):
+                return None
+        if not self.stopping.is_set():
+            self.timeline.mark(user_key, entry, 'failed')
+            self.log(user_key, f"{entry['date']} 第{entry['slot']}个时段无法登录，签到失败")
+        return None
+
+    def _keepalive_until(self, user_key, handler, when, wakeup=None):
+        """保留浏览器到指定时刻（wakeup被设置时提前返回），期间定时刷新签到页；会话失效时返回None"""
+        while True:
+            next_ping = datetime.datetime.now() + datetime.timedelta(seconds=self.keepalive_interval)
+            if next_ping >= when:
+                self._wait_until(when, wakeup)
+                return handler
+            if not self._wait_until(next_ping, wakeup) or datetime.datetime.now() < next_ping:
+                return handler
+            try:
+                if not handler.open_checkin_page():
+                    self.log(user_key, "会话已失效，将在下个时间段前重新登录")
+                    handler.close()
+                    return None
+            except Exception as e:
+                logging.warning(f"刷新签到页面失败: {e}")
+
+    def _check_in(self, user_key, handler, start, entry):
+        """在签到窗口内签到，失败时重试到截止时间"""
+        deadline = start + datetime.timedelta(seconds=self.window_seconds)
+        while not self.stopping.is_set():
+            try:
+                if handler.open_checkin_page() and handler.perform_check_in():
+                    self.timeline.mark(user_key, entry, 'done')
+                    self.log(user_key, f"{entry['date']} 第{entry['slot']}个时段签到完成")
+                    return True
+            except Exception as e:
+                logging.error(f"用户 {user_key} 签到出错: {e}")
+            retry_at = datetime.datetime.now() + datetime.timedelta(seconds=self.retry_interval)
+            if retry_at > deadline or not self._wait_until(retry_at):
+                break
+        if self.stopping.is_set():
+            return False
+        self.timeline.mark(user_key, entry, 'failed')
+        self.log(user_key, f"{entry['date']} 第{entry['slot']}个时段签到失败")
+        return False
+
+    def run_user(self, user_key):
+        """按时间表依次为用户签到，直到没有待签到的时间段"""
+        handler = None
+        with self.lock:
+            wakeup = self.wakeups.get(user_key)
+        try:
+            while not self.stopping.is_set():
+                # 与schedule()使用同一把锁：没有待签到时间段时在锁内注销线程，之后加入的时间段会启动新线程
+                with self.lock:
+                    pending = self.timeline.pending(user_key, window_seconds=self.window_seconds)
+                    if not pending:
+                        self._unregister(user_key)
+                        return
+                start, entry = pending[0]
+
+                if handler is None:
+                    prewarm_at = start - datetime.timedelta(seconds=self.prewarm_seconds)
+                    if not self._wait_until(prewarm_at, wakeup):
+                        return
+                    if datetime.datetime.now() < prewarm_at:
+                        continue  # 时间表有更新，重新选择最早的时间段
+                    self.log(user_key, f"准备 {entry['date']} 第{entry['slot']}个时段的签到")
+                    handler = self._open_session_until(user_key, start, entry)
+                    if handler is None:
+                        continue
+
+                handler = self._keepalive_until(user_key, handler, start, wakeup)
+                if self.stopping.is_set():
+                    return
+                if handler is None or datetime.datetime.now() < start:
+                    continue
+                # 保留的浏览器可能还停在上一个时间段的座位上
+                self._use_entry_seat(handler, entry)
+                self._check_in(user_key, handler, start, entry)
+
+                # 下一个时间段较远时归还浏览器
+                pending = self.timeline.pending(user_key, window_seconds=self.window_seconds)
+                if pending:
+                    gap = (pending[0][0] - datetime.datetime.now()).total_seconds()
+                    if gap <= self.keep_browser_gap:
+                        continue
+                handler.close()
+                handler = None
+        finally:
+            if handler is not None:
+                handler.close()
+            with self.lock:
+                self._unregister(user_key)
+
+    def _unregister(self, user_key):
+        """移除当前线程的注册（调用时需持有self.lock；已被新线程替换时不做修改）"""
+        if self.threads.get(user_key) is threading.current_thread():
+            del self.threads[user_key]
+            self.wakeups.pop(user_key, None)
+
+    def schedule(self, user_key=None):
+        """为用户（默认所有用户）启动签到线程，已在运行的用户唤醒线程重新读取时间表"""
+        users = [user_key] if user_key else list(self.timeline.entries)
+        for user in users:
+            with self.lock:
+                if self.stopping.is_set():
+                    return
+                if user in self.threads:
+                    self.wakeups[user].set()
+                    continue
+                thread = threading.Thread(target=self.run_user, args=(user,),
+                                          name=f"checkin-{user}", daemon=True)
+                self.threads[user] = thread
+                self.wakeups[user] = threading.Event()
+            thread.start()
+
+    def stop(self, timeout=10):
+        """停止所有签到线程"""
+        self.stopping.set()
+        with self.lock:
+            threads = list(self.threads.values())
+            for wakeup in self.wakeups.values():
+                wakeup.set()
+        for thread in threads:
+            thread.join(timeout)
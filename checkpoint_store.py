@@ -0,0 +1,102 @@
+import json
+import os
+import time
+import logging
+
+from utils import resource_path, file_lock
+
+def checkpoint_key(user_key, date_str):
+    """用户某天的检查点在文件中的键"""
+    return f"{user_key}|{date_str}"
+
+class CheckpointStore:
+    """
+    按（用户, 日期, 时间段）记录已确认的预约结果（reserve_checkpoints.json，读写时加文件锁）
+
+    重试或重新启动预约时只需预约尚未成功的时间段。
+
+    格式: {"用户|YYYY-MM-DD": {"时间段": {"status": "booked", "seat": 座位键或null, "seat_id": 座位data-id或null, "at": 时间戳}}}
+    """
+
+    def __init__(self, path='reserve_checkpoints.json', keep_days=7):
+        """
+        初始化检查点存储
+
+        参数:
+            path: 检查点文件路径
+            keep_days: 保留最近几天的记录
+        """
+        self.path = resource_path(path)
+        self.lock_path = self.path + '.lock'
+        self.keep_days = keep_days
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"读取预约检查点失败: {e}")
+            return {}
+
+    def _write(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _expire(self, data, now):
+        """删除过早日期的记录"""
+        cutoff = time.strftime('%Y-%m-%d', time.localtime(now - self.keep_days * 86400))
+        for key in list(data):
+            if key.rsplit('|', 1)[-1] < cutoff:
+                del data[key]
+
+    def record(self, user_key, date_str, time_index, seat=None, status='booked', seat_id=None):
+        """记录一个时间段的预约结果（seat_id 为座位的data-id，签到时使用）"""
+        with file_lock(self.lock_path):
+            data = self._read()
+            self._expire(data, time.time())
+            slots = data.setdefault(checkpoint_key(user_key, date_str), {})
+            slots[str(time_index)] = {'status': status, 'seat': seat, 'seat_id': seat_id, 'at': time.time()}
+            self._write(data)
+
+    def get(self, user_key, date_str, time_index):
+        """时间段的检查点记录，没有记录时返回None"""
+        with file_lock(self.lock_path):
+            data = self._read()
+        return data.get(checkpoint_key(user_key, date_str), {}).get(str(time_index))
+
+    def completed(self, user_key, date_str):
+        """用户在该日期已预约成功的时间段索引集合"""
+        with file_lock(self.lock_path):
+            data = self._read()
+        slots = data.get(checkpoint_key(user_key, date_str), {})
+        return {int(index) for index, entry in slots.items() if entry.get('status') == 'booked'}
+
+    def seat_ids(self, user_key, date_str):
+        """用户在该日期已预约成功的时间段的座位data-id {时间段索引: data-id}（没有记录时不包含）"""
+        with file_lock(self.lock_path):
+            data = self._read()
+        slots = data.get(checkpoint_key(user_key, date_str), {})
+        return {int(index): entry['seat_id'] for index, entry in slots.items()
+                if entry.get('status') == 'booked' and entry.get('seat_id')}
+
+    def missing(self, user_key, date_str, slot_indices):
+        """slot_indices中尚未预约成功的时间段（保持原顺序）"""
+        done = self.completed(user_key, date_str)
+        return [i for i in slot_indices if i not in done]
+
+    def clear(self, user_key=None, date_str=None):
+        """清除检查点：全部、某个用户的全部日期或某个用户的某一天"""
+        with file_lock(self.lock_path):
+            data = self._read()
+            if user_key is None:
+                data.clear()
+            elif date_str is None:
+                for key in [k for k in data if k.rsplit('|', 1)[0] == user_key]:
+                    del data[key]
+            else:
+                data.pop(checkpoint_key(user_key, date_str), None)
+            self._write(data)
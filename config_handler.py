@@ -1,54 +1,177 @@
 import json
 import os
+import threading
 import logging
 from utils import resource_path
 
+# 各类配置的默认文件
+DEFAULT_PATHS = {
+    'checkin': 'checkinConfig.json',
+    'reserve': 'reserveConfig.json',
+}
+
+class FrozenDict(dict):
+    """只读的dict（isinstance(x, dict) 仍为真，可直接json序列化；需要修改时先用 dict(...) 复制）"""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("配置是只读的，请先用 dict(...) 复制后再修改")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+def freeze(value):
+    """把json数据转换为只读结构（dict -> FrozenDict，list -> tuple）"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def user_sections(kind, config):
+    """配置中的用户配置：预约配置在 reserveUrl 下，签到配置为顶层的对象"""
+    if kind == 'reserve':
+        return config.get('reserveUrl', {})
+    return {key: value for key, value in config.items() if isinstance(value, dict)}
+
+class ConfigView:
+    """一个用户在某个配置文件中的只读视图"""
+
+    __slots__ = ('path', 'kind', 'user_key', 'config', 'user')
+
+    def __init__(self, path, kind, user_key, config, user):
+        """
+        参数:
+            path: 配置文件路径
+            kind: checkin 或 reserve
+            user_key: 用户键名
+            config: 整个配置文件（只读）
+            user: 该用户的配置（只读），配置中没有该用户时为None
+        """
+        for name, value in zip(self.__slots__, (path, kind, user_key, config, user)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("配置视图是只读的")
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, self.kind, self.user_key, self.config, self.user))
+
+    def option(self, key, default=None):
+        """读取选项：用户配置优先，其次是文件级配置"""
+        if self.user and key in self.user:
+            return self.user[key]
+        return self.config.get(key, default)
+
 class ConfigHandler:
-    """处理配置文件读取和管理"""
-    
+    """
+    进程内共享的配置服务
+
+    每个配置文件只解析一次并缓存为只读结构，文件的修改时间或大小变化时才重新读取；
+    签到/预约模块通过 view() 取得单个用户的只读视图。
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """进程内唯一的配置服务"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
     def __init__(self, callback=None):
         self.callback = callback or (lambda msg: None)
         self.checkin_config = None
         self.reserve_config = None
         self.app_settings = None
-        
+        self._cache = {}  # 绝对路径 -> ((修改时间, 大小), 只读配置)
+        self._lock = threading.Lock()
+
     def log(self, message):
         """记录日志并通过回调通知"""
         self.callback(message)
         logging.info(message)
-        
+
+    def load(self, path):
+        """
+        读取配置文件，文件未变化时直接返回缓存
+
+        返回:
+            只读配置（FrozenDict）；文件不存在时抛出FileNotFoundError，格式错误时抛出ValueError
+        """
+        full_path = resource_path(path)
+        stat = os.stat(full_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(full_path)
+            if cached and cached[0] == version:
+                return cached[1]
+            with open(full_path, 'r', encoding='utf-8') as f:
+                config = freeze(json.load(f))
+            self._cache[full_path] = (version, config)
+            if cached:
+                logging.info(f"配置文件已修改，重新加载: {path}")
+            return config
+
+    def invalidate(self, path=None):
+        """丢弃缓存（path为None时丢弃全部），下次读取时重新解析"""
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(resource_path(path), None)
+
+    def view(self, kind, user_key, path=None):
+        """
+        获取用户的只读配置视图
+
+        参数:
+            kind: checkin 或 reserve
+            user_key: 用户键名
+            path: 配置文件路径，默认按kind选择
+        """
+        path = path or DEFAULT_PATHS[kind]
+        config = self.load(path)
+        user = user_sections(kind, config).get(user_key)
+        return ConfigView(path, kind, user_key, config, user if isinstance(user, dict) else None)
+
+    def users(self, kind, path=None):
+        """配置文件中的所有用户键名"""
+        return list(user_sections(kind, self.load(path or DEFAULT_PATHS[kind])))
+
     def load_checkin_config(self, path='checkinConfig.json'):
         """加载签到配置文件"""
         try:
-            config_path = resource_path(path)
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    self.checkin_config = json.load(f)
-                self.log(f"成功加载签到配置文件: {path}")
-                return self.checkin_config
-            else:
-                self.log(f"⚠️ 签到配置文件未找到: {path}")
-                return None
+            self.checkin_config = self.load(path)
+            self.log(f"成功加载签到配置文件: {path}")
+            return self.checkin_config
+        except FileNotFoundError:
+            self.log(f"⚠️ 签到配置文件未找到: {path}")
+            return None
         except Exception as e:
             self.log(f"加载签到配置文件失败: {e}")
             return None
-            
+
     def load_reserve_config(self, path='reserveConfig.json'):
         """加载预约配置文件"""
         try:
-            config_path = resource_path(path)
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    self.reserve_config = json.load(f)
-                self.log(f"成功加载预约配置文件: {path}")
-                return self.reserve_config
-            else:
-                self.log(f"⚠️ 预约配置文件未找到: {path}")
-                return None
+            self.reserve_config = self.load(path)
+            self.log(f"成功加载预约配置文件: {path}")
+            return self.reserve_config
+        except FileNotFoundError:
+            self.log(f"⚠️ 预约配置文件未找到: {path}")
+            return None
         except Exception as e:
             self.log(f"加载预约配置文件失败: {e}")
             return None
-            
+
     def load_app_settings(self, path='app_settings.json'):
         """加载应用设置文件"""
         try:
@@ -72,7 +195,7 @@ class ConfigHandler:
                 'user_last_used': {}
             }
             return self.app_settings
-            
+
     def save_app_settings(self, settings, path='app_settings.json'):
         """保存应用设置"""
         try:
@@ -84,22 +207,13 @@ class ConfigHandler:
         except Exception as e:
             self.log(f"保存设置失败: {e}")
             return False
-            
+
     def get_user_config(self, config_type, user_key):
         """获取特定用户的配置"""
         try:
-            if config_type == 'checkin':
-                if not self.checkin_config:
-                    self.load_checkin_config()
-                if self.checkin_config and user_key in self.checkin_config:
-                    return self.checkin_config[user_key]
-            elif config_type == 'reserve':
-                if not self.reserve_config:
-                    self.load_reserve_config()
-                if self.reserve_config and 'reserveUrl' in self.reserve_config:
-                    if user_key in self.reserve_config['reserveUrl']:
-                        return self.reserve_config['reserveUrl'][user_key]
-            
+            user = self.view(config_type, user_key).user
+            if user is not None:
+                return user
             self.log(f"未找到用户 {user_key} 的 {config_type} 配置")
             return None
         except Exception as e:
@@ -0,0 +1,550 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import logging
+
+from checkin import LibraryCheckin
+from reserve import LibraryReserve
+from driver_pool import DriverPool
+from session_store import SessionStore
+from sniper import ReleaseSniper, parse_release_time
+from checkin_scheduler import CheckinTimeline, CheckinScheduler, has_checkin_user
+from seat_coordinator import SeatClaimTable, plan_slots, slot_key
+from reservation_plan import slot_table_for, target_date_str
+from config_handler import ConfigHandler, FrozenDict
+from logger import setup_logging
+from tracing import setup_tracing
+from events import log_events
+from utils import resource_path
+
+# 任务类型
+JOB_TYPES = ('checkin', 'reserve')
+
+# 错过执行时刻后仍允许补跑的时间（秒），避免重启后执行很久以前的任务
+MISFIRE_GRACE = 600
+
+# 定时预约在放号前开始登录的额外准备时间（秒，另加 release_lead_seconds）
+PREPARE_SECONDS = 120
+
+def safe_file_key(user_key):
+    """把用户键名转换为可用作文件名的字符串"""
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(user_key))
+
+def atomic_write_json(path, data):
+    """先写临时文件再替换，避免进程中断时留下半个文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load_json(path, default=None):
+    """读取JSON文件，不存在或损坏时返回default"""
+    try:
+        with open(resource_path(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        if os.path.exists(resource_path(path)):
+            logging.warning(f"读取{path}失败: {e}")
+        return default
+
+def load_config(path):
+    """通过共享的配置服务读取配置文件（文件未修改时不重新解析），不存在或损坏时返回空配置"""
+    try:
+        return ConfigHandler.shared().load(path)
+    except Exception as e:
+        if os.path.exists(resource_path(path)):
+            logging.warning(f"读取{path}失败: {e}")
+        return FrozenDict()
+
+class JobTable:
+    """
+    持久化的任务表（jobs.json）
+
+    每个任务:
+        {
+            "id": "任务ID",
+            "type": "checkin" | "reserve",
+            "user": "用户键名",
+            "at": "HH:MM:SS",              // 每天开始执行的时刻
+            "release_time": "HH:MM:SS",    // 仅定时预约：放号时刻，开始时刻按放号时间提前计算
+            "slots": [1, 2],               // 仅预约：要预约的时间段，缺省为全部
+            "enabled": true,
+            "last_run": "YYYY-MM-DD",
+            "last_result": "success" | "failed" | "error"
+        }
+    """
+
+    def __init__(self, path='jobs.json'):
+        self.path = resource_path(path)
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.load()
+
+    def load(self):
+        """从文件读取任务表"""
+        data = load_json(self.path, {'jobs': []})
+        self.jobs = data.get('jobs', []) if isinstance(data, dict) else []
+        return self.jobs
+
+    def save(self):
+        """保存任务表"""
+        with self.lock:
+            atomic_write_json(self.path, {'jobs': self.jobs})
+
+    def get(self, job_id):
+        for job in self.jobs:
+            if job['id'] == job_id:
+                return job
+        return None
+
+    def add(self, job_type, user, at=None, release_time=None, slots=None):
+        """
+        添加任务
+
+        参数:
+            job_type: checkin 或 reserve
+            user: 用户键名
+            at: 每天开始执行的时刻（HH:MM:SS）
+            release_time: 定时预约的放号时刻（HH:MM:SS），提供时按放号时间自动计算开始时刻
+            slots: 预约的时间段列表
+
+        返回:
+            新任务
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"未知的任务类型: {job_type}")
+        if not at and not release_time:
+            raise ValueError("需要指定执行时刻或放号时刻")
+        job = {
+            'id': uuid.uuid4().hex[:8],
+            'type': job_type,
+            'user': user,
+            'enabled': True,
+            'last_run': None,
+            'last_result': None,
+        }
+        if at:
+            job['at'] = at
+        if release_time:
+            job['release_time'] = release_time
+        if slots:
+            job['slots'] = list(slots)
+        self.jobs.append(job)
+        self.save()
+        return job
+
+    def remove(self, job_id):
+        """删除任务，返回是否存在该任务"""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        self.jobs.remove(job)
+        self.save()
+        return True
+
+    def mark(self, job, result, now=None):
+        """记录任务的执行日期和结果"""
+        now = now or datetime.datetime.now()
+        job['last_run'] = now.date().isoformat()
+        job['last_result'] = result
+        self.save()
+
+    def seed(self, checkin_config, reserve_config):
+        """
+        任务表为空时，为配置中的每个用户生成默认任务
+
+        - 预约配置有 release_time（顶层或用户配置）的用户：定时预约任务
+        - 签到用户配置中有 checkin_time 的用户：每日签到任务
+
+        返回:
+            新增的任务数
+        """
+        if self.jobs:
+            return 0
+        added = 0
+        reserve_config = reserve_config or {}
+        for user, user_config in reserve_config.get('reserveUrl', {}).items():
+            release_time = user_config.get('release_time', reserve_config.get('release_time'))
+            if release_time:
+                self.add('reserve', user, release_time=release_time)
+                added += 1
+        for user, user_config in (checkin_config or {}).items():
+            if isinstance(user_config, dict) and user_config.get('checkin_time'):
+                self.add('checkin', user, at=user_config['checkin_time'])
+                added += 1
+        return added
+
+class MfaBroker:
+    """
+    基于文件的多因子验证码交换
+
+    需要验证码时写入 mfa/<用户>.request，守护进程轮询 mfa/<用户>.code，
+    可以手动写入该文件，或运行 python daemon.py mfa <用户> <验证码>
+    """
+
+    def __init__(self, directory='mfa', poll_interval=0.5):
+        self.directory = resource_path(directory)
+        self.poll_interval = poll_interval
+
+    def _path(self, user_key, suffix):
+        return os.path.join(self.directory, f"{safe_file_key(user_key)}.{suffix}")
+
+    def request(self, user_key, timeout=300, should_stop=None):
+        """
+        请求验证码并等待提交
+
+        参数:
+            user_key: 用户键名
+            timeout: 最长等待时间（秒）
+            should_stop: 返回True时提前放弃等待的函数
+
+        返回:
+            str: 验证码，超时返回None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        code_path = self._path(user_key, 'code')
+        request_path = self._path(user_key, 'request')
+        if os.path.exists(code_path):
+            os.remove(code_path)  # 丢弃上一次遗留的验证码
+        atomic_write_json(request_path, {'user': user_key, 'requested_at': time.time()})
+        logging.warning(f"用户 {user_key} 需要多因子验证码: 写入 {code_path} "
+                        f"或运行 python daemon.py mfa {user_key} <验证码>")
+
+        deadline = time.time() + timeout
+        try:
+            while time.time() < deadline:
+                if should_stop and should_stop():
+                    return None
+                if os.path.exists(code_path):
+                    with open(code_path, 'r', encoding='utf-8') as f:
+                        code = f.read().strip()
+                    os.remove(code_path)
+                    if code:
+                        return code
+                time.sleep(self.poll_interval)
+            logging.error(f"等待用户 {user_key} 的验证码超时")
+            return None
+        finally:
+            if os.path.exists(request_path):
+                os.remove(request_path)
+
+    def submit(self, user_key, code):
+        """提交验证码"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(user_key, 'code')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(code.strip())
+        os.replace(tmp_path, path)
+
+    def pending(self):
+        """正在等待验证码的用户列表"""
+        if not os.path.isdir(self.directory):
+            return []
+        users = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.request'):
+                data = load_json(os.path.join(self.directory, name), {})
+                users.append(data.get('user', name[:-len('.request')]))
+        return users
+
+class AutomationDaemon:
+    """按任务表执行签到和预约的无界面守护进程，所有任务共用浏览器池和会话缓存"""
+
+    def __init__(self, job_table, driver_pool, session_store=None, mfa_broker=None,
+                 checkin_config_path='checkinConfig.json', reserve_config_path='reserveConfig.json',
+                 headless=True, poll_interval=1.0, mfa_timeout=300, checkin_timeline=None):
+        """
+        初始化守护进程
+
+        参数:
+            job_table: JobTable任务表
+            driver_pool: 共享的DriverPool
+            session_store: 共享的会话缓存
+            mfa_broker: 验证码交换
+            headless: 是否以无头模式运行浏览器
+            poll_interval: 检查到期任务的间隔（秒）
+            mfa_timeout: 等待验证码的最长时间（秒）
+            checkin_timeline: 签到时间表，预约成功的时间段会自动定时签到
+        """
+        self.job_table = job_table
+        self.driver_pool = driver_pool
+        self.session_store = session_store or SessionStore()
+        self.mfa_broker = mfa_broker or MfaBroker()
+        self.checkin_config_path = checkin_config_path
+        self.reserve_config_path = reserve_config_path
+        self.headless = headless
+        self.poll_interval = poll_interval
+        self.mfa_timeout = mfa_timeout
+
+        self.running = {}  # 用户 -> 正在执行的任务线程（同一用户的任务不并发）
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+        # 按预约结果定时签到
+        self.checkin_timeline = checkin_timeline or CheckinTimeline()
+        self.checkin_scheduler = CheckinScheduler(
+            self.checkin_timeline, driver_pool=driver_pool, session_store=self.session_store,
+            config_path=checkin_config_path, callback=logging.info, headless=headless,
+            mfa_provider=lambda user_key: self.mfa_broker.request(user_key, self.mfa_timeout, self.stopping.is_set)
+        )
+
+    def start_time(self, job, day):
+        """任务在指定日期的开始时刻"""
+        if job.get('release_time'):
+            release = parse_release_time(job['release_time'], now=datetime.datetime.combine(day, datetime.time.min))
+            lead = load_config(self.reserve_config_path).get('release_lead_seconds', 60)
+            return release - datetime.timedelta(seconds=lead + PREPARE_SECONDS)
+        parts = [int(p) for p in job['at'].split(':')]
+        while len(parts) < 3:
+            parts.append(0)
+        return datetime.datetime.combine(day, datetime.time(*parts))
+
+    def due_jobs(self, now=None):
+        """当前需要执行的任务"""
+        now = now or datetime.datetime.now()
+        today = now.date().isoformat()
+        due = []
+        for job in self.job_table.jobs:
+            if not job.get('enabled', True) or job.get('last_run') == today:
+                continue
+            start = self.start_time(job, now.date())
+            if start <= now <= start + datetime.timedelta(seconds=MISFIRE_GRACE):
+                due.append(job)
+        return due
+
+    def make_callback(self, job):
+        prefix = f"[{job['type']}:{job['user']}:{job['id']}]"
+        return lambda message: logging.info(f"{prefix} {message}")
+
+    def create_handler(self, job, callback):
+        """创建任务对应的签到或预约实例"""
+        configs = ConfigHandler.shared()
+        if job['type'] == 'checkin':
+            return LibraryCheckin(
+                config_view=configs.view('checkin', job['user'], self.checkin_config_path), callback=callback,
+                headless=self.headless, driver_pool=self.driver_pool, session_store=self.session_store
+            )
+
+        reserver = LibraryReserve(
+            config_view=configs.view('reserve', job['user'], self.reserve_config_path), callback=callback,
+            headless=self.headless, driver_pool=self.driver_pool, session_store=self.session_store
+        )
+        if job.get('release_time'):
+            # 补跑时放号时刻可能刚过去，仍按当天的放号时刻处理
+            release_at = parse_release_time(
+                job['release_time'], now=datetime.datetime.now() - datetime.timedelta(seconds=MISFIRE_GRACE))
+            lead_seconds = reserver.config.get('release_lead_seconds', 60)
+            return ReleaseSniper(reserver, release_at, slot_indices=job.get('slots'), lead_seconds=lead_seconds)
+        reserver.slot_indices = job.get('slots')
+        return reserver
+
+    def run_job(self, job):
+        """
+        执行单个任务（需要验证码时通过MfaBroker等待）
+
+        返回:
+            str: success / failed / error
+        """
+        callback = self.make_callback(job)
+        handler = None
+        try:
+            callback("开始执行任务")
+            handler = self.create_handler(job, callback)
+            result = handler.run()
+
+            if result == "MFA_REQUIRED":
+                code = self.mfa_broker.request(job['user'], self.mfa_timeout, self.stopping.is_set)
+                result = handler.continue_with_verification(code) if code else False
+
+            status = 'success' if result else 'failed'
+            if job['type'] == 'reserve' and result:
+                if not has_checkin_user(job['user'], self.checkin_config_path):
+                    callback(f"⚠️ 签到配置中没有用户 {job['user']}，预约的时段将无法自动签到"
+                             f"（签到配置需使用与预约配置相同的用户键名）")
+                added = self.checkin_timeline.record_reservations(job['user'], handler)
+                if added:
+                    callback(f"已加入{added}个时段的定时签到")
+                    self.checkin_scheduler.schedule(job['user'])
+        except Exception as e:
+            logging.error(f"任务 {job['id']} 执行出错: {e}")
+            status = 'error'
+        finally:
+            if handler is not None:
+                try:
+                    handler.close()
+                except Exception:
+                    pass
+
+        callback(f"任务结束: {status}")
+        self.job_table.mark(job, status)
+        return status
+
+    def dispatch(self, job):
+        """在后台线程中执行任务"""
+        def worker():
+            try:
+                self.run_job(job)
+            finally:
+                with self.lock:
+                    self.running.pop(job['user'], None)
+
+        thread = threading.Thread(target=worker, name=f"job-{job['id']}", daemon=True)
+        with self.lock:
+            self.running[job['user']] = thread
+        thread.start()
+        return thread
+
+    def plan_seats(self, jobs):
+        """同时开始的多个预约任务先分配互不冲突的座位"""
+        users = []
+        for job in jobs:
+            if job['type'] == 'reserve' and job['user'] not in users:
+                users.append(job['user'])
+        reserve_config = load_config(self.reserve_config_path)
+        if len(users) < 2 or reserve_config.get('seat_coordination') is False:
+            return
+        date_str = target_date_str(2)
+        all_slots = [index for index, start, end in slot_table_for(reserve_config)]
+        slots = sorted({i for job in jobs if job['type'] == 'reserve' for i in (job.get('slots') or all_slots)})
+        try:
+            plan_slots(SeatClaimTable(), reserve_config, users, [slot_key(date_str, i) for i in slots])
+            logging.info(f"已为{len(users)}个用户分配座位")
+        except Exception as e:
+            logging.warning(f"分配座位失败: {e}")
+
+    def tick(self, now=None):
+        """检查一次到期任务并启动，返回启动的任务列表"""
+        started = []
+        for job in self.due_jobs(now):
+            with self.lock:
+                busy = job['user'] in self.running
+            if not busy:
+                started.append(job)
+        self.plan_seats(started)
+        for job in started:
+            self.dispatch(job)
+        return started
+
+    def run_forever(self):
+        """主循环，直到收到停止信号"""
+        logging.info(f"守护进程已启动，共{len(self.job_table.jobs)}个任务")
+        self.checkin_timeline.prune()
+        self.checkin_scheduler.schedule()
+        try:
+            while not self.stopping.is_set():
+                self.tick()
+                self.stopping.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            logging.info("收到中断信号，正在停止...")
+        finally:
+            self.stop()
+
+    def stop(self, timeout=30):
+        """停止守护进程，等待正在执行的任务结束并关闭浏览器池"""
+        self.stopping.set()
+        self.checkin_scheduler.stop()
+        with self.lock:
+            threads = list(self.running.values())
+        for thread in threads:
+            thread.join(timeout)
+        logging.info(self.driver_pool.metrics_summary())
+        self.driver_pool.shutdown()
+
+def print_jobs(job_table):
+    if not job_table.jobs:
+        print("任务表为空")
+        return
+    for job in job_table.jobs:
+        when = f"放号 {job['release_time']}" if job.get('release_time') else job.get('at')
+        slots = f" 时段{job['slots']}" if job.get('slots') else ''
+        state = '' if job.get('enabled', True) else ' (已停用)'
+        print(f"{job['id']}  {job['type']:<8} {job['user']:<10} {when}{slots}  "
+              f"上次: {job.get('last_run') or '-'} {job.get('last_result') or ''}{state}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="图书馆签到/预约无界面守护进程")
+    parser.add_argument('--jobs', default='jobs.json', help="任务表文件")
+    parser.add_argument('--checkin-config', default='checkinConfig.json', help="签到配置文件")
+    parser.add_argument('--reserve-config', default='reserveConfig.json', help="预约配置文件")
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help="运行守护进程（默认）")
+    run_parser.add_argument('--pool-size', type=int, default=1, help="浏览器池大小")
+    run_parser.add_argument('--show-browser', action='store_true', help="显示浏览器窗口（默认无头）")
+    run_parser.add_argument('--mfa-timeout', type=int, default=300, help="等待验证码的秒数")
+    run_parser.add_argument('--trace', help="退出时把各步骤耗时导出为Chrome trace文件")
+
+    subparsers.add_parser('list', help="列出任务")
+
+    add_parser = subparsers.add_parser('add', help="添加任务")
+    add_parser.add_argument('type', choices=JOB_TYPES)
+    add_parser.add_argument('user')
+    add_parser.add_argument('--at', help="每天开始执行的时刻 HH:MM:SS")
+    add_parser.add_argument('--release-time', help="定时预约的放号时刻 HH:MM:SS")
+    add_parser.add_argument('--slots', type=int, nargs='+', help="预约的时间段编号，默认为时间段表中的全部时段")
+
+    remove_parser = subparsers.add_parser('remove', help="删除任务")
+    remove_parser.add_argument('job_id')
+
+    mfa_parser = subparsers.add_parser('mfa', help="提交多因子验证码")
+    mfa_parser.add_argument('user', nargs='?')
+    mfa_parser.add_argument('code', nargs='?')
+
+    args = parser.parse_args(argv)
+    command = args.command or 'run'
+    job_table = JobTable(args.jobs)
+
+    if command == 'list':
+        print_jobs(job_table)
+        return 0
+    if command == 'add':
+        try:
+            job = job_table.add(args.type, args.user, args.at, args.release_time, args.slots)
+        except ValueError as e:
+            print(f"错误: {e}")
+            return 1
+        print(f"已添加任务 {job['id']}")
+        return 0
+    if command == 'remove':
+        if not job_table.remove(args.job_id):
+            print(f"未找到任务 {args.job_id}")
+            return 1
+        print(f"已删除任务 {args.job_id}")
+        return 0
+    if command == 'mfa':
+        broker = MfaBroker()
+        if not args.user or not args.code:
+            pending = broker.pending()
+            print("等待验证码的用户: " + (", ".join(pending) if pending else "无"))
+            return 0
+        broker.submit(args.user, args.code)
+        print(f"已提交用户 {args.user} 的验证码")
+        return 0
+
+    setup_logging("library_automation.log")
+    setup_tracing(getattr(args, 'trace', None))
+    log_events()
+    if job_table.seed(load_config(args.checkin_config), load_config(args.reserve_config)):
+        logging.info(f"已根据配置生成默认任务: {job_table.path}")
+
+    headless = not getattr(args, 'show_browser', False)
+    pool = DriverPool(size=getattr(args, 'pool_size', 1), headless=headless)
+    pool.warm()
+    daemon = AutomationDaemon(
+        job_table, pool,
+        checkin_config_path=args.checkin_config,
+        reserve_config_path=args.reserve_config,
+        headless=headless,
+        mfa_timeout=getattr(args, 'mfa_timeout', 300)
+    )
+    daemon.run_forever()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import threading
+import time
+import logging
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+try:
+    import psutil
+except ImportError:  # 未安装psutil时不做内存检查
+    psutil = None
+
+def create_driver(headless=False):
+    """创建新的Chrome WebDriver实例"""
+    options = Options()
+
+    if headless:
+        options.add_argument("--headless")
+
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    # 并行预约和座位监视依赖后台标签页中的页面脚本，不限制后台标签页的定时器
+    options.add_argument("--disable-background-timer-throttling")
+    options.add_argument("--disable-backgrounding-occluded-windows")
+    options.add_argument("--disable-renderer-backgrounding")
+    return webdriver.Chrome(options=options)
+
+class DriverPool:
+    """预先启动的WebDriver池，避免每次操作都冷启动浏览器"""
+
+    def __init__(self, size=1, headless=False, max_uses=20, max_memory_mb=800):
+        """
+        初始化WebDriver池
+
+        参数:
+            size: 保持预热的空闲浏览器数量
+            headless: 默认是否以无头模式启动
+            max_uses: 单个浏览器最多使用次数，超过后重启
+            max_memory_mb: 浏览器进程内存上限（MB），超过后重启（需要psutil）
+        """
+        self.size = size
+        self.headless = headless
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+
+        self.lock = threading.Lock()
+        self.idle = []      # 空闲浏览器记录列表
+        self.in_use = {}    # id(driver) -> 浏览器记录
+        self.closed = False
+        self.warming = False
+
+        self.metrics = {
+            'launches': 0,
+            'launch_times': [],
+            'acquires': 0,
+            'reuses': 0,
+            'recycled': 0,
+        }
+
+    def _launch(self, headless):
+        """启动一个新浏览器并记录启动耗时"""
+        start = time.perf_counter()
+        driver = create_driver(headless)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.metrics['launches'] += 1
+            self.metrics['launch_times'].append(elapsed)
+        logging.info(f"浏览器启动耗时 {elapsed * 1000:.0f} ms")
+        return {'driver': driver, 'headless': headless, 'uses': 0}
+
+    def warm(self):
+        """在后台线程中补足空闲浏览器"""
+        with self.lock:
+            if self.closed or self.warming:
+                return
+            self.warming = True
+
+        def fill():
+            try:
+                while True:
+                    with self.lock:
+                        headless = self.headless
+                        missing = self.size - sum(1 for e in self.idle if e['headless'] == headless)
+                        if self.closed or missing <= 0:
+                            return
+                    try:
+                        entry = self._launch(headless)
+                    except Exception as e:
+                        logging.error(f"预热浏览器失败: {e}")
+                        return
+                    with self.lock:
+                        if self.closed or entry['headless'] != self.headless:
+                            self._quit(entry)
+                        else:
+                            self.idle.append(entry)
+            finally:
+                with self.lock:
+                    self.warming = False
+
+        thread = threading.Thread(target=fill)
+        thread.daemon = True
+        thread.start()
+
+    def acquire(self, headless=None):
+        """
+        获取一个干净的浏览器
+
+        参数:
+            headless: 是否需要无头模式，为None时使用池的默认设置
+
+        返回:
+            WebDriver实例
+        """
+        if headless is None:
+            headless = self.headless
+
+        entry = None
+        with self.lock:
+            for i, candidate in enumerate(self.idle):
+                if candidate['headless'] == headless:
+                    entry = self.idle.pop(i)
+                    break
+
+        if entry is None:
+            entry = self._launch(headless)
+        elif entry['uses'] > 0:
+            with self.lock:
+                self.metrics['reuses'] += 1
+
+        with self.lock:
+            self.metrics['acquires'] += 1
+            self.in_use[id(entry['driver'])] = entry
+
+        # 补充被取走的空闲浏览器
+        self.warm()
+        return entry['driver']
+
+    def release(self, driver):
+        """归还浏览器，清理状态后放回池中或直接重启"""
+        with self.lock:
+            entry = self.in_use.pop(id(driver), None)
+        if entry is None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            return
+
+        entry['uses'] += 1
+        reason = None
+        if self.closed:
+            reason = "浏览器池已关闭"
+        elif entry['uses'] >= self.max_uses:
+            reason = f"已使用{entry['uses']}次"
+        else:
+            memory_mb = self._memory_mb(driver)
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                reason = f"内存占用{memory_mb:.0f}MB"
+            elif not self._reset(driver):
+                reason = "清理浏览器状态失败"
+
+        with self.lock:
+            keep = reason is None and entry['headless'] == self.headless and len(self.idle) < self.size
+            if keep:
+                self.idle.append(entry)
+
+        if not keep:
+            if reason:
+                logging.info(f"重启浏览器: {reason}")
+                with self.lock:
+                    self.metrics['recycled'] += 1
+            self._quit(entry)
+            self.warm()
+
+    def _reset(self, driver):
+        """清理Cookie、存储和多余标签页，只保留一个空白页"""
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            try:
+                driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+            except Exception:
+                pass
+            try:
+                driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            except Exception:
+                driver.delete_all_cookies()
+            driver.get("about:blank")
+            return True
+        except Exception as e:
+            logging.warning(f"清理浏览器状态失败: {e}")
+            return False
+
+    def _memory_mb(self, driver):
+        """统计浏览器进程树占用的内存（MB），无法统计时返回None"""
+        if psutil is None:
+            return None
+        try:
+            process = psutil.Process(driver.service.process.pid)
+            total = sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+            return total / (1024 * 1024)
+        except Exception:
+            return None
+
+    def _quit(self, entry):
+        try:
+            entry['driver'].quit()
+        except Exception:
+            pass
+
+    def set_headless(self, headless):
+        """切换默认模式，丢弃另一种模式的空闲浏览器并重新预热"""
+        with self.lock:
+            self.headless = headless
+            stale = [e for e in self.idle if e['headless'] != headless]
+            self.idle = [e for e in self.idle if e['headless'] == headless]
+        for entry in stale:
+            self._quit(entry)
+        self.warm()
+
+    def get_metrics(self):
+        """获取启动耗时和复用次数统计"""
+        with self.lock:
+            launch_times = list(self.metrics['launch_times'])
+            return {
+                'launches': self.metrics['launches'],
+                'avg_launch_ms': sum(launch_times) / len(launch_times) * 1000 if launch_times else 0,
+                'max_launch_ms': max(launch_times) * 1000 if launch_times else 0,
+                'acquires': self.metrics['acquires'],
+                'reuses': self.metrics['reuses'],
+                'recycled': self.metrics['recycled'],
+                'idle': len(self.idle),
+                'in_use': len(self.in_use),
+            }
+
+    def metrics_summary(self):
+        """生成可读的统计信息"""
+        m = self.get_metrics()
+        return (f"浏览器池: 启动{m['launches']}次(平均{m['avg_launch_ms']:.0f}ms), "
+                f"获取{m['acquires']}次, 复用{m['reuses']}次, 重启{m['recycled']}次")
+
+    def shutdown(self):
+        """关闭池中所有浏览器"""
+        with self.lock:
+            self.closed = True
+            entries = self.idle + list(self.in_use.values())
+            self.idle = []
+            self.in_use = {}
+        for entry in entries:
+            self._quit(entry)
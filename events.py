@@ -0,0 +1,78 @@
+import threading
+import time
+import logging
+from collections import namedtuple
+
+# 流程步骤（与界面上的步骤一一对应）
+LOGIN, MFA, OPERATION, FINISH = 'login', 'mfa', 'operation', 'finish'
+STEPS = (LOGIN, MFA, OPERATION, FINISH)
+
+# 步骤状态
+ACTIVE, COMPLETED, ERROR = 'active', 'completed', 'error'
+
+# step: 步骤；status: 状态；user: 用户键名；slot: 时间段索引（整个步骤的事件为None）；
+# payload: 附加数据；time: 发生时刻（time.time()）
+Event = namedtuple('Event', ('step', 'status', 'user', 'slot', 'payload', 'time'))
+
+class EventBus:
+    """
+    进程内的步骤事件总线
+
+    订阅者按步骤登记，发布时直接取出该步骤和“所有步骤”的订阅者调用，不解析消息文本。
+    订阅者在发布事件的线程中被调用，需要更新界面的订阅者应自行转到界面线程。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # 步骤（None表示所有步骤） -> 订阅者元组
+
+    def subscribe(self, handler, step=None):
+        """
+        订阅事件
+
+        参数:
+            handler: 接收Event的函数
+            step: 只接收该步骤的事件，None表示所有步骤
+
+        返回:
+            取消订阅的函数
+        """
+        with self._lock:
+            self._subscribers[step] = self._subscribers.get(step, ()) + (handler,)
+        return lambda: self.unsubscribe(handler, step)
+
+    def unsubscribe(self, handler, step=None):
+        with self._lock:
+            handlers = tuple(h for h in self._subscribers.get(step, ()) if h is not handler)
+            if handlers:
+                self._subscribers[step] = handlers
+            else:
+                self._subscribers.pop(step, None)
+
+    def publish(self, event):
+        """把事件发给订阅者（订阅者出错不影响其他订阅者和发布方）"""
+        subscribers = self._subscribers
+        for handler in subscribers.get(event.step, ()) + subscribers.get(None, ()):
+            try:
+                handler(event)
+            except Exception as e:
+                logging.error(f"处理事件 {event.step}/{event.status} 时出错: {e}")
+
+    def emit(self, step, status, user=None, slot=None, **payload):
+        """构造并发布事件"""
+        event = Event(step, status, user, slot, payload, time.time())
+        self.publish(event)
+        return event
+
+# 未指定事件总线的模块使用的默认总线（守护进程等无界面的场景）
+default_bus = EventBus()
+
+def log_event(event):
+    """把事件写入日志"""
+    target = f"{event.user or '-'}" + (f" 第{event.slot}个时段" if event.slot is not None else "")
+    detail = f" {event.payload}" if event.payload else ""
+    logging.info(f"[事件] {target} {event.step} -> {event.status}{detail}")
+
+def log_events(bus=None):
+    """让日志文件订阅事件总线，返回取消订阅的函数"""
+    return (bus or default_bus).subscribe(log_event)
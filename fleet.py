@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import logging
+import multiprocessing
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import tracing
+from config_handler import ConfigHandler
+
+try:
+    import psutil
+except ImportError:  # 未安装psutil时只按CPU核数限制进程数
+    psutil = None
+
+# 估算的单个浏览器内存占用（MB），用于限制进程数
+BROWSER_MEMORY_MB = 800
+
+# 每个用户结果中保留的最后几条日志
+REPORT_MESSAGES = 20
+
+OPERATIONS = ('reserve', 'checkin')
+
+def default_worker_count(browser_memory_mb=BROWSER_MEMORY_MB):
+    """按CPU核数和可用内存估算可同时运行的浏览器数量"""
+    workers = os.cpu_count() or 1
+    if psutil is not None:
+        available_mb = psutil.virtual_memory().available / (1024 * 1024)
+        workers = min(workers, int(available_mb // browser_memory_mb))
+    return max(1, workers)
+
+def configured_users(operation, config_path):
+    """配置文件中的所有用户"""
+    return ConfigHandler.shared().users(operation, config_path)
+
+# ---- 工作进程 ----
+
+# 每个工作进程一个浏览器池（大小为1），在该进程处理的所有用户之间复用
+_worker = {}
+
+def _init_worker(mfa_requests, mfa_codes, headless, trace=False, log_queue=None):
+    """工作进程初始化：日志转发到主进程，保存验证码队列并创建浏览器池"""
+    from driver_pool import DriverPool
+    from logger import forward_logging
+
+    if log_queue is not None:
+        forward_logging(log_queue)
+    else:
+        logging.basicConfig(level=logging.INFO, force=True,
+                            format='%(asctime)s - %(processName)s - %(levelname)s: %(message)s')
+    pool = DriverPool(size=1, headless=headless)
+    _worker.update(pool=pool, mfa_requests=mfa_requests, mfa_codes=mfa_codes, headless=headless, trace=trace)
+    # 进程退出时关闭浏览器（工作进程不会执行atexit）
+    Finalize(pool, pool.shutdown, exitpriority=10)
+
+def _request_mfa_code(user_key, operation, timeout):
+    """把验证码请求发给主进程的操作员队列，并等待回复"""
+    _worker['mfa_requests'].put({'user': user_key, 'operation': operation, 'pid': os.getpid()})
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        code = _worker['mfa_codes'].pop(user_key, None)
+        if code is not None:
+            return code or None
+        time.sleep(0.5)
+    return None
+
+def run_user(operation, user_key, config_path, mfa_timeout=300, slot_indices=None):
+    """
+    在工作进程中为单个用户执行签到或预约
+
+    返回:
+        dict: 用户的执行结果（可序列化）
+    """
+    from checkin import LibraryCheckin
+    from reserve import LibraryReserve
+    from checkin_scheduler import reservation_entries
+
+    messages = []
+    def callback(message):
+        messages.append(message)
+        logging.info(f"[{user_key}] {message}")
+
+    start = time.perf_counter()
+    report = {'user': user_key, 'operation': operation, 'success': False,
+              'status': 'failed', 'slots': [], 'error': None}
+    handler = None
+    try:
+        handler_class = LibraryReserve if operation == 'reserve' else LibraryCheckin
+        # 每个工作进程只解析一次配置文件，之后该进程处理的用户都使用缓存
+        config_view = ConfigHandler.shared().view(operation, user_key, config_path)
+        handler = handler_class(config_view=config_view, callback=callback,
+                                headless=_worker['headless'], driver_pool=_worker['pool'])
+        if operation == 'reserve':
+            handler.slot_indices = slot_indices
+
+        result = handler.run()
+        if result == "MFA_REQUIRED":
+            code = _request_mfa_code(user_key, operation, mfa_timeout)
+            result = handler.continue_with_verification(code) if code else False
+            if not code:
+                report['error'] = "未获得验证码"
+
+        report['success'] = bool(result)
+        report['status'] = 'success' if result else 'failed'
+        if operation == 'reserve':
+            report['slots'] = handler.reserved_slots()
+            report['checkins'] = reservation_entries(handler)
+    except Exception as e:
+        report['status'] = 'error'
+        report['error'] = str(e)
+        logging.error(f"用户 {user_key} 执行出错: {e}")
+    finally:
+        if handler is not None:
+            try:
+                handler.close()
+            except Exception:
+                pass
+
+    report['duration'] = round(time.perf_counter() - start, 1)
+    report['messages'] = messages[-REPORT_MESSAGES:]
+    if _worker.get('trace'):
+        # 把该用户的跟踪记录传回主进程汇总
+        report['spans'] = tracing.drain()
+    return report
+
+# ---- 主进程 ----
+
+def console_mfa_handler(user_key, operation):
+    """在控制台向操作员询问验证码"""
+    try:
+        return input(f"请输入用户 {user_key} 的{'预约' if operation == 'reserve' else '签到'}验证码（直接回车跳过）: ").strip()
+    except EOFError:
+        return ''
+
+class FleetRunner:
+    """用进程池为多个用户同时执行签到或预约，每个进程一个浏览器"""
+
+    def __init__(self, operation, users=None, config_path=None, max_workers=None, headless=True,
+                 mfa_handler=None, mfa_timeout=300, slot_indices=None, trace=False):
+        """
+        初始化批量执行
+
+        参数:
+            operation: reserve 或 checkin
+            users: 用户键名列表，默认为配置中的所有用户
+            config_path: 配置文件路径，默认按操作选择
+            max_workers: 进程数上限，默认按CPU核数和内存估算
+            headless: 是否以无头模式运行
+            mfa_handler: 操作员回调 mfa_handler(user_key, operation) -> 验证码，默认在控制台输入
+            mfa_timeout: 工作进程等待验证码的最长时间（秒）
+            slot_indices: 预约的时间段，默认全部
+            trace: 是否收集各工作进程的跟踪记录（合并到主进程的tracing中）
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"未知的操作: {operation}")
+        self.operation = operation
+        self.config_path = config_path or ('reserveConfig.json' if operation == 'reserve' else 'checkinConfig.json')
+        self.users = list(users) if users else configured_users(operation, self.config_path)
+        self.max_workers = max(1, min(max_workers or default_worker_count(), len(self.users) or 1))
+        self.headless = headless
+        self.mfa_handler = mfa_handler or console_mfa_handler
+        self.mfa_timeout = mfa_timeout
+        self.slot_indices = slot_indices
+        self.trace = trace
+
+    def _serve_mfa(self, mfa_requests, mfa_codes, done):
+        """操作员线程：依次处理各工作进程的验证码请求"""
+        while not done.is_set():
+            try:
+                request = mfa_requests.get(timeout=0.5)
+            except Exception:
+                continue
+            try:
+                code = self.mfa_handler(request['user'], request['operation'])
+            except Exception as e:
+                logging.error(f"获取验证码失败: {e}")
+                code = ''
+            mfa_codes[request['user']] = code or ''
+
+    def plan_seats(self, days_ahead=2):
+        """预约前为所有用户分配互不冲突的座位，写入座位认领表"""
+        from seat_coordinator import SeatClaimTable, plan_slots, slot_key
+        from reservation_plan import slot_table_for, target_date_str
+
+        reserve_config = ConfigHandler.shared().load(self.config_path)
+        if reserve_config.get('seat_coordination') is False:
+            return None
+        date_str = target_date_str(days_ahead)
+        indices = self.slot_indices or [index for index, start, end in slot_table_for(reserve_config)]
+        slots = [slot_key(date_str, i) for i in indices]
+        return plan_slots(SeatClaimTable(), reserve_config, self.users, slots)
+
+    def run(self, on_result=None):
+        """
+        执行并汇总结果
+
+        参数:
+            on_result: 每个用户完成时调用的函数 on_result(report)
+
+        返回:
+            dict: {'operation', 'workers', 'duration', 'succeeded', 'failed', 'results': [...]}
+        """
+        start = time.perf_counter()
+        results = []
+        if self.operation == 'reserve' and len(self.users) > 1:
+            try:
+                self.plan_seats()
+            except Exception as e:
+                logging.warning(f"分配座位失败，各用户将按各自的偏好选座: {e}")
+        from logger import listen_forwarded
+
+        with multiprocessing.Manager() as manager:
+            mfa_requests = manager.Queue()
+            mfa_codes = manager.dict()
+            # 工作进程的日志经该队列由主进程写出
+            log_queue = manager.Queue()
+            log_listener = listen_forwarded(log_queue)
+            done = threading.Event()
+            operator = threading.Thread(target=self._serve_mfa, args=(mfa_requests, mfa_codes, done), daemon=True)
+            operator.start()
+            try:
+                with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                         initargs=(mfa_requests, mfa_codes, self.headless, self.trace,
+                                                   log_queue)) as executor:
+                    futures = {
+                        executor.submit(run_user, self.operation, user, self.config_path,
+                                        self.mfa_timeout, self.slot_indices): user
+                        for user in self.users
+                    }
+                    for future in as_completed(futures):
+                        try:
+                            report = future.result()
+                        except Exception as e:
+                            report = {'user': futures[future], 'operation': self.operation, 'success': False,
+                                      'status': 'error', 'slots': [], 'error': str(e), 'messages': []}
+                        tracing.extend(report.pop('spans', []))
+                        results.append(report)
+                        if on_result:
+                            on_result(report)
+            finally:
+                done.set()
+                operator.join(1)
+                log_listener.stop()
+
+        order = {user: i for i, user in enumerate(self.users)}
+        results.sort(key=lambda r: order.get(r['user'], len(order)))
+        succeeded = sum(1 for r in results if r['success'])
+        return {
+            'operation': self.operation,
+            'workers': self.max_workers,
+            'duration': round(time.perf_counter() - start, 1),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'results': results,
+        }
+
+def format_report(report):
+    """把汇总结果格式化为文本"""
+    lines = [f"{'预约' if report['operation'] == 'reserve' else '签到'}: "
+             f"{report['succeeded']}个用户成功，{report['failed']}个用户失败，"
+             f"{report['workers']}个进程，总耗时{report['duration']}秒"]
+    for r in report['results']:
+        detail = ''
+        if r.get('slots'):
+            detail = "  时段: " + ", ".join(f"{date} 第{slot}段" for date, slot in r['slots'])
+        if r.get('error'):
+            detail += f"  错误: {r['error']}"
+        lines.append(f"  {r['user']:<10} {r['status']:<8} {r.get('duration', 0):>6}s{detail}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多用户批量签到/预约")
+    parser.add_argument('operation', choices=OPERATIONS)
+    parser.add_argument('--users', nargs='+', help="用户键名，默认为配置中的所有用户")
+    parser.add_argument('--config', help="配置文件路径")
+    parser.add_argument('--workers', type=int, help="进程数上限（默认按CPU核数和内存估算）")
+    parser.add_argument('--slots', type=int, nargs='+', help="预约的时间段编号，默认为时间段表中的全部时段")
+    parser.add_argument('--show-browser', action='store_true', help="显示浏览器窗口（默认无头）")
+    parser.add_argument('--mfa-files', action='store_true',
+                        help="通过 mfa/ 目录交换验证码（python daemon.py mfa <用户> <验证码>），默认在控制台输入")
+    parser.add_argument('--mfa-timeout', type=int, default=300, help="等待验证码的秒数")
+    parser.add_argument('--report', help="把汇总结果保存为JSON文件")
+    parser.add_argument('--trace', help="把所有进程的各步骤耗时导出为Chrome trace文件")
+    args = parser.parse_args(argv)
+
+    from logger import setup_logging
+    setup_logging("library_automation.log")
+
+    mfa_handler = None
+    if args.mfa_files:
+        from daemon import MfaBroker
+        broker = MfaBroker()
+        mfa_handler = lambda user_key, operation: broker.request(user_key, args.mfa_timeout)
+
+    runner = FleetRunner(args.operation, users=args.users, config_path=args.config,
+                         max_workers=args.workers, headless=not args.show_browser,
+                         mfa_handler=mfa_handler, mfa_timeout=args.mfa_timeout, slot_indices=args.slots,
+                         trace=bool(args.trace))
+    print(f"共{len(runner.users)}个用户，使用{runner.max_workers}个进程")
+    report = runner.run(on_result=lambda r: print(f"{r['user']}: {r['status']}"))
+    print(format_report(report))
+    if args.trace:
+        tracing.export_chrome_trace(args.trace)
+        print(f"\n已导出跟踪记录: {args.trace}")
+        print(tracing.format_summary())
+
+    if args.operation == 'reserve':
+        # 预约成功的时段加入定时签到
+        from checkin_scheduler import CheckinTimeline, has_checkin_user
+        timeline = CheckinTimeline()
+        for r in report['results']:
+            if r.get('checkins') and not has_checkin_user(r['user']):
+                print(f"⚠️ 签到配置中没有用户 {r['user']}，预约的时段将无法自动签到（签到配置需使用与预约配置相同的用户键名）")
+            for reservation in r.get('checkins', []):
+                timeline.add(r['user'], **reservation)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report['failed'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import threading
+import time
+import logging
+
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+from utils import wait_until
+from tracing import record_span
+
+# 在页面中一次填写表单并点击提交按钮
+# 用原生value setter赋值并触发input/change事件（Vue等框架的v-model依赖input事件更新数据），
+# 赋值后值没有保留或输入框不可编辑时视为页面拒绝合成输入，不点击提交
+FILL_FORM_SCRIPT = """
+var fields = arguments[0], submit = arguments[1];
+function find(by, selector) {
+    if (by === 'id') { return document.getElementById(selector); }
+    if (by === 'xpath') {
+        return document.evaluate(selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    }
+    return document.querySelector(selector);
+}
+var elements = [], missing = [];
+for (var i = 0; i < fields.length; i++) {
+    var el = find(fields[i][0], fields[i][1]);
+    if (!el) { missing.push(fields[i][1]); }
+    elements.push(el);
+}
+var button = find(submit[0], submit[1]);
+if (!button) { missing.push(submit[1]); }
+if (missing.length) { return {missing: missing}; }
+var rejected = [];
+for (var i = 0; i < elements.length; i++) {
+    var el = elements[i], value = String(fields[i][2]);
+    if (el.disabled || el.readOnly) { rejected.push(i); continue; }
+    var proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+    el.focus();
+    Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+    el.dispatchEvent(new Event('input', {bubbles: true}));
+    el.dispatchEvent(new Event('change', {bubbles: true}));
+    el.blur();
+    if (el.value !== value) { rejected.push(i); }
+}
+// 提交可能导致页面跳转，延迟到脚本返回之后再点击
+if (!rejected.length) { setTimeout(function() { button.click(); }, 0); }
+return {missing: [], rejected: rejected, button: button};
+"""
+
+# 逐个元素填写时每个输入框的WebDriver请求数（查找、清空、输入），以及提交按钮的请求数（查找、点击）
+ROUND_TRIPS_PER_FIELD = 3
+ROUND_TRIPS_SUBMIT = 2
+
+_stats_lock = threading.Lock()
+_stats = {}  # 表单名称 -> {'macro': [次数, 总秒数], 'typed': [次数, 总秒数], 'round_trips': 逐个填写的请求数}
+_rejected = set()  # 拒绝过合成输入的表单名称（之后直接逐个填写）
+
+def _record(name, mode, seconds, round_trips):
+    """记录一次填写耗时，一次脚本填写时返回平均节省的毫秒数（在锁内计算）"""
+    with _stats_lock:
+        stats = _stats.setdefault(name, {'macro': [0, 0.0], 'typed': [0, 0.0], 'round_trips': round_trips})
+        stats[mode][0] += 1
+        stats[mode][1] += seconds
+        stats['round_trips'] = round_trips
+        return _saved_ms(stats) if mode == 'macro' else None
+
+def _saved_ms(stats):
+    """一次脚本填写相比逐个填写平均节省的毫秒数（没有逐个填写的记录时按请求数估算）"""
+    macro_count, macro_total = stats['macro']
+    if not macro_count:
+        return None
+    macro_ms = macro_total / macro_count * 1000
+    typed_count, typed_total = stats['typed']
+    if typed_count:
+        return round(typed_total / typed_count * 1000 - macro_ms, 1)
+    return round(macro_ms * (stats['round_trips'] - 1), 1)
+
+def form_stats():
+    """
+    汇总各表单的填写耗时
+
+    返回:
+        dict: 表单名称 -> {'macro_count', 'macro_ms', 'typed_count', 'typed_ms', 'round_trips', 'saved_ms'}
+              （macro_ms/typed_ms 为平均耗时，saved_ms 为一次脚本填写平均节省的时间）
+    """
+    with _stats_lock:
+        return {
+            name: {
+                'macro_count': stats['macro'][0],
+                'macro_ms': round(stats['macro'][1] / stats['macro'][0] * 1000, 1) if stats['macro'][0] else None,
+                'typed_count': stats['typed'][0],
+                'typed_ms': round(stats['typed'][1] / stats['typed'][0] * 1000, 1) if stats['typed'][0] else None,
+                'round_trips': stats['round_trips'],
+                'saved_ms': _saved_ms(stats),
+            }
+            for name, stats in _stats.items()
+        }
+
+def _type_fields(driver, fields, indices):
+    """逐个元素清空并输入"""
+    for i in indices:
+        by, selector, value = fields[i]
+        element = driver.find_element(by, selector)
+        element.clear()
+        element.send_keys(value)
+
+def fill_and_submit(driver, name, fields, submit, timeout=10, submit_timeout=15):
+    """
+    填写表单并点击提交按钮，等待旧页面被替换
+
+    优先用一次execute_script填写并提交；页面拒绝合成输入时改为逐个元素输入所有字段再点击，
+    之后该表单直接逐个填写。两种方式的耗时都会记录，可通过form_stats()查看节省的时间。
+
+    参数:
+        driver: WebDriver实例
+        name: 表单名称（用于统计和跟踪）
+        fields: [(定位方式 By.ID/By.XPATH/By.CSS_SELECTOR, 定位值, 输入值), ...]
+        submit: 提交按钮的 (定位方式, 定位值)
+        timeout: 等待表单元素出现的最长时间（秒）
+        submit_timeout: 点击后等待页面跳转的最长时间（秒）
+
+    返回:
+        bool: 页面是否在超时前发生了跳转；表单元素没有出现时抛出TimeoutException
+    """
+    fields = [tuple(field) for field in fields]
+    round_trips = ROUND_TRIPS_PER_FIELD * len(fields) + ROUND_TRIPS_SUBMIT
+    if name in _rejected:
+        mode = 'typed'
+        wait_until(driver, EC.presence_of_element_located(fields[0][:2]), timeout, name=f"form_{name}")
+        start = time.perf_counter()
+        _type_fields(driver, fields, range(len(fields)))
+        button = driver.find_element(*submit)
+        button.click()
+        elapsed = time.perf_counter() - start
+    else:
+        # 表单元素全部出现前脚本不做任何修改，出现后的第一次调用即完成填写和提交（只统计这一次调用的耗时）
+        last_call = {}
+
+        def fill(d):
+            last_call['start'] = time.perf_counter()
+            result = d.execute_script(FILL_FORM_SCRIPT, fields, list(submit))
+            last_call['elapsed'] = time.perf_counter() - last_call['start']
+            return result if not result['missing'] else None
+
+        result = wait_until(driver, fill, timeout, name=f"form_{name}")
+        button = result['button']
+        if result['rejected']:
+            mode = 'typed'
+            _rejected.add(name)
+            logging.info(f"表单{name}拒绝合成输入，改为逐个元素输入")
+            start = time.perf_counter()
+            _type_fields(driver, fields, range(len(fields)))
+            button.click()
+            elapsed = time.perf_counter() - start
+        else:
+            mode = 'macro'
+            start, elapsed = last_call['start'], last_call['elapsed']
+    saved = _record(name, mode, elapsed, round_trips)
+    record_span(f"form.{name}", start, elapsed, {'mode': mode, 'saved_ms': saved} if saved is not None else {'mode': mode})
+    if saved is not None:
+        logging.debug(f"表单{name}一次脚本填写耗时 {elapsed * 1000:.0f} ms，约节省 {saved:.0f} ms")
+
+    try:
+        wait_until(driver, EC.staleness_of(button), submit_timeout, name=f"{name}_submit")
+        return True
+    except TimeoutException:
+        return False
@@ -0,0 +1,154 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# 预约应用的默认后端地址（经webvpn转发）
+DEFAULT_APP_URL = "https://webvpn3.hebau.edu.cn/https/77726476706e69737468656265737421f5ff40902b7e60557c099ce29d51367b21a6/qljfwapp/sys/lwAppointmentPublicPlace/"
+
+# 默认接口配置，可在 reserveConfig.json 的 httpEngine 中覆盖
+DEFAULT_HTTP_CONFIG = {
+    'base_url': DEFAULT_APP_URL,
+    'seat_query_path': 'modules/seatdetail/querySeats.do',
+    'reserve_path': 'modules/seatdetail/saveAppointment.do',
+    'my_reservations_path': 'modules/myAppointment/queryMyAppointments.do',
+    'seat_id_field': 'SEAT_ID',
+    'seat_label_field': 'SEAT_NO',
+    'seat_state_field': 'STATUS',
+    # 接口状态值 -> 座位状态码（1可预约，2自己已预约，3他人已预约）
+    'state_map': {'0': 1, '1': 3, '2': 2},
+    # 我的预约列表中的字段
+    'date_field': 'APPLY_DATE',
+    'time_area_field': 'APPLY_TIME_AREA',
+    'cancelled_field': 'IS_CANCELLED',
+    'timeout': 10,
+}
+
+def find_rows(data):
+    """在金智EMAP风格的响应（datas.xxx.rows）中找到第一个记录列表"""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if isinstance(data.get('rows'), list):
+            return data['rows']
+        for value in data.values():
+            rows = find_rows(value)
+            if rows is not None:
+                return rows
+    return None
+
+def is_success_response(data):
+    """判断接口返回是否表示成功"""
+    if not isinstance(data, dict):
+        return False
+    if data.get('success') is True:
+        return True
+    return str(data.get('code')) == '0'
+
+class HttpReserveEngine:
+    """复用登录Cookie、直接调用预约后端接口的预约引擎"""
+
+    def __init__(self, cookies=None, http_config=None, callback=None, user_agent=None, pool_size=8):
+        """
+        初始化HTTP预约引擎
+
+        参数:
+            cookies: 浏览器中的登录Cookie列表（get_all_cookies的返回值）
+            http_config: 接口配置，缺省项使用DEFAULT_HTTP_CONFIG
+            callback: 回调函数，用于报告状态更新
+            user_agent: 与浏览器一致的User-Agent
+            pool_size: 连接池大小
+        """
+        self.config = dict(DEFAULT_HTTP_CONFIG)
+        self.config.update(http_config or {})
+        self.callback = callback or (lambda msg: None)
+        self.base_url = self.config['base_url'].rstrip('/') + '/'
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['X-Requested-With'] = 'XMLHttpRequest'
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+        for cookie in cookies or []:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/')
+            )
+
+    @classmethod
+    def from_auth(cls, auth, http_config=None, callback=None):
+        """从已登录的Authentication创建引擎"""
+        try:
+            user_agent = auth.driver.execute_script('return navigator.userAgent')
+        except Exception:
+            user_agent = None
+        return cls(auth.get_all_cookies(), http_config, callback, user_agent)
+
+    def _post(self, path, params):
+        response = self.session.post(self.base_url + path, data=params, timeout=self.config['timeout'])
+        response.raise_for_status()
+        return response.json()
+
+    def query_seats(self, slot_params):
+        """
+        查询时间段的座位状态
+
+        返回:
+            dict: 与座位网格快照格式一致 {'preferred': None, 'seats': [[id, 编号, 状态码], ...]}
+        """
+        data = self._post(self.config['seat_query_path'], slot_params)
+        rows = find_rows(data) or []
+        state_map = self.config['state_map']
+        seats = []
+        for row in rows:
+            state = state_map.get(str(row.get(self.config['seat_state_field'])), 0)
+            seats.append([
+                str(row.get(self.config['seat_id_field'])),
+                str(row.get(self.config['seat_label_field'], '')),
+                state,
+            ])
+        return {'preferred': None, 'seats': seats}
+
+    def reserve_seat(self, slot_params, seat_id):
+        """
+        提交座位预约
+
+        返回:
+            (是否成功, 接口返回的消息)
+        """
+        params = dict(slot_params)
+        params[self.config['seat_id_field']] = seat_id
+        data = self._post(self.config['reserve_path'], params)
+        message = ''
+        if isinstance(data, dict):
+            message = data.get('msg') or data.get('message') or ''
+        return is_success_response(data), message
+
+    def query_my_reservations(self, date_str=None):
+        """
+        一次查询自己已有的预约（已取消的除外）
+
+        参数:
+            date_str: 只查询该日期（YYYY-MM-DD），None表示全部
+
+        返回:
+            dict: (日期, 时间段 HH:MM-HH:MM) -> 座位编号（没有编号时为座位ID）
+        """
+        params = {self.config['date_field']: date_str} if date_str else {}
+        data = self._post(self.config['my_reservations_path'], params)
+        if isinstance(data, dict) and 'code' in data and not is_success_response(data):
+            raise RuntimeError(data.get('msg') or f"查询我的预约失败: {data.get('code')}")
+        reservations = {}
+        for row in find_rows(data) or []:
+            if str(row.get(self.config['cancelled_field'], '0')) == '1':
+                continue
+            date = str(row.get(self.config['date_field'], ''))[:10]
+            if date_str and date != date_str:
+                continue
+            seat = row.get(self.config['seat_label_field']) or row.get(self.config['seat_id_field'])
+            reservations[(date, str(row.get(self.config['time_area_field'], '')))] = str(seat or '')
+        return reservations
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
@@ -1,8 +1,85 @@
+import atexit
 import logging
+import logging.handlers
 import os
-import time
+import queue
 from datetime import datetime
 
+LOG_FORMAT = '%(asctime)s - %(levelname)s: %(message)s'
+
+# 进程内唯一的日志监听线程
+_listener = None
+
+def setup_logging(log_file='library_automation.log', level=logging.INFO):
+    """
+    配置基于队列的日志：调用线程只把记录放入队列，由后台监听线程写文件和控制台
+
+    多次调用只生效一次。
+
+    返回:
+        logging.handlers.QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """停止监听线程，写完队列中剩余的日志"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+def forward_logging(log_queue, level=logging.INFO):
+    """
+    在工作进程中调用：替换从主进程继承的日志处理器（其监听线程只在主进程中存在），
+    把日志记录发到进程间队列，由主进程的 listen_forwarded 写出
+    """
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter('%(processName)s - %(message)s'))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+def listen_forwarded(log_queue):
+    """
+    在主进程中把工作进程发来的日志记录交给本进程的处理器（文件和控制台）
+
+    返回:
+        已启动的 logging.handlers.QueueListener，结束时调用 stop()
+    """
+    if _listener is not None:
+        handlers = _listener.handlers
+    else:
+        handlers = tuple(logging.getLogger().handlers) or (logging.StreamHandler(),)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
 class Logger:
     """日志处理类"""
     
@@ -11,14 +88,7 @@ class Logger:
         self.log_file = log_file
         
         # 配置日志
-        logging.basicConfig(
-            level=level,
-            format='%(asctime)s - %(levelname)s: %(message)s',
-            handlers=[
-                logging.FileHandler(log_file),
-                logging.StreamHandler()
-            ]
-        )
+        setup_logging(log_file, level)
         
         self.logger = logging.getLogger('library_automation')
     
@@ -55,16 +125,23 @@ class Logger:
             
         session_log = os.path.join(log_dir, f"{operation_type}_{user}_{timestamp}.log")
         
-        # 添加文件处理器
-        file_handler = logging.FileHandler(session_log)
-        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s: %(message)s'))
-        self.logger.addHandler(file_handler)
+        # 添加文件处理器（同样经队列由后台线程写入）
+        file_handler = logging.FileHandler(session_log, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        session_queue = queue.SimpleQueue()
+        handler = logging.handlers.QueueHandler(session_queue)
+        handler.listener = logging.handlers.QueueListener(session_queue, file_handler)
+        handler.listener.start()
+        self.logger.addHandler(handler)
         
         self.info(f"创建会话日志: {session_log}")
-        return file_handler
+        return handler
         
     def close_session_log(self, handler):
         """关闭会话日志处理器"""
         if handler:
             self.logger.removeHandler(handler)
+            handler.listener.stop()
+            for target in handler.listener.handlers:
+                target.close()
             handler.close()
@@ -2,6 +2,7 @@ import json
 import os
 import sys
 import logging
+import queue
 import threading
 import time
 import tkinter as tk
@@ -11,16 +12,27 @@ from tkinter import messagebox
 from auth import Authentication
 from checkin import LibraryCheckin
 from reserve import LibraryReserve
+from driver_pool import DriverPool
+from sniper import ReleaseSniper, parse_release_time
+from checkin_scheduler import CheckinTimeline, CheckinScheduler, has_checkin_user
+from logger import setup_logging, stop_logging
+from tracing import setup_tracing
+from config_handler import ConfigHandler, DEFAULT_PATHS
+from events import EventBus, Event, log_events, LOGIN, MFA, OPERATION, FINISH, ACTIVE, COMPLETED
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s: %(message)s',
-    handlers=[
-        logging.FileHandler("library_automation.log"),
-        logging.StreamHandler()
-    ]
-)
+# 配置日志（写文件由后台线程完成）
+setup_logging("library_automation.log")
+# 设置环境变量 LIBRARY_TRACE 时，退出时导出各步骤耗时
+setup_tracing()
+
+# 日志区域最多保留的行数
+LOG_MAX_LINES = 2000
+# 界面从消息队列取消息的间隔（毫秒）和每次最多处理的条数
+LOG_DRAIN_INTERVAL_MS = 100
+LOG_DRAIN_BATCH = 500
+
+# 事件步骤 -> 界面步骤序号
+STEP_INDEX = {LOGIN: 0, MFA: 1, OPERATION: 2, FINISH: 3}
 
 class LibraryAutomationUI:
     def __init__(self, root):
@@ -36,15 +48,46 @@ class LibraryAutomationUI:
         # 用户列表排序记录
         self.user_last_used = {}
         
+        # 待显示的日志消息（str）和步骤事件（Event）队列，由UI线程定时批量取出
+        self.ui_queue = queue.SimpleQueue()
+        
+        # 界面发起的操作通过该事件总线报告步骤状态（日志文件同时订阅）
+        self.event_bus = EventBus()
+        self.event_bus.subscribe(self.ui_queue.put)
+        log_events(self.event_bus)
+        
         # 无头模式设置
         self.headless_var = tk.BooleanVar(value=False)
+        self.pool_settings = {}
         self.load_settings()
         
+        # 预热浏览器池，避免每次操作都冷启动Chrome
+        self.driver_pool = DriverPool(
+            size=self.pool_settings.get('size', 1),
+            headless=self.headless_var.get(),
+            max_uses=self.pool_settings.get('max_uses', 20),
+            max_memory_mb=self.pool_settings.get('max_memory_mb', 800)
+        )
+        self.driver_pool.warm()
+        
+        # 预约成功的时间段在开始时自动签到（需要验证码时在验证码输入框中请求）
+        self.checkin_mfa_lock = threading.Lock()  # 同一时间只请求一个用户的验证码
+        self.checkin_mfa_request = None  # 定时签到正在等待的验证码 (用户, 队列)
+        self.checkin_timeline = CheckinTimeline()
+        self.checkin_scheduler = CheckinScheduler(
+            self.checkin_timeline,
+            driver_pool=self.driver_pool,
+            callback=self.log,
+            headless=self.headless_var.get(),
+            mfa_provider=self.request_checkin_code
+        )
+        
         # 创建UI组件
         self.create_widgets()
         
         # 尝试加载配置文件 - 确保在创建UI组件后加载配置
         self.config = self.load_config()
+        self.release_time_var.set(self.config.get('reserve', {}).get('release_time', ''))
         
         # 初始化状态变量
         self.current_operation = None
@@ -57,6 +100,12 @@ class LibraryAutomationUI:
         
         # 设置窗口最小化时的行为
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # 开始定时刷新日志区域
+        self.drain_ui_queue()
+        
+        # 继续执行之前记录的定时签到
+        self.checkin_scheduler.schedule()
 
     @staticmethod
     def resource_path(relative_path):
@@ -83,6 +132,9 @@ class LibraryAutomationUI:
                     # 加载用户使用记录
                     if 'user_last_used' in settings:
                         self.user_last_used = settings['user_last_used']
+                    # 加载浏览器池设置
+                    if 'driver_pool' in settings:
+                        self.pool_settings = settings['driver_pool']
                     self.log("已加载应用设置")
             else:
                 self.log("未找到设置文件，将使用默认设置")
@@ -94,7 +146,8 @@ class LibraryAutomationUI:
         try:
             settings = {
                 'headless': self.headless_var.get(),
-                'user_last_used': self.user_last_used
+                'user_last_used': self.user_last_used,
+                'driver_pool': self.pool_settings
             }
             settings_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_settings.json")
             with open(settings_path, 'w', encoding='utf-8') as f:
@@ -109,42 +162,50 @@ class LibraryAutomationUI:
             self.user_last_used[user] = time.time()
             self.save_settings()
 
+    def on_headless_changed(self):
+        """切换无头模式时保存设置并重新预热浏览器"""
+        self.save_settings()
+        self.driver_pool.set_headless(self.headless_var.get())
+        self.checkin_scheduler.headless = self.headless_var.get()
+
+    def schedule_checkins(self, reserver):
+        """把预约成功的时间段加入定时签到"""
+        try:
+            if not has_checkin_user(reserver.user_key, self.checkin_scheduler.config_path):
+                self.log(f"⚠️ 签到配置中没有用户 {reserver.user_key}，预约的时段将无法自动签到"
+                         f"（签到配置需使用与预约配置相同的用户键名）")
+            added = self.checkin_timeline.record_reservations(reserver.user_key, reserver)
+            if added:
+                self.log(f"已为{added}个预约成功的时段安排自动签到")
+                self.checkin_scheduler.schedule(reserver.user_key)
+        except Exception as e:
+            self.log(f"安排自动签到失败: {e}")
+
     def on_close(self):
         """关闭窗口时的处理"""
         self.save_settings()
+        self.checkin_scheduler.stop(timeout=2)
+        logging.info(self.driver_pool.metrics_summary())
+        self.driver_pool.shutdown()
         self.root.destroy()
+        stop_logging()
 
     def load_config(self):
-        """加载配置文件（兼容打包后路径）"""
+        """通过共享的配置服务加载配置文件（兼容打包后路径，文件未修改时不重新解析）"""
         config = {}
+        configs = ConfigHandler.shared()
         
-        # 加载签到配置
-        try:
-            checkin_path = self.resource_path('checkinConfig.json')
-            if os.path.exists(checkin_path):
-                with open(checkin_path, 'r', encoding='utf-8') as f:
-                    config['checkin'] = json.load(f)
-                self.log(f"成功加载签到配置文件: {checkin_path}")
-            else:
-                self.log(f"⚠️ 配置文件未找到: {checkin_path}")
-        except Exception as e:
-            error_msg = f"签到配置加载失败: {str(e)}"
-            self.log(error_msg)
-            logging.error(error_msg)
-        
-        # 加载预约配置
-        try:
-            reserve_path = self.resource_path('reserveConfig.json')
-            if os.path.exists(reserve_path):
-                with open(reserve_path, 'r', encoding='utf-8') as f:
-                    config['reserve'] = json.load(f)
-                self.log(f"成功加载预约配置文件: {reserve_path}")
-            else:
-                self.log(f"⚠️ 配置文件未找到: {reserve_path}")
-        except Exception as e:
-            error_msg = f"预约配置加载失败: {str(e)}"
-            self.log(error_msg)
-            logging.error(error_msg)
+        for kind, name in (('checkin', '签到'), ('reserve', '预约')):
+            path = DEFAULT_PATHS[kind]
+            try:
+                config[kind] = configs.load(path)
+                self.log(f"成功加载{name}配置文件: {self.resource_path(path)}")
+            except FileNotFoundError:
+                self.log(f"⚠️ 配置文件未找到: {self.resource_path(path)}")
+            except Exception as e:
+                error_msg = f"{name}配置加载失败: {str(e)}"
+                self.log(error_msg)
+                logging.error(error_msg)
         
         return config
     
@@ -153,7 +214,8 @@ class LibraryAutomationUI:
         # 从配置中获取用户列表
         self.users = []
         if 'checkin' in self.config:
-            self.users.extend(list(self.config['checkin'].keys()))
+            # 签到配置顶层同时存放全局设置（如url、app_url），只取用户配置对象
+            self.users.extend([k for k, v in self.config['checkin'].items() if isinstance(v, dict)])
         if 'reserve' in self.config:
             if 'reserveUrl' in self.config['reserve']:
                 self.users.extend(list(self.config['reserve']['reserveUrl'].keys()))
@@ -203,7 +265,7 @@ class LibraryAutomationUI:
             headless_frame, 
             text="无头模式 (不显示浏览器窗口)", 
             variable=self.headless_var,
-            command=self.save_settings
+            command=self.on_headless_changed
         )
         self.headless_checkbox.pack(side=tk.LEFT, padx=5)
         
@@ -217,6 +279,9 @@ class LibraryAutomationUI:
         self.reserve_button = ttk.Button(button_frame, text="预约", command=self.start_reserve)
         self.reserve_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         
+        self.scheduled_button = ttk.Button(button_frame, text="定时预约", command=lambda: self.start_reserve(scheduled=True))
+        self.scheduled_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        
         self.retry_button = ttk.Button(button_frame, text="重试", command=self.retry_operation, state=tk.DISABLED)
         self.retry_button.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         
@@ -276,7 +341,7 @@ class LibraryAutomationUI:
             headless_frame, 
             text="无头模式 (不显示浏览器窗口)", 
             variable=self.headless_var,
-            command=self.save_settings
+            command=self.on_headless_changed
         )
         self.headless_checkbox.pack(side=tk.LEFT, padx=5)
 
@@ -313,6 +378,17 @@ class LibraryAutomationUI:
             variable=self.use_alt_seats_var
         )
         alt_seats_cb.pack(side=tk.LEFT, padx=5)
+        
+        # 定时预约的放号时间
+        release_frame = ttk.Frame(advanced_frame)
+        release_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(release_frame, text="放号时间:").pack(side=tk.LEFT, padx=5)
+        
+        self.release_time_var = tk.StringVar()
+        release_entry = ttk.Entry(release_frame, textvariable=self.release_time_var, width=10)
+        release_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(release_frame, text="(HH:MM:SS，用于定时预约)").pack(side=tk.LEFT, padx=5)
     
     def stop_operation(self):
         """终止当前操作"""
@@ -331,16 +407,39 @@ class LibraryAutomationUI:
             self.log(f"终止操作时出错: {e}")
             
     def log(self, message):
-        """添加日志信息"""
-        # 确保log_text已初始化
-        if hasattr(self, 'log_text') and self.log_text:
-            self.log_text.config(state=tk.NORMAL)
-            self.log_text.insert(tk.END, message + "\n")
-            self.log_text.see(tk.END)
-            self.log_text.config(state=tk.DISABLED)
+        """添加日志信息（可在任意线程调用）"""
+        self.ui_queue.put(message)
         # 无论UI是否准备好，都记录到系统日志
         logging.info(message)
     
+    def drain_ui_queue(self):
+        """定时取出队列中的消息，批量写入日志区域并更新步骤状态"""
+        messages = []
+        try:
+            while len(messages) < LOG_DRAIN_BATCH:
+                messages.append(self.ui_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        lines = [item for item in messages if not isinstance(item, Event)]
+        if lines:
+            self.append_log_lines(lines)
+        for item in messages:
+            if isinstance(item, Event):
+                self.apply_event(item)
+        
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self.drain_ui_queue)
+    
+    def append_log_lines(self, lines):
+        """一次插入多行日志，超过LOG_MAX_LINES时删除最早的行"""
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > LOG_MAX_LINES:
+            self.log_text.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')
+        self.log_text.see(tk.END)
+        self.log_text.config(state=tk.DISABLED)
+    
     def update_step(self, step_index, status):
         """更新步骤状态"""
         if step_index < 0 or step_index >= len(self.steps):
@@ -371,47 +470,52 @@ class LibraryAutomationUI:
         self.retry_button.config(state=tk.DISABLED)
 
     def callback_handler(self, message):
-        """统一回调处理"""
-        # 在UI主线程中更新UI
-        self.root.after(0, lambda: self.log(message))
-        
-        # 根据消息内容更新步骤状态
-        lower_message = message.lower()
-        
-        if "登录" in lower_message:
-            if "成功" in lower_message:
-                self.root.after(0, lambda: self.update_step(0, "completed"))
-            elif "失败" in lower_message or "错误" in lower_message:
-                self.root.after(0, lambda: self.update_step(0, "error"))
-            else:
-                self.root.after(0, lambda: self.update_step(0, "active"))
+        """统一回调处理（在操作线程中调用，只把消息放入队列）"""
+        self.ui_queue.put(message)
+        logging.info(message)
+    
+    def apply_event(self, event):
+        """根据步骤事件更新步骤状态（在UI线程中执行）"""
+        # 单个时间段的结果只写日志，不改变整体步骤状态
+        if event.slot is not None:
+            return
+        self.update_step(STEP_INDEX[event.step], event.status)
         
-        elif "验证码" in lower_message or "多因子" in lower_message:
-            if "成功" in lower_message:
-                self.root.after(0, lambda: self.update_step(1, "completed"))
+        if event.step == MFA:
+            if event.status == ACTIVE:
+                self.show_verification_frame()
+            elif event.status == COMPLETED:
                 # 隐藏验证码输入框
-                self.root.after(0, lambda: self.verification_frame.pack_forget())
-            elif "失败" in lower_message or "错误" in lower_message:
-                self.root.after(0, lambda: self.update_step(1, "error"))
-            elif "需要" in lower_message or "等待" in lower_message:
-                self.root.after(0, lambda: self.update_step(1, "active"))
-                # 显示验证码输入框并确保窗口可见
-                self.root.after(0, self.root.deiconify)
-                self.root.after(0, lambda: self.verification_frame.pack(fill=tk.X, pady=5, after=self.control_frame))
-                # 聚焦到验证码输入框
-                self.root.after(100, lambda: self.verification_entry.focus_set())
-                
-        elif any(op in lower_message for op in ["签到", "预约"]):
-            if "成功" in lower_message or "完成" in lower_message:
-                if "所有" in lower_message or "流程完成" in lower_message:
-                    self.root.after(0, lambda: self.update_step(2, "completed"))
-                    self.root.after(0, lambda: self.update_step(3, "completed"))
-                else:
-                    self.root.after(0, lambda: self.update_step(2, "active"))
-            elif "失败" in lower_message or "错误" in lower_message:
-                self.root.after(0, lambda: self.update_step(2, "error"))
-            else:
-                self.root.after(0, lambda: self.update_step(2, "active"))
+                self.verification_frame.pack_forget()
+
+    def show_verification_frame(self):
+        """显示验证码输入框并确保窗口可见（在UI线程中执行）"""
+        self.root.deiconify()
+        self.verification_frame.pack(fill=tk.X, pady=5, after=self.control_frame)
+        # 聚焦到验证码输入框
+        self.root.after(100, lambda: self.verification_entry.focus_set())
+
+    def request_checkin_code(self, user_key, timeout=300):
+        """
+        定时签到需要验证码时通过验证码输入框请求（在签到线程中调用）
+
+        返回:
+            str: 验证码，超时返回None
+        """
+        with self.checkin_mfa_lock:
+            answer = queue.SimpleQueue()
+            self.checkin_mfa_request = (user_key, answer)
+            self.log(f"[定时签到 {user_key}] 需要多因子验证码，请在验证码输入框中输入")
+            self.root.after(0, self.show_verification_frame)
+            try:
+                return answer.get(timeout=timeout)
+            except queue.Empty:
+                self.log(f"[定时签到 {user_key}] 等待验证码超时")
+                if self.current_operation is None:
+                    self.root.after(0, self.verification_frame.pack_forget)
+                return None
+            finally:
+                self.checkin_mfa_request = None
 
     def retry_operation(self):
         """重试当前操作"""
@@ -460,10 +564,12 @@ class LibraryAutomationUI:
                         # 重新启用按钮
                         self.root.after(0, lambda: self.checkin_button.config(state=tk.NORMAL))
                         self.root.after(0, lambda: self.reserve_button.config(state=tk.NORMAL))
+                        self.root.after(0, lambda: self.scheduled_button.config(state=tk.NORMAL))
                 
                 # 禁用按钮
                 self.checkin_button.config(state=tk.DISABLED)
                 self.reserve_button.config(state=tk.DISABLED)
+                self.scheduled_button.config(state=tk.DISABLED)
                 self.retry_button.config(state=tk.DISABLED)
                 
                 checkin_thread = threading.Thread(target=run_direct_checkin)
@@ -484,27 +590,13 @@ class LibraryAutomationUI:
                 def run_direct_reserve():
                     try:
                         if self.current_handler:
-                            # 依次预约每个时间段
-                            success_count = 0
-                            for i in range(1, 8):
-                                try:
-                                    if self.current_handler.reserve_single_time_slot(i):
-                                        success_count += 1
-                                    else:
-                                        self.log(f"第{i}个时段预约失败，将继续尝试下一个时段")
-                                except Exception as e:
-                                    self.log(f"预约第{i}个时段时发生异常: {e}，将继续尝试下一个时段")
-                            
-                            # 汇报结果
-                            if success_count == 7:
-                                self.log("所有时段预约成功")
+                            # 预约所有时间段（依次或并行）
+                            success_count = self.current_handler.reserve_all_slots()
+                            if success_count > 0:
                                 self.update_step(3, "completed")
+                                self.schedule_checkins(self.current_handler)
                             else:
-                                self.log(f"共预约成功{success_count}个时段，{7-success_count}个时段失败")
-                                if success_count > 0:
-                                    self.update_step(3, "completed")
-                                else:
-                                    self.update_step(2, "error")
+                                self.update_step(2, "error")
                     except Exception as e:
                         self.log(f"预约过程中出错: {e}")
                         self.update_step(2, "error")
@@ -512,10 +604,12 @@ class LibraryAutomationUI:
                         # 重新启用按钮
                         self.root.after(0, lambda: self.checkin_button.config(state=tk.NORMAL))
                         self.root.after(0, lambda: self.reserve_button.config(state=tk.NORMAL))
+                        self.root.after(0, lambda: self.scheduled_button.config(state=tk.NORMAL))
                 
                 # 禁用按钮
                 self.checkin_button.config(state=tk.DISABLED)
                 self.reserve_button.config(state=tk.DISABLED)
+                self.scheduled_button.config(state=tk.DISABLED)
                 self.retry_button.config(state=tk.DISABLED)
                 
                 reserve_thread = threading.Thread(target=run_direct_reserve)
@@ -547,6 +641,7 @@ class LibraryAutomationUI:
         # 禁用按钮
         self.checkin_button.config(state=tk.DISABLED)
         self.reserve_button.config(state=tk.DISABLED)
+        self.scheduled_button.config(state=tk.DISABLED)
         self.retry_button.config(state=tk.DISABLED)
         
         # 如果不是无头模式，最小化窗口
@@ -565,9 +660,11 @@ class LibraryAutomationUI:
                         pass
                 
                 checkin = LibraryCheckin(
-                    user_key=selected_user,
+                    config_view=ConfigHandler.shared().view('checkin', selected_user),
                     callback=self.callback_handler,
-                    headless=self.headless_var.get()
+                    headless=self.headless_var.get(),
+                    driver_pool=self.driver_pool,
+                    event_bus=self.event_bus
                 )
                 self.current_handler = checkin
                 
@@ -599,13 +696,14 @@ class LibraryAutomationUI:
                 # 重新启用按钮
                 self.root.after(0, lambda: self.checkin_button.config(state=tk.NORMAL))
                 self.root.after(0, lambda: self.reserve_button.config(state=tk.NORMAL))
+                self.root.after(0, lambda: self.scheduled_button.config(state=tk.NORMAL))
         
         self.automation_thread = threading.Thread(target=run_checkin)
         self.automation_thread.daemon = True
         self.automation_thread.start()
         
-    def start_reserve(self, is_retry=False):
-        """开始预约流程"""
+    def start_reserve(self, is_retry=False, scheduled=False):
+        """开始预约流程（scheduled为True时在放号时刻定时预约）"""
         if self.current_operation and not is_retry:
             messagebox.showwarning("警告", "当前有操作正在进行，请等待完成")
             return
@@ -615,10 +713,18 @@ class LibraryAutomationUI:
             messagebox.showerror("错误", "请选择用户")
             return
         
+        release_at = None
+        if scheduled:
+            try:
+                release_at = parse_release_time(self.release_time_var.get())
+            except Exception:
+                messagebox.showerror("错误", "请输入有效的放号时间，例如 08:00:00")
+                return
+        
         # 更新用户使用记录
         self.update_user_last_used(selected_user)
         
-        self.log(f"开始预约流程，用户: {selected_user}")
+        self.log(f"开始{'定时' if scheduled else ''}预约流程，用户: {selected_user}")
         self.current_operation = "reserve"
         self.reset_steps()
         self.update_step(0, "active")
@@ -626,6 +732,7 @@ class LibraryAutomationUI:
         # 禁用按钮
         self.checkin_button.config(state=tk.DISABLED)
         self.reserve_button.config(state=tk.DISABLED)
+        self.scheduled_button.config(state=tk.DISABLED)
         self.retry_button.config(state=tk.DISABLED)
         
         # 如果不是无头模式，最小化窗口
@@ -649,15 +756,22 @@ class LibraryAutomationUI:
                 
                 # 创建预约实例并传递高级设置
                 reserver = LibraryReserve(
-                    user_key=selected_user,
+                    config_view=ConfigHandler.shared().view('reserve', selected_user),
                     callback=self.callback_handler,
-                    headless=self.headless_var.get()
+                    headless=self.headless_var.get(),
+                    driver_pool=self.driver_pool,
+                    event_bus=self.event_bus
                 )
                 
                 # 设置高级选项
                 reserver.days_ahead = days_ahead
                 reserver.try_alternative_seats = try_alternative_seats
                 
+                if scheduled:
+                    # 定时预约：放号前登录并进入座位页面，在放号时刻触发
+                    lead_seconds = reserver.config.get('release_lead_seconds', 60)
+                    reserver = ReleaseSniper(reserver, release_at, lead_seconds=lead_seconds)
+                
                 self.current_handler = reserver
                 
                 result = reserver.run()
@@ -670,6 +784,7 @@ class LibraryAutomationUI:
                 elif result:
                     self.log("预约流程成功完成")
                     self.update_step(3, "completed")
+                    self.schedule_checkins(reserver)
                     reserver.close()
                     self.current_handler = None
                     self.current_operation = None
@@ -689,13 +804,26 @@ class LibraryAutomationUI:
                 # 重新启用按钮
                 self.root.after(0, lambda: self.checkin_button.config(state=tk.NORMAL))
                 self.root.after(0, lambda: self.reserve_button.config(state=tk.NORMAL))
+                self.root.after(0, lambda: self.scheduled_button.config(state=tk.NORMAL))
         
         self.automation_thread = threading.Thread(target=run_reserve)
         self.automation_thread.daemon = True
         self.automation_thread.start()
 
     def submit_verification(self):
-        """提交验证码"""
+        """提交验证码（定时签到正在等待验证码时优先交给定时签到）"""
+        request = self.checkin_mfa_request
+        if request is not None:
+            code = self.verification_var.get().strip()
+            if not code:
+                messagebox.showerror("错误", "请输入验证码")
+                return
+            self.log(f"[定时签到 {request[0]}] 提交验证码: {code}")
+            self.verification_var.set("")
+            self.verification_frame.pack_forget()
+            request[1].put(code)
+            return
+        
         if not self.current_handler or not self.current_operation:
             messagebox.showerror("错误", "没有等待验证的操作")
             return
@@ -719,6 +847,8 @@ class LibraryAutomationUI:
                 if result:
                     self.log(f"{self.current_operation}流程成功完成")
                     self.update_step(3, "completed")
+                    if self.current_operation == "reserve":
+                        self.schedule_checkins(self.current_handler)
                     self.current_handler.close()
                     self.current_handler = None
                     self.current_operation = None
@@ -740,6 +870,7 @@ class LibraryAutomationUI:
                 # 重新启用按钮
                 self.root.after(0, lambda: self.checkin_button.config(state=tk.NORMAL))
                 self.root.after(0, lambda: self.reserve_button.config(state=tk.NORMAL))
+                self.root.after(0, lambda: self.scheduled_button.config(state=tk.NORMAL))
         
         verify_thread = threading.Thread(target=continue_with_verification)
         verify_thread.daemon = True
@@ -0,0 +1,462 @@
+import json
+import random
+import threading
+import time
+import uuid
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>统一身份认证</title></head>
+<body>
+<form method="post" action="/login?service={service}">
+    <input id="username" name="username" type="text">
+    <input id="password" name="password" type="password">
+    <button id="login_submit" type="submit">登录</button>
+</form>
+{error}
+</body></html>
+"""
+
+MFA_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>多因子认证</title></head>
+<body>
+<h3>多因子认证</h3>
+<form method="post" action="/login/mfa?service={service}">
+    <button id="getDynamicCode" type="button"
+        onclick="fetch('/login/sendCode', {{method: 'POST'}})">获取验证码</button>
+    <input id="dynamicCode" name="dynamicCode" placeholder="请输入验证码">
+    <button id="reAuthSubmitBtn" type="submit">登录</button>
+</form>
+{error}
+</body></html>
+"""
+
+TRUST_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>设备信任</title></head>
+<body>
+<button class="trust-device-button trust-device-sub-btn"
+    onclick="location.href = '{service}'">信任此设备</button>
+</body></html>
+"""
+
+APP_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>公共场所预约</title>
+<style>
+.grid-cell-container {{ display: inline-block; width: 48px; height: 36px; margin: 4px; border: 2px solid #999; }}
+.active {{ background: #4a90e2; }}
+.booked {{ background: #5cb85c; }}
+.myBooked {{ background: #5cb85c; border-color: #f0ad4e; }}
+.selected {{ outline: 3px solid #d9534f; }}
+</style></head>
+<body><div id="app"></div>
+<script>
+var RENDER_DELAY = {render_delay};
+var COLUMNS = {columns};
+var LIVE_REFRESH = {live_refresh};
+
+function hashParams() {{
+    var h = location.hash, i = h.indexOf('?');
+    return new URLSearchParams(i >= 0 ? h.slice(i + 1) : '');
+}}
+
+function post(path, params, cb) {{
+    var x = new XMLHttpRequest();
+    x.open('POST', path);
+    x.setRequestHeader('Content-Type', 'application/x-www-form-urlencoded');
+    x.onload = function () {{ cb(JSON.parse(x.responseText)); }};
+    x.send(params.toString());
+}}
+
+function later(fn) {{ setTimeout(fn, RENDER_DELAY); }}
+
+function renderCheckin(app) {{
+    app.innerHTML = '<div><div>座位签到</div><div><div><button id="checkinBtn">签到</button></div></div></div>';
+    document.getElementById('checkinBtn').onclick = function () {{
+        post('checkin.do', new URLSearchParams(location.search), function (r) {{
+            var d = document.createElement('div');
+            d.textContent = r.code === '0' ? '签到成功' : ('签到失败: ' + r.msg);
+            document.body.appendChild(d);
+        }});
+    }};
+}}
+
+function renderSeatDetail(app) {{
+    app.innerHTML = '<div><button id="selectArea">选择区域</button></div><div id="areas"></div>' +
+        '<div id="grid"></div><div><button id="confirmButton" disabled>确定</button></div><div id="result"></div>';
+    var selectedSeat = null;
+    document.getElementById('selectArea').onclick = function () {{
+        later(function () {{
+            document.getElementById('areas').innerHTML = '<button id="eastC">东C区</button>';
+            document.getElementById('eastC').onclick = loadGrid;
+        }});
+    }};
+    function seatClass(row) {{
+        return row.STATUS === '0' ? 'active' : (row.STATUS === '2' ? 'myBooked' : 'booked');
+    }}
+    function refreshGrid() {{
+        // 模拟前端定时刷新座位状态：只修改变化座位的class，不重建网格
+        post('modules/seatdetail/querySeats.do', hashParams(), function (r) {{
+            var rows = r.datas.querySeats.rows;
+            for (var i = 0; i < rows.length; i++) {{
+                var cell = document.querySelector('.grid-cell-container[data-id="' + rows[i].SEAT_ID + '"]');
+                var cls = seatClass(rows[i]);
+                if (cell && !cell.classList.contains(cls)) {{
+                    cell.classList.remove('active', 'booked', 'myBooked', 'selected');
+                    cell.classList.add(cls);
+                }}
+            }}
+            setTimeout(refreshGrid, LIVE_REFRESH);
+        }});
+    }}
+    function loadGrid() {{
+        post('modules/seatdetail/querySeats.do', hashParams(), function (r) {{
+            var rows = r.datas.querySeats.rows, html = '';
+            for (var i = 0; i < rows.length; i++) {{
+                var cls = seatClass(rows[i]);
+                html += '<div class="grid-cell-container ' + cls + '" data-id="' + rows[i].SEAT_ID + '">' +
+                    '<p class="grid-cell-info">' + rows[i].SEAT_NO + '</p></div>';
+                if ((i + 1) % COLUMNS === 0) {{ html += '<br>'; }}
+            }}
+            later(function () {{
+                var grid = document.getElementById('grid');
+                grid.innerHTML = html;
+                var cells = grid.querySelectorAll('.grid-cell-container');
+                for (var j = 0; j < cells.length; j++) {{
+                    cells[j].onclick = function () {{
+                        if (!this.classList.contains('active')) {{ return; }}
+                        var old = grid.querySelector('.selected');
+                        if (old) {{ old.classList.remove('selected'); }}
+                        this.classList.add('selected');
+                        selectedSeat = this.getAttribute('data-id');
+                        document.getElementById('confirmButton').disabled = false;
+                    }};
+                }}
+                if (LIVE_REFRESH > 0) {{ setTimeout(refreshGrid, LIVE_REFRESH); }}
+            }});
+        }});
+    }}
+    document.getElementById('confirmButton').onclick = function () {{
+        var params = hashParams();
+        params.set('SEAT_ID', selectedSeat);
+        post('modules/seatdetail/saveAppointment.do', params, function (r) {{
+            document.getElementById('result').innerHTML = '<div>' + (r.code === '0' ? '预约成功' : r.msg) + '</div>';
+        }});
+    }};
+}}
+
+function route() {{
+    var app = document.getElementById('app');
+    if (location.hash.indexOf('#/checkinBySeat') === 0) {{ renderCheckin(app); }}
+    else if (location.hash.indexOf('#/seatdetail') === 0) {{ renderSeatDetail(app); }}
+    else {{ app.innerHTML = '<div>图书馆座位预约</div>'; }}
+}}
+window.addEventListener('hashchange', route);
+route();
+</script></body></html>
+"""
+
+# 座位状态（与HTTP引擎默认的state_map一致）
+FREE, BOOKED, MINE = '0', '1', '2'
+
+class MockLibraryState:
+    """模拟服务器的共享状态：会话、座位和签到记录"""
+
+    def __init__(self, rows=4, columns=10, mfa_code='123456', require_mfa=True,
+                 booked_ratio=0.3, contention=0.0, cancel_rate=0.0, seed=None):
+        """
+        参数:
+            rows, columns: 座位网格大小
+            mfa_code: 多因子验证码
+            require_mfa: 登录后是否需要多因子验证
+            booked_ratio: 每个时段初始被他人预约的座位比例
+            contention: 竞争强度，每次查询/提交时空座被他人抢走的概率
+            cancel_rate: 每次查询时他人预约的座位被取消（重新空出）的概率
+            seed: 随机种子
+        """
+        self.rows = rows
+        self.columns = columns
+        self.mfa_code = mfa_code
+        self.require_mfa = require_mfa
+        self.booked_ratio = booked_ratio
+        self.contention = contention
+        self.cancel_rate = cancel_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空会话、预约和签到记录"""
+        with self.lock:
+            self.sessions = {}      # token -> 用户名
+            self.pending_mfa = {}   # token -> 用户名
+            self.slots = {}         # (日期, 时间段) -> 座位列表
+            self.checkins = []
+
+    def seats_for(self, date, time_area):
+        """获取（必要时生成）某个时段的座位列表，调用方需持有锁"""
+        key = (date, time_area)
+        if key not in self.slots:
+            seats = []
+            for r in range(self.rows):
+                for c in range(self.columns):
+                    label = f"{chr(ord('A') + r)}{101 + c}"
+                    status = BOOKED if self.random.random() < self.booked_ratio else FREE
+                    seats.append({'SEAT_ID': f"seat-{label}", 'SEAT_NO': label, 'STATUS': status, 'OWNER': None})
+            self.slots[key] = seats
+        return self.slots[key]
+
+    def apply_contention(self, seats):
+        """模拟其他用户抢座"""
+        if not self.contention:
+            return
+        for seat in seats:
+            if seat['STATUS'] == FREE and self.random.random() < self.contention:
+                seat['STATUS'] = BOOKED
+
+    def apply_cancellations(self, seats):
+        """模拟其他用户取消预约"""
+        if not self.cancel_rate:
+            return
+        for seat in seats:
+            if seat['STATUS'] == BOOKED and seat['OWNER'] is None and self.random.random() < self.cancel_rate:
+                seat['STATUS'] = FREE
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """模拟登录页、多因子认证、座位预约和签到页面"""
+
+    server_version = "MockLibrary/1.0"
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        logging.debug("mock: " + format % args)
+
+    def _delay(self):
+        latency, jitter = self.server.latency, self.server.jitter
+        if latency or jitter:
+            time.sleep(latency + self.state.random.uniform(0, jitter))
+
+    def _cookie(self, name):
+        for part in self.headers.get('Cookie', '').split(';'):
+            key, _, value = part.strip().partition('=')
+            if key == name:
+                return value
+        return None
+
+    def _user(self):
+        return self.state.sessions.get(self._cookie('MOCK_SESSION'))
+
+    def _form(self):
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        return {k: v[0] for k, v in parse_qs(body, keep_blank_values=True).items()}
+
+    def _send(self, status, body='', content_type='text/html; charset=utf-8', headers=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def _json(self, payload):
+        self._send(200, json.dumps(payload, ensure_ascii=False), 'application/json; charset=utf-8')
+
+    def _redirect(self, location, cookie=None):
+        headers = {'Location': location}
+        if cookie:
+            headers['Set-Cookie'] = cookie
+        self._send(302, headers=headers)
+
+    def _service(self, query):
+        return query.get('service', ['/app/index.do'])[0]
+
+    def do_HEAD(self):
+        self._send(200)
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/login':
+            self._send(200, LOGIN_PAGE.format(service=quote(self._service(query)), error=''))
+        elif url.path == '/login/mfa':
+            self._send(200, MFA_PAGE.format(service=quote(self._service(query)), error=''))
+        elif url.path.startswith('/app/'):
+            if self._user() is None:
+                self._redirect('/login?service=' + quote(self.path))
+            else:
+                self._send(200, APP_PAGE.format(render_delay=self.server.render_delay, columns=self.state.columns,
+                                                live_refresh=self.server.live_refresh))
+        else:
+            self._send(404, 'not found')
+
+    def do_POST(self):
+        self._delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        form = self._form()
+        state = self.state
+
+        if url.path == '/login':
+            service = self._service(query)
+            if not form.get('username') or not form.get('password'):
+                self._send(200, LOGIN_PAGE.format(service=quote(service), error='<div>用户名或密码错误</div>'))
+                return
+            token = uuid.uuid4().hex
+            with state.lock:
+                if state.require_mfa:
+                    state.pending_mfa[token] = form['username']
+                    target = '/login/mfa?service=' + quote(service)
+                else:
+                    state.sessions[token] = form['username']
+                    target = service
+            self._redirect(target, f"MOCK_SESSION={token}; Path=/")
+        elif url.path == '/login/sendCode':
+            self._json({'code': '0'})
+        elif url.path == '/login/mfa':
+            service = self._service(query)
+            token = self._cookie('MOCK_SESSION')
+            with state.lock:
+                user = state.pending_mfa.get(token)
+                ok = user is not None and form.get('dynamicCode') == state.mfa_code
+                if ok:
+                    state.sessions[token] = state.pending_mfa.pop(token)
+            if ok:
+                self._send(200, TRUST_PAGE.format(service=service))
+            else:
+                self._send(200, MFA_PAGE.format(service=quote(service), error='<div>验证码错误</div>'))
+        elif url.path.startswith('/app/'):
+            self._app_api(url.path[len('/app/'):], form)
+        else:
+            self._send(404, 'not found')
+
+    def _app_api(self, path, form):
+        user = self._user()
+        if user is None:
+            self._json({'code': '401', 'msg': '未登录'})
+            return
+        state = self.state
+
+        if path == 'modules/seatdetail/querySeats.do':
+            with state.lock:
+                seats = state.seats_for(form.get('APPLY_DATE'), form.get('APPLY_TIME_AREA'))
+                state.apply_cancellations(seats)
+                state.apply_contention(seats)
+                rows = [{
+                    'SEAT_ID': s['SEAT_ID'],
+                    'SEAT_NO': s['SEAT_NO'],
+                    'STATUS': MINE if s['OWNER'] == user else s['STATUS'],
+                } for s in seats]
+            self._json({'code': '0', 'datas': {'querySeats': {'rows': rows}}})
+        elif path == 'modules/seatdetail/saveAppointment.do':
+            with state.lock:
+                seats = state.seats_for(form.get('APPLY_DATE'), form.get('APPLY_TIME_AREA'))
+                state.apply_contention(seats)
+                seat = next((s for s in seats if s['SEAT_ID'] == form.get('SEAT_ID')), None)
+                if seat is None:
+                    result = {'code': '1', 'msg': '座位不存在'}
+                elif seat['STATUS'] != FREE:
+                    result = {'code': '1', 'msg': '座位已被预约'}
+                else:
+                    seat['STATUS'] = BOOKED
+                    seat['OWNER'] = user
+                    result = {'code': '0', 'msg': '预约成功'}
+            self._json(result)
+        elif path == 'modules/myAppointment/queryMyAppointments.do':
+            with state.lock:
+                rows = [{
+                    'APPLY_DATE': date,
+                    'APPLY_TIME_AREA': time_area,
+                    'SEAT_ID': s['SEAT_ID'],
+                    'SEAT_NO': s['SEAT_NO'],
+                    'IS_CANCELLED': '0',
+                } for (date, time_area), seats in sorted(state.slots.items())
+                    if not form.get('APPLY_DATE') or date == form.get('APPLY_DATE')
+                    for s in seats if s['OWNER'] == user]
+            self._json({'code': '0', 'datas': {'queryMyAppointments': {'rows': rows}}})
+        elif path == 'checkin.do':
+            with state.lock:
+                state.checkins.append((user, form.get('seatId'), time.time()))
+            self._json({'code': '0', 'msg': '签到成功'})
+        else:
+            self._json({'code': '404', 'msg': '接口不存在'})
+
+class MockLibraryServer:
+    """在后台线程中运行的本地模拟图书馆服务器"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, render_delay=50, live_refresh=0,
+                 **state_options):
+        """
+        参数:
+            host, port: 监听地址（port为0时自动分配）
+            latency: 每个请求的固定延迟（秒）
+            jitter: 每个请求额外的随机延迟上限（秒）
+            render_delay: 页面点击后渲染的延迟（毫秒），模拟前端框架渲染
+            live_refresh: 座位页面定时刷新座位状态的间隔（毫秒），0表示不刷新
+            state_options: 传给MockLibraryState的参数（座位规模、竞争强度等）
+        """
+        self.state = MockLibraryState(**state_options)
+        self.httpd = ThreadingHTTPServer((host, port), MockRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.render_delay = render_delay
+        self.httpd.live_refresh = live_refresh
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def app_url(self):
+        """预约应用首页，对应配置项 app_url"""
+        return self.base_url + "/app/index.do"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# 如果直接运行该模块，启动模拟服务器
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟图书馆服务器")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.0, help="随机延迟上限（秒）")
+    parser.add_argument('--contention', type=float, default=0.0, help="空座被抢走的概率")
+    parser.add_argument('--cancel-rate', type=float, default=0.0, help="每次查询时他人预约被取消的概率")
+    parser.add_argument('--live-refresh', type=int, default=0, help="座位页面刷新座位状态的间隔（毫秒），0表示不刷新")
+    parser.add_argument('--no-mfa', action='store_true', help="登录后不需要多因子验证")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s: %(message)s')
+    server = MockLibraryServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                               live_refresh=args.live_refresh, contention=args.contention,
+                               cancel_rate=args.cancel_rate, require_mfa=not args.no_mfa)
+    server.start()
+    print(f"模拟服务器已启动: {server.app_url}  (验证码: {server.state.mfa_code})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
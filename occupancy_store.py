@@ -0,0 +1,310 @@
+import argparse
+import datetime
+import os
+import sys
+import logging
+from array import array
+
+from seat_ranking import SEAT_ID, SEAT_LABEL, SEAT_STATE
+from utils import resource_path, file_lock
+
+# 日期列存储为相对该日期的天数
+EPOCH = datetime.date(2020, 1, 1)
+
+# 列名 -> array类型码：日期（天数）、时间段、座位（seats.txt中的行号）、状态码、观察时距时段开始的分钟数
+COLUMNS = (('day', 'H'), ('slot', 'B'), ('seat', 'H'), ('state', 'B'), ('lead', 'H'))
+
+# 已被预约的状态码（自己预约或他人预约）
+BOOKED_STATES = (2, 3)
+
+# 被他人预约的状态码（排序时只看他人的预约，自己的预约不代表座位紧张）
+BOOKED_BY_OTHERS = (3,)
+
+MAX_LEAD = 0xFFFF
+
+WEEKDAYS = ('一', '二', '三', '四', '五', '六', '日')
+
+def day_number(date_str):
+    """YYYY-MM-DD -> 相对EPOCH的天数"""
+    return (datetime.date.fromisoformat(date_str) - EPOCH).days
+
+def day_date(day):
+    """相对EPOCH的天数 -> datetime.date"""
+    return EPOCH + datetime.timedelta(days=day)
+
+def seat_name(seat):
+    """座位记录在历史中的名称：有编号时用编号，否则用data-id"""
+    return seat[SEAT_LABEL] or seat[SEAT_ID]
+
+class OccupancyStore:
+    """
+    座位占用历史的列式存储（occupancy/ 目录，每列一个只追加的二进制文件）
+
+    每次观察到的座位网格按行记录: 日期、时间段、座位、状态码、距时段开始的分钟数（每行7字节），
+    同一实例中座位状态没有变化时不重复记录；座位名称在 seats.txt 中按行编号。
+    新行先缓存在内存中，达到batch_rows行或调用flush()时加文件锁一次追加到各列文件。
+    """
+
+    def __init__(self, path='occupancy', batch_rows=4096):
+        """
+        初始化占用历史存储
+
+        参数:
+            path: 存储目录
+            batch_rows: 缓存多少行后写入文件
+        """
+        self.path = resource_path(path)
+        self.lock_path = self.path + '.lock'
+        self.batch_rows = batch_rows
+        self.pending = []  # [(天数, 时间段, 座位名称, 状态码, 分钟数), ...]
+        self.last_state = {}  # (天数, 时间段, 座位名称) -> 最近记录的状态码
+        self._cache = None  # (各文件大小, 列数据, 座位名称列表)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_seats(self):
+        try:
+            with open(self._file('seats.txt'), 'r', encoding='utf-8') as f:
+                return f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def _row_count(self):
+        """各列文件中完整的行数（写入中断时以最短的列为准）"""
+        counts = []
+        for name, code in COLUMNS:
+            try:
+                size = os.path.getsize(self._file(f"{name}.bin"))
+            except FileNotFoundError:
+                size = 0
+            counts.append(size // array(code).itemsize)
+        return min(counts)
+
+    def record(self, date_str, time_index, seats, lead_minutes=0):
+        """
+        记录一次座位网格观察
+
+        参数:
+            date_str: 预约日期 YYYY-MM-DD
+            time_index: 时间段索引
+            seats: 快照中的座位记录 [[data-id, 编号, 状态码, ...], ...]
+            lead_minutes: 观察时距时段开始的分钟数
+
+        返回:
+            新增的行数
+        """
+        day = day_number(date_str)
+        lead = min(max(int(lead_minutes), 0), MAX_LEAD)
+        added = 0
+        for seat in seats:
+            name = seat_name(seat)
+            key = (day, time_index, name)
+            state = seat[SEAT_STATE]
+            if not name or self.last_state.get(key) == state:
+                continue
+            self.last_state[key] = state
+            self.pending.append((day, time_index, name, state, lead))
+            added += 1
+        if len(self.pending) >= self.batch_rows:
+            self.flush()
+        return added
+
+    def flush(self):
+        """把缓存的行追加到列文件，返回写入的行数"""
+        rows, self.pending = self.pending, []
+        if not rows:
+            return 0
+        os.makedirs(self.path, exist_ok=True)
+        with file_lock(self.lock_path):
+            names = self._read_seats()
+            codes = {name: code for code, name in enumerate(names)}
+            new_names = []
+            for row in rows:
+                if row[2] not in codes:
+                    codes[row[2]] = len(names) + len(new_names)
+                    new_names.append(row[2])
+            if new_names:
+                with open(self._file('seats.txt'), 'a', encoding='utf-8') as f:
+                    f.write(''.join(name + '\n' for name in new_names))
+
+            count = self._row_count()
+            for position, (name, code) in enumerate(COLUMNS):
+                column = array(code, (codes[row[2]] if name == 'seat' else row[position] for row in rows))
+                with open(self._file(f"{name}.bin"), 'ab') as f:
+                    f.truncate(count * column.itemsize)  # 丢弃上次中断写入的不完整行
+                    column.tofile(f)
+        return len(rows)
+
+    def load(self):
+        """
+        读取全部历史（文件未变化时直接返回缓存）
+
+        返回:
+            (列数据 {列名: array}, 座位名称列表)
+        """
+        try:
+            sizes = tuple(os.path.getsize(self._file(f"{name}.bin")) for name, code in COLUMNS)
+        except FileNotFoundError:
+            return {name: array(code) for name, code in COLUMNS}, []
+        if self._cache and self._cache[0] == sizes:
+            return self._cache[1], self._cache[2]
+        with file_lock(self.lock_path):
+            count = self._row_count()
+            columns = {}
+            for name, code in COLUMNS:
+                column = array(code)
+                with open(self._file(f"{name}.bin"), 'rb') as f:
+                    column.fromfile(f, count)
+                columns[name] = column
+            names = self._read_seats()
+        self._cache = (sizes, columns, names)
+        return columns, names
+
+    def rows(self, seat=None, slot=None, weekday=None, since=None, until=None):
+        """
+        按条件筛选历史记录
+
+        参数:
+            seat: 座位编号或data-id
+            slot: 时间段索引
+            weekday: 星期（0为周一）
+            since / until: 日期范围 YYYY-MM-DD（含两端）
+
+        返回:
+            生成器: (日期 YYYY-MM-DD, 时间段, 座位, 状态码, 分钟数)
+        """
+        columns, names = self.load()
+        seat_code = None
+        if seat is not None:
+            if seat not in names:
+                return
+            seat_code = names.index(seat)
+        first = day_number(since) if since else 0
+        last = day_number(until) if until else MAX_LEAD
+        dates = {}
+        for day, slot_index, code, state, lead in zip(*(columns[name] for name, _ in COLUMNS)):
+            if (seat_code is not None and code != seat_code) or (slot is not None and slot_index != slot) \
+                    or not first <= day <= last:
+                continue
+            date = dates.get(day)
+            if date is None:
+                date = dates[day] = day_date(day)
+            if weekday is not None and date.weekday() != weekday:
+                continue
+            yield date.isoformat(), slot_index, names[code], state, lead
+
+    def _by_day(self, states=BOOKED_STATES, **filters):
+        """按（日期, 时间段, 座位）汇总：是否被预约过（状态码在states中），以及最早观察到被预约时距开始的分钟数"""
+        observed = {}
+        for date, slot, seat, state, lead in self.rows(**filters):
+            key = (date, slot, seat)
+            booked_lead = observed.get(key)
+            if state in states:
+                observed[key] = lead if booked_lead is None else max(booked_lead, lead)
+            else:
+                observed.setdefault(key, None)
+        return observed
+
+    def seat_history(self, seat, slot=None, weekday=None, since=None, until=None):
+        """
+        座位被预约的频率和提前量，例如 seat_history('A101', slot=3, weekday=0)
+
+        返回:
+            dict: {'days': 观察到的天数（按日期和时间段计）, 'booked': 被预约的天数, 'rate': 被预约比例,
+                   'median_lead': 被预约时通常提前多少分钟已被预约, 'max_lead': 最早提前多少分钟已被预约}
+        """
+        observed = self._by_day(seat=seat, slot=slot, weekday=weekday, since=since, until=until)
+        leads = sorted(lead for lead in observed.values() if lead is not None)
+        return {
+            'days': len(observed),
+            'booked': len(leads),
+            'rate': round(len(leads) / len(observed), 3) if observed else 0.0,
+            'median_lead': leads[len(leads) // 2] if leads else None,
+            'max_lead': leads[-1] if leads else None,
+        }
+
+    def booked_rates(self, slot=None, weekday=None, since=None, until=None, states=BOOKED_STATES):
+        """
+        各座位被预约的比例
+
+        参数:
+            states: 视为被预约的状态码，只统计他人预约时传入 BOOKED_BY_OTHERS
+
+        返回:
+            dict: 座位 -> (被预约的天数, 观察到的天数)
+        """
+        result = {}
+        for (date, slot_index, seat), lead in self._by_day(states, slot=slot, weekday=weekday, since=since, until=until).items():
+            booked, days = result.get(seat, (0, 0))
+            result[seat] = (booked + (lead is not None), days + 1)
+        return result
+
+    def slot_stats(self, weekday=None, since=None, until=None, states=BOOKED_STATES):
+        """
+        各时间段的紧张程度：每天观察到的座位中被预约的比例的平均值
+
+        参数:
+            states: 视为被预约的状态码，只统计他人预约时传入 BOOKED_BY_OTHERS
+
+        返回:
+            dict: 时间段 -> (被预约比例 0-1, 观察到的天数)
+        """
+        per_day = {}
+        for (date, slot, seat), lead in self._by_day(states, weekday=weekday, since=since, until=until).items():
+            booked, seats = per_day.get((date, slot), (0, 0))
+            per_day[(date, slot)] = (booked + (lead is not None), seats + 1)
+        totals = {}
+        for (date, slot), (booked, seats) in per_day.items():
+            total, days = totals.get(slot, (0.0, 0))
+            totals[slot] = (total + booked / seats, days + 1)
+        return {slot: (round(total / days, 3), days) for slot, (total, days) in sorted(totals.items())}
+
+    def slot_pressure(self, weekday=None, since=None, until=None):
+        """
+        各时间段的紧张程度
+
+        返回:
+            dict: 时间段 -> 被预约比例（0-1）
+        """
+        return {slot: pressure for slot, (pressure, days) in self.slot_stats(weekday, since, until).items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="座位占用历史查询")
+    parser.add_argument('--path', default='occupancy', help="占用历史目录")
+    parser.add_argument('--slot', type=int, help="时间段索引")
+    parser.add_argument('--weekday', type=int, choices=range(7), help="星期（0为周一）")
+    parser.add_argument('--since', help="开始日期 YYYY-MM-DD")
+    parser.add_argument('--until', help="结束日期 YYYY-MM-DD")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    seat_parser = subparsers.add_parser('seat', help="某个座位被预约的频率和提前量")
+    seat_parser.add_argument('seat', help="座位编号或data-id")
+    top_parser = subparsers.add_parser('top', help="最常被预约的座位")
+    top_parser.add_argument('--limit', type=int, default=20)
+    subparsers.add_parser('slots', help="各时间段的紧张程度")
+
+    args = parser.parse_args(argv)
+    store = OccupancyStore(args.path)
+    filters = {'weekday': args.weekday, 'since': args.since, 'until': args.until}
+    scope = (f"第{args.slot}个时段" if args.slot is not None else "所有时段") + \
+            (f" 周{WEEKDAYS[args.weekday]}" if args.weekday is not None else "")
+
+    if args.command == 'seat':
+        stats = store.seat_history(args.seat, slot=args.slot, **filters)
+        print(f"{args.seat} {scope}: 观察{stats['days']}次，被预约{stats['booked']}次（{stats['rate']:.0%}）")
+        if stats['booked']:
+            print(f"  通常在开始前{stats['median_lead']}分钟已被预约，最早在开始前{stats['max_lead']}分钟")
+    elif args.command == 'top':
+        rates = store.booked_rates(slot=args.slot, **filters)
+        ranked = sorted(rates.items(), key=lambda item: (-item[1][0] / item[1][1], item[0]))
+        print(scope)
+        for seat, (booked, days) in ranked[:args.limit]:
+            print(f"  {seat:<10} {booked}/{days} ({booked / days:.0%})")
+    else:
+        for slot, pressure in store.slot_pressure(**filters).items():
+            print(f"第{slot}个时段: {pressure:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s')
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import time
+import logging
+from selenium.webdriver.common.by import By
+from seat_status import SeatStatusHandler
+from tracing import record_span
+
+# 预约结果提示（成功 / 失败）
+SUCCESS_XPATH = "//div[contains(text(), '成功') or contains(text(), '预约成功')]"
+FAILURE_XPATH = ("//div[contains(text(), '失败') or contains(text(), '已被预约') or contains(text(), '已被占用')"
+                 " or contains(text(), '不可预约') or contains(text(), '错误')]")
+
+# 页面中按XPath查找所有匹配元素
+MATCHES_JS = """
+function matches(xpath) {
+    var r = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null), nodes = [];
+    for (var i = 0; i < r.snapshotLength; i++) { nodes.push(r.snapshotItem(i)); }
+    return nodes;
+}
+"""
+
+# 点击确定：先记下页面上已有的失败字样（例如图例），再点击；标记在页面重新加载后消失
+CONFIRM_SCRIPT = MATCHES_JS + """
+window.__parallelConfirm = {before: matches(arguments[1])};
+arguments[0].click();
+"""
+
+# 一次判断确认结果：success / failure（新出现的可见失败提示）/ grid（页面已重新加载回座位网格），未出结果时返回null
+VERIFY_SCRIPT = MATCHES_JS + """
+if (matches(arguments[0]).length) { return {status: 'success'}; }
+var state = window.__parallelConfirm;
+if (!state) {
+    return document.querySelector('div.grid-cell-container') ? {status: 'grid'} : null;
+}
+var failures = matches(arguments[1]);
+for (var i = 0; i < failures.length; i++) {
+    var el = failures[i];
+    if (state.before.indexOf(el) < 0 && (el.offsetWidth || el.offsetHeight || el.getClientRects().length)) {
+        return {status: 'failure', message: el.textContent.trim().slice(0, 100)};
+    }
+}
+return null;
+"""
+
+class ParallelReserve:
+    """在同一个已登录浏览器的多个标签页中同时推进多个时间段的预约"""
+
+    # 每个时段依次经过的阶段
+    PHASES = ('area', 'eastC', 'seat', 'confirm', 'verify')
+
+    def __init__(self, reserver, max_concurrency=3, phase_timeout=20, max_retries=2):
+        """
+        初始化并行预约
+
+        参数:
+            reserver: 已登录的LibraryReserve实例（共享其浏览器和配置）
+            max_concurrency: 同时打开的标签页数量上限
+            phase_timeout: 单个阶段的超时时间（秒）
+            max_retries: 单个时段的最大重试次数
+        """
+        self.reserver = reserver
+        self.driver = reserver.driver
+        self.callback = reserver.callback
+        self.config = reserver.config
+        self.max_concurrency = max(1, max_concurrency)
+        self.phase_timeout = phase_timeout
+        self.max_retries = max_retries
+
+    def _find_clickable(self, xpath):
+        """非阻塞查找可点击元素，未就绪时返回None"""
+        for element in self.driver.find_elements(By.XPATH, xpath):
+            if element.is_displayed() and element.is_enabled():
+                return element
+        return None
+
+    def _open_tab(self, time_index):
+        """为时段打开新标签页，不等待页面加载"""
+        url = self.reserver.build_reservation_url(time_index)
+        if not url:
+            return None
+        before = set(self.driver.window_handles)
+        self.driver.execute_script("window.open(arguments[0], '_blank');", url)
+        new_handles = [h for h in self.driver.window_handles if h not in before]
+        if not new_handles:
+            return None
+        return {
+            'slot': time_index,
+            'url': url,
+            'handle': new_handles[0],
+            'phase': 'area',
+            'deadline': time.time() + self.phase_timeout,
+            'retries': 0,
+            'phase_started': time.perf_counter(),
+            'coordinator': self.reserver.get_seat_coordinator(time_index),
+        }
+
+    def _advance(self, task, phase):
+        self._record_phase(task)
+        task['phase'] = phase
+        task['deadline'] = time.time() + self.phase_timeout
+
+    def _record_phase(self, task):
+        """记录标签页当前阶段的耗时（从进入该阶段到完成）"""
+        now = time.perf_counter()
+        record_span(f"parallel.{task['phase']}", task['phase_started'], now - task['phase_started'],
+                    {'user': self.reserver.user_key, 'slot': task['slot'], 'retry': task['retries']})
+        task['phase_started'] = now
+
+    def _retry(self, task, reason):
+        """重新加载标签页并从头开始，超过重试次数返回False"""
+        if task['coordinator']:
+            task['coordinator'].release()
+        self._record_phase(task)
+        task['retries'] += 1
+        if task['retries'] > self.max_retries:
+            self.callback(f"第{task['slot']}个时段预约失败: {reason}")
+            return False
+        self.callback(f"第{task['slot']}个时段{reason}，将进行第{task['retries']}次重试...")
+        self.driver.execute_script("window.location.href = arguments[0];", task['url'])
+        task['phase'] = 'area'
+        task['deadline'] = time.time() + self.phase_timeout
+        return None
+
+    def _step(self, task):
+        """
+        推进单个标签页的预约状态
+
+        返回:
+            True/False: 该时段已完成（成功/失败）
+            None: 尚未完成
+        """
+        slot = task['slot']
+        phase = task['phase']
+
+        if time.time() > task['deadline']:
+            return self._retry(task, f"在{phase}阶段超时")
+
+        if phase in ('area', 'eastC'):
+            if self.driver.execute_script('return document.readyState') != 'complete':
+                return None
+            element = self._find_clickable(self.config['selectArea' if phase == 'area' else 'eastC'])
+            if element is None:
+                return None
+            element.click()
+            self._advance(task, 'eastC' if phase == 'area' else 'seat')
+            return None
+
+        if phase == 'seat':
+            seat_handler = SeatStatusHandler(self.driver, self.callback, self.reserver.occupancy_observer(slot))
+            if not seat_handler.snapshot_grid()['seats']:
+                return None
+            try_alternatives = self.reserver.user_config.get('try_alternative_seats', True)
+            preferences = self.reserver.seat_preferences(slot)
+            success, status, _ = seat_handler.handle_seat_selection(
+                preferences['xpath'],
+                try_alternatives=try_alternatives,
+                max_retries=1,
+                preferences=preferences,
+                coordinator=task['coordinator']
+            )
+            self.reserver.note_seat(slot, seat_handler.selected if success else None)
+            if status == 2:
+                self.callback(f"第{slot}个时段座位已被您预约，视为成功")
+                return True
+            if not success:
+                logging.warning(f"时间段{slot}预约失败，座位状态码: {status}")
+                return self._retry(task, "座位选择失败")
+            self._advance(task, 'confirm')
+            return None
+
+        if phase == 'confirm':
+            element = self._find_clickable(self.config['confirmButton'])
+            if element is None:
+                return None
+            self.driver.execute_script(CONFIRM_SCRIPT, element, FAILURE_XPATH)
+            self._advance(task, 'verify')
+            return None
+
+        if phase == 'verify':
+            outcome = self.driver.execute_script(VERIFY_SCRIPT, SUCCESS_XPATH, FAILURE_XPATH)
+            if outcome is None:
+                return None
+            if outcome['status'] == 'success':
+                if task['coordinator']:
+                    task['coordinator'].commit()
+                self.callback(f"第{slot}个时段预约成功")
+                return True
+            # 确认失败或页面回到座位网格时立即重试，不等待阶段超时
+            if outcome['status'] == 'failure':
+                return self._retry(task, f"确认失败（{outcome['message']}）")
+            return self._retry(task, "确认后回到了座位页面")
+
+        return False
+
+    def run(self, slot_indices):
+        """
+        并行预约多个时间段
+
+        参数:
+            slot_indices: 需要预约的时间段索引列表
+
+        返回:
+            dict: 时间段索引 -> 是否预约成功
+        """
+        for key in ('selectArea', 'eastC', 'confirmButton'):
+            if key not in self.config:
+                self.callback(f"错误: 配置中缺少{key}")
+                return {i: False for i in slot_indices}
+
+        self.callback(f"并行预约{len(slot_indices)}个时段，最多同时打开{self.max_concurrency}个标签页")
+        origin_handle = self.driver.current_window_handle
+        pending = list(slot_indices)
+        active = []
+        results = {}
+
+        try:
+            while pending or active:
+                if self.reserver.should_stop:
+                    self.callback("操作已终止，停止并行预约")
+                    break
+
+                # 按并发上限打开新的标签页
+                while pending and len(active) < self.max_concurrency:
+                    time_index = pending.pop(0)
+                    task = self._open_tab(time_index)
+                    if task is None:
+                        self.callback(f"无法为第{time_index}个时段打开预约页面")
+                        results[time_index] = False
+                    else:
+                        active.append(task)
+
+                # 轮询每个标签页，只在页面就绪时执行下一步
+                progressed = False
+                for task in list(active):
+                    phase = task['phase']
+                    try:
+                        self.driver.switch_to.window(task['handle'])
+                        result = self._step(task)
+                    except Exception as e:
+                        logging.error(f"并行预约第{task['slot']}个时段出错: {e}")
+                        try:
+                            result = self._retry(task, "出错")
+                        except Exception:
+                            result = False
+
+                    if result is not None:
+                        if result:
+                            self._record_phase(task)
+                        results[task['slot']] = result
+                        if result:
+                            self.reserver.record_checkpoint(task['slot'], task['coordinator'])
+                        active.remove(task)
+                        try:
+                            self.driver.close()
+                        except Exception:
+                            pass
+                        progressed = True
+                    elif task['phase'] != phase:
+                        progressed = True
+
+                if not progressed:
+                    time.sleep(0.1)
+        finally:
+            # 关闭剩余标签页并切回原窗口
+            for task in active:
+                try:
+                    self.driver.switch_to.window(task['handle'])
+                    self.driver.close()
+                except Exception:
+                    pass
+            try:
+                self.driver.switch_to.window(origin_handle)
+            except Exception:
+                pass
+
+        for time_index in slot_indices:
+            results.setdefault(time_index, False)
+        return results
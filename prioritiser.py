@@ -0,0 +1,108 @@
+import datetime
+import logging
+
+from occupancy_store import OccupancyStore, BOOKED_BY_OTHERS
+
+# 某个条件下至少观察到这么多天才使用历史排序，否则退回静态顺序
+MIN_DAYS = 3
+
+# 被预约比例不低于该值的座位视为总被抢先预约，不再尝试
+SKIP_RATE = 0.9
+
+# 只使用最近多少天的历史
+HISTORY_DAYS = 120
+
+class Prioritiser:
+    """
+    根据本地座位占用历史（OccupancyStore）排列时间段和座位的尝试顺序
+
+    紧张的时间段（同一星期几被他人预约的比例高）先预约；备选座位按被他人预约的比例从低到高尝试，
+    总被抢先预约的备选座位最后尝试。只统计他人的预约（自己常约的座位不会因此被降级），
+    首选座位空闲时总是优先选择。历史不足时保持配置中的静态顺序。
+    """
+
+    def __init__(self, store=None, date_str=None, min_days=MIN_DAYS, skip_rate=SKIP_RATE, history_days=HISTORY_DAYS):
+        """
+        初始化排序器
+
+        参数:
+            store: OccupancyStore，默认为 occupancy/ 目录
+            date_str: 预约目标日期 YYYY-MM-DD（按该日期的星期几查询历史），None表示不区分星期
+            min_days: 使用历史排序所需的最少观察天数
+            skip_rate: 跳过座位的被预约比例下限
+            history_days: 只使用最近多少天的历史
+        """
+        self.store = store or OccupancyStore()
+        self.date = date_str
+        self.weekday = datetime.date.fromisoformat(date_str).weekday() if date_str else None
+        self.min_days = min_days
+        self.skip_rate = skip_rate
+        self.since = (datetime.date.today() - datetime.timedelta(days=history_days)).isoformat()
+        self._seat_rates = {}
+
+    def _scoped(self, query):
+        """先按星期几查询，观察天数不足时不区分星期"""
+        if self.weekday is not None:
+            result = query(self.weekday)
+            if result:
+                return result
+        return query(None)
+
+    def order_slots(self, slot_indices):
+        """
+        按时间段紧张程度从高到低排列（没有足够历史的时间段保持原来的相对顺序，排在有历史的时间段之后）
+
+        返回:
+            list: 排列后的时间段索引
+        """
+        slot_indices = list(slot_indices)
+
+        def query(weekday):
+            stats = self.store.slot_stats(weekday=weekday, since=self.since, states=BOOKED_BY_OTHERS)
+            pressure = {slot: rate for slot, (rate, days) in stats.items() if days >= self.min_days}
+            return pressure if any(slot in pressure for slot in slot_indices) else None
+
+        pressure = self._scoped(query)
+        if not pressure:
+            return slot_indices
+        position = {slot: i for i, slot in enumerate(slot_indices)}
+        return sorted(slot_indices, key=lambda slot: (slot not in pressure, -pressure.get(slot, 0), position[slot]))
+
+    def seat_rates(self, time_index):
+        """时间段中各座位被他人预约的比例 {座位: 比例}（只包含观察天数足够的座位）"""
+        rates = self._seat_rates.get(time_index)
+        if rates is None:
+            def query(weekday):
+                counts = self.store.booked_rates(slot=time_index, weekday=weekday, since=self.since,
+                                                 states=BOOKED_BY_OTHERS)
+                return {seat: booked / days for seat, (booked, days) in counts.items() if days >= self.min_days}
+
+            rates = self._seat_rates[time_index] = self._scoped(query) or {}
+        return rates
+
+    def order_seats(self, time_index, preferences, preferred_key=None):
+        """
+        按历史调整备选座位的顺序（首选座位不受影响，空闲时总是先选首选座位）
+
+        参数:
+            time_index: 时间段索引
+            preferences: parse_seat_preferences返回的座位偏好配置
+            preferred_key: 首选座位的编号或data-id
+
+        返回:
+            dict: 新的座位偏好配置，备选座位按被他人预约的比例从低到高排列并去掉总被抢先预约的座位；
+                  avoid 为总被抢先预约的座位（选替代座位时最后考虑）
+        """
+        rates = self.seat_rates(time_index)
+        if not rates:
+            return preferences
+        order = preferences.get('preferences', [])
+        kept = [key for key in order if rates.get(key, 0) < self.skip_rate]
+        position = {key: i for i, key in enumerate(kept)}
+        result = dict(preferences)
+        result['preferences'] = sorted(kept, key=lambda key: (round(rates.get(key, 0), 1), position[key]))
+        result['avoid'] = sorted(seat for seat, rate in rates.items() if rate >= self.skip_rate and seat != preferred_key)
+        skipped = [key for key in order if key not in position]
+        if skipped:
+            logging.info(f"第{time_index}个时段跳过总被抢先预约的座位: {'、'.join(skipped)}")
+        return result
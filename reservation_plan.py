@@ -0,0 +1,147 @@
+import datetime
+from urllib.parse import quote
+
+from utils import APP_INDEX_URL
+from seat_coordinator import slot_key
+from config_handler import FrozenDict
+
+# 默认时间段表（可在预约配置的 slot_table 中覆盖，索引从1开始按顺序编号）
+DEFAULT_SLOT_TABLE = (
+    ('08:00', '09:59'),
+    ('10:00', '11:59'),
+    ('12:30', '14:29'),
+    ('14:30', '16:19'),
+    ('16:20', '18:19'),
+    ('18:20', '20:19'),
+    ('20:20', '22:00'),
+)
+
+# 预约场所参数（可在预约配置或用户配置的 place 中覆盖部分字段）
+DEFAULT_PLACE = {
+    'DEPT_CODE': '423',
+    'DEPT_NAME': '信息科学与技术学院',
+    'PALCE_ID': 'fb9dedd807fc48a59dc19338a50ea099',
+    'SCHOOL_DISTRICT_CODE': '1',
+    'SCHOOL_DISTRICT': '东校区',
+    'LOCATION': '二层、三层',
+    'PLACE_NAME': '东校区数字化图书馆',
+}
+
+def target_date_str(days_ahead=2, now=None):
+    """提前days_ahead天的预约日期（YYYY-MM-DD）"""
+    return ((now or datetime.datetime.now()) + datetime.timedelta(days=days_ahead)).strftime('%Y-%m-%d')
+
+def parse_slot_table(value=None):
+    """
+    解析时间段表
+
+    参数:
+        value: [{"start": "08:00", "end": "09:59"}, ...] 或 [["08:00", "09:59"], ...]，None时使用默认表
+
+    返回:
+        tuple: ((索引, 开始 HH:MM, 结束 HH:MM), ...)
+    """
+    rows = value or DEFAULT_SLOT_TABLE
+    table = []
+    for index, row in enumerate(rows, start=1):
+        start, end = (row['start'], row['end']) if isinstance(row, dict) else row
+        for text in (start, end):
+            datetime.datetime.strptime(text, '%H:%M')  # 格式错误时抛出ValueError
+        table.append((index, start, end))
+    return tuple(table)
+
+def slot_table_for(config):
+    """预约配置中的时间段表（没有配置时为默认表）"""
+    return parse_slot_table(config.get('slot_table') if config else None)
+
+class SlotSpec:
+    """一个时间段在某一天的预约参数（只读，key 与座位认领表、检查点使用的时段键一致）"""
+
+    __slots__ = ('index', 'date', 'start', 'end', 'key', 'time_area', 'params', 'url')
+
+    def __init__(self, index, date, start, end, params, url):
+        values = (index, date, start, end, slot_key(date, index), f"{start}-{end}", params, url)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SlotSpec是只读的")
+
+    def __repr__(self):
+        return f"SlotSpec({self.key} {self.time_area})"
+
+    def start_datetime(self):
+        """时间段的开始时刻"""
+        return datetime.datetime.strptime(f"{self.date} {self.start}", '%Y-%m-%d %H:%M')
+
+class ReservationPlan:
+    """一个用户在目标日期的所有时间段预约参数（只读，URL已预先生成）"""
+
+    __slots__ = ('user_key', 'date', 'days_ahead', 'slots', '_by_index')
+
+    def __init__(self, user_key, date, days_ahead, slots):
+        values = (user_key, date, days_ahead, tuple(slots), {slot.index: slot for slot in slots})
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ReservationPlan是只读的")
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def indices(self):
+        """所有时间段索引"""
+        return [slot.index for slot in self.slots]
+
+    def get(self, index):
+        """时间段索引对应的SlotSpec，不存在时返回None"""
+        return self._by_index.get(index)
+
+def compile_plan(view, days_ahead=2, now=None):
+    """
+    根据用户配置和时间段表生成预约计划
+
+    参数:
+        view: 用户的预约配置视图（ConfigView）
+        days_ahead: 提前预约的天数
+        now: 当前时间，默认为datetime.now()
+
+    返回:
+        ReservationPlan；用户配置缺少必填项时抛出KeyError，时间段表格式错误时抛出ValueError
+    """
+    user = view.user
+    if user is None:
+        raise KeyError(f"找不到用户 {view.user_key} 的预约配置")
+    date = target_date_str(days_ahead, now)
+    place = dict(DEFAULT_PLACE)
+    place.update(view.config.get('place', {}))
+    place.update(user.get('place', {}))
+    base_url = view.config.get('app_url', APP_INDEX_URL) + "#/seatdetail?"
+
+    slots = []
+    for index, start, end in slot_table_for(view.config):
+        params = {
+            'USER_ID': user['username'],
+            'USER_NAME': user['real_name'],
+            'DEPT_CODE': place['DEPT_CODE'],
+            'DEPT_NAME': place['DEPT_NAME'],
+            'PHONE_NUMBER': user['phone_number'],
+            'PALCE_ID': place['PALCE_ID'],
+            'BEGINNING_DATE': f"{date} {start}",
+            'ENDING_DATE': f"{date} {end}",
+            'SCHOOL_DISTRICT_CODE': place['SCHOOL_DISTRICT_CODE'],
+            'SCHOOL_DISTRICT': place['SCHOOL_DISTRICT'],
+            'LOCATION': place['LOCATION'],
+            'PLACE_NAME': place['PLACE_NAME'],
+            'IS_CANCELLED': '0',
+            'APPLY_DATE': date,
+            'APPLY_TIME_AREA': f"{start}-{end}",
+        }
+        url = base_url + "&".join(f"{key}={quote(str(value), safe='')}" for key, value in params.items())
+        slots.append(SlotSpec(index, date, start, end, FrozenDict(params), url))
+    return ReservationPlan(view.user_key, date, days_ahead, slots)
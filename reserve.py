@@ -1,17 +1,29 @@
-import json
 import datetime
 import os
 import sys
 import time
 import logging
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from seat_status import SeatStatusHandler
+from seat_ranking import SeatIndex, parse_seat_preferences, preferred_seat_key, SEAT_ID, SEAT_LABEL, SEAT_STATE
+from http_engine import HttpReserveEngine
+from utils import wait_until, click_and_await
 from auth import Authentication
+from parallel_reserve import ParallelReserve
+from tracing import span, traced
+from config_handler import ConfigHandler, ConfigView, FrozenDict
+from events import OPERATION, FINISH, ACTIVE, COMPLETED, ERROR
+from seat_coordinator import SeatClaimTable, SeatCoordinator, slot_key
+from checkpoint_store import CheckpointStore
+from occupancy_store import OccupancyStore
+from prioritiser import Prioritiser
+from seat_watcher import SeatWatcher
+from reservation_plan import compile_plan, target_date_str
 
 class LibraryReserve:
-    def __init__(self, driver=None, user_key=None, config_path='reserveConfig.json', callback=None, headless=False):
+    def __init__(self, driver=None, user_key=None, config_path='reserveConfig.json', callback=None, headless=False, driver_pool=None, session_store=None,
+                 event_bus=None, config_view=None):
         """
         初始化图书馆预约类
         
@@ -20,54 +32,56 @@ class LibraryReserve:
             user_key: 用户配置键名
             config_path: 配置文件路径
             callback: 回调函数，用于报告状态更新
+            driver_pool: 预热的WebDriver池，未提供driver时从池中获取浏览器
+            session_store: 共享的会话Cookie缓存，为None时使用默认的本地缓存
+            event_bus: 发布步骤事件的EventBus，默认为events.default_bus
+            config_view: 用户的只读配置视图（ConfigHandler.view），提供时忽略user_key和config_path
         """
-        self.user_key = user_key
         self.callback = callback or (lambda msg: None)  # 默认回调为空函数
         
-        # 加载配置
-        try:
-            with open(self.resource_path(config_path), 'r', encoding='utf-8') as f:
-                self.config = json.load(f)
-            self.callback(f"成功加载预约配置文件")
-        except Exception as e:
-            error_msg = f"加载预约配置文件失败: {e}"
-            self.callback(error_msg)
-            logging.error(error_msg)
-            self.config = {}
+        # 从共享的配置服务获取配置（文件未修改时不会重新解析）
+        if config_view is None:
+            try:
+                config_view = ConfigHandler.shared().view('reserve', user_key, config_path)
+                self.callback(f"成功加载预约配置文件")
+            except Exception as e:
+                error_msg = f"加载预约配置文件失败: {e}"
+                self.callback(error_msg)
+                logging.error(error_msg)
+                config_view = ConfigView(config_path, 'reserve', user_key, FrozenDict(), None)
+        self.view = config_view
+        self.user_key = config_view.user_key
+        self.config = config_view.config
         
         # 初始化认证模块
-        self.auth = Authentication(driver=driver, config_path=config_path, user_key=user_key, headless=headless)
+        self.auth = Authentication(driver=driver, headless=headless, session_store=session_store,
+                                   driver_pool=driver_pool, event_bus=event_bus, config_view=config_view)
         self.driver = self.auth.driver
+        self.events = self.auth.events
         
         # 检查用户配置
-        try:
-            if 'reserveUrl' in self.config and user_key in self.config['reserveUrl']:
-                self.user_config = self.config['reserveUrl'][user_key]
-                self.callback(f"成功加载用户 {user_key} 的预约配置")
-            else:
-                error_msg = f"错误: 在配置中找不到用户 {user_key} 的预约配置"
-                self.callback(error_msg)
-                logging.error(error_msg)
-                self.user_config = None
-        except Exception as e:
-            error_msg = f"加载用户 {user_key} 预约配置时出错: {e}"
+        self.user_config = config_view.user
+        if self.user_config is not None:
+            self.callback(f"成功加载用户 {self.user_key} 的预约配置")
+        else:
+            error_msg = f"错误: 在配置中找不到用户 {self.user_key} 的预约配置"
             self.callback(error_msg)
             logging.error(error_msg)
-            self.user_config = None
-        
-        # 预约时间段设置
-        self.index_arr = [
-            [],
-            [["08", "00"], ["09", "59"]],
-            [["10", "00"], ["11", "59"]],
-            [["12", "30"], ["14", "29"]],
-            [["14", "30"], ["16", "19"]],
-            [["16", "20"], ["18", "19"]],
-            [["18", "20"], ["20", "19"]],
-            [["20", "20"], ["22", "00"]]
-        ]
+        
+        # 预约计划（由配置和时间段表生成，目标日期变化时重新生成）
+        self.days_ahead = 2
+        self.plan = None
         
         self.should_stop = False
+        self.slot_indices = None  # 只预约指定的时间段，None表示全部
+        self.slot_results = {}
+        self.slot_dates = {}  # 时间段索引 -> 最近一次构建参数时的预约日期
+        self.slot_seats = {}  # 时间段索引 -> 选中（预约成功时即预约到）的座位data-id，签到时使用
+        self.seat_claims = None  # 多用户共享的座位认领表
+        self.checkpoints = None  # 已确认预约结果的检查点
+        self.occupancy = None  # 座位占用历史
+        self.prioritiser = None  # 按占用历史排列时间段和座位
+        self.http_engine = None
     
     def stop_operation(self):
         """终止当前操作"""
@@ -87,264 +101,665 @@ class LibraryReserve:
             
         return os.path.join(base_path, relative_path)
 
-    def build_reservation_url(self, time_index):
+    def validate_reserve_config(self):
+        """检查预约流程所需的配置项"""
+        if not self.user_config:
+            self.callback("错误: 缺少用户配置")
+            return False
+        for key in ('selectArea', 'eastC', 'confirmButton'):
+            if key not in self.config:
+                self.callback(f"错误: 配置中缺少{key}")
+                return False
+        if 'seat_xpath' not in self.user_config:
+            self.callback("错误: 用户配置中缺少seat_xpath")
+            return False
+        return True
+
+    def open_seat_page(self, reservation_url):
         """
-        构建预约URL
+        打开预约页面并依次选择区域和东C，进入座位选择页面
         
         参数:
-            time_index: 时间段索引 (1-7)
+            reservation_url: 时间段预约URL
+        """
+        self.navigate_to_slot(reservation_url)
+        self.select_area()
+
+    @traced('reserve.navigate')
+    def navigate_to_slot(self, reservation_url):
+        """打开时间段预约页面并等待加载完成"""
+        self.driver.get(reservation_url)
+        # 等待页面加载完成（JS渲染由后续步骤等待具体元素）
+        self.auth.wait_for_page_load(timeout=30)
+
+    @traced('reserve.select_area')
+    def select_area(self):
+        """依次点击区域选择和东C，进入座位网格"""
+        select_area = wait_until(
+            self.driver, EC.element_to_be_clickable((By.XPATH, self.config['selectArea'])),
+            timeout=20, name='select_area'
+        )
+        self.callback("找到区域选择按钮")
+        
+        # 点击后直接等待东C选项可点击（每次重新查找元素，避免stale元素）
+        east_c = click_and_await(
+            self.driver, select_area,
+            EC.element_to_be_clickable((By.XPATH, self.config['eastC'])),
+            timeout=20, name='east_c'
+        )
+        self.callback("找到东C选项")
+        
+        # 点击后等待座位网格出现
+        click_and_await(
+            self.driver, east_c,
+            EC.presence_of_element_located((By.CSS_SELECTOR, 'div.grid-cell-container')),
+            timeout=20, name='seat_grid_render'
+        )
+
+    @traced('reserve.select_seat')
+    def select_seat(self, coordinator=None, time_index=None):
+        """
+        在座位页面选择首选座位（或替代座位）
+        
+        参数:
+            coordinator: SeatCoordinator，与同时预约的其他用户协调座位
+            time_index: 时间段索引，提供时把观察到的座位网格写入占用历史
         
         返回:
-            str: 预约URL
+            (成功标志, 座位状态码, 使用的座位XPath)
+        """
+        preferences = self.seat_preferences(time_index)
+        preferred_seat_xpath = preferences['xpath']
+        self.callback(f"首选座位位置: {preferred_seat_xpath}")
+        
+        # 使用座位状态处理器
+        seat_handler = SeatStatusHandler(self.driver, self.callback, self.occupancy_observer(time_index))
+        
+        # 获取是否允许尝试替代座位的配置
+        try_alternatives = self.user_config.get('try_alternative_seats', True)
+        
+        result = seat_handler.handle_seat_selection(
+            preferred_seat_xpath, 
+            try_alternatives=try_alternatives,
+            preferences=preferences,
+            coordinator=coordinator
+        )
+        if time_index is not None:
+            self.note_seat(time_index, seat_handler.selected if result[0] else None)
+        return result
+
+    @traced('reserve.confirm')
+    def confirm_reservation(self):
         """
+        点击确定按钮并检查预约结果
+        
+        返回:
+            bool: 是否出现预约成功提示
+        """
+        confirm_button = wait_until(
+            self.driver, EC.element_to_be_clickable((By.XPATH, self.config['confirmButton'])),
+            timeout=20, name='confirm_button'
+        )
+        
+        # 点击后直接等待成功提示出现
         try:
-            # 检查用户配置
-            if not self.user_config:
-                self.callback("错误: 缺少用户配置，无法构建预约URL")
-                return None
-                
-            # 获取两天后的日期
-            two_days_later = (datetime.datetime.now() + datetime.timedelta(days=2)).strftime('%Y-%m-%d')
-            
-            # 获取时间段
-            if time_index < 1 or time_index > 7:
-                self.callback(f"错误: 无效的时间段索引 {time_index}，有效范围是1-7")
-                return None
-                
-            time_slot = self.index_arr[time_index]
-            start_hour, start_min = time_slot[0]
-            end_hour, end_min = time_slot[1]
-            
-            # 构建URL
-            base_url = "https://webvpn3.hebau.edu.cn/https/77726476706e69737468656265737421f5ff40902b7e60557c099ce29d51367b21a6/qljfwapp/sys/lwAppointmentPublicPlace/*default/index.do"
-            
-            url = f"{base_url}#/seatdetail?USER_ID={self.user_config['username']}&USER_NAME={self.user_config['real_name']}&DEPT_CODE=423&DEPT_NAME=%E4%BF%A1%E6%81%AF%E7%A7%91%E5%AD%A6%E4%B8%8E%E6%8A%80%E6%9C%AF%E5%AD%A6%E9%99%A2&PHONE_NUMBER={self.user_config['phone_number']}&PALCE_ID=fb9dedd807fc48a59dc19338a50ea099"
-            url += f"&BEGINNING_DATE={two_days_later}%20{start_hour}%3A{start_min}&ENDING_DATE={two_days_later}%20{end_hour}%3A{end_min}"
-            url += f"&SCHOOL_DISTRICT_CODE=1&SCHOOL_DISTRICT=%E4%B8%9C%E6%A0%A1%E5%8C%BA&LOCATION=%E4%BA%8C%E5%B1%82%E3%80%81%E4%B8%89%E5%B1%82&PLACE_NAME=%E4%B8%9C%E6%A0%A1%E5%8C%BA%E6%95%B0%E5%AD%97%E5%8C%96%E5%9B%BE%E4%B9%A6%E9%A6%86"
-            url += f"&IS_CANCELLED=0&APPLY_DATE={two_days_later}&APPLY_TIME_AREA={start_hour}%3A{start_min}-{end_hour}%3A{end_min}"
-            
-            self.callback(f"构建了预约URL，时间段: {start_hour}:{start_min}-{end_hour}:{end_min}")
-            return url
-        except Exception as e:
-            error_msg = f"构建预约URL时出错: {e}"
-            self.callback(error_msg)
-            logging.error(error_msg)
-            return None
-    
+            click_and_await(
+                self.driver, confirm_button,
+                EC.presence_of_element_located((By.XPATH, "//div[contains(text(), '成功') or contains(text(), '预约成功')]")),
+                timeout=7, name='confirm_result'
+            )
+            return True
+        except:
+            # 如果找不到成功消息，检查页面状态
+            return "预约成功" in self.driver.page_source
+
     def reserve_single_time_slot(self, time_index):
         """
         预约单个时间段
         
         参数:
-            time_index: 时间段索引 (1-7)
+            time_index: 时间段索引（时间段表中的编号）
         
         返回:
             bool: 预约是否成功
         """
+        if not self.validate_reserve_config():
+            return False
+        
         max_retries = 2  # 最大重试次数
         retry_count = 0
         
         while retry_count <= max_retries:
-            try:
-                # 计算实际开始时间
-                start_time = 6 + time_index * 2
-                self.callback(f"开始预约第{time_index}个时段 ({start_time}点){' - 重试尝试' + str(retry_count) if retry_count > 0 else ''}")
-                
-                # 构建并打开预约URL
-                reservation_url = self.build_reservation_url(time_index)
-                if not reservation_url:
-                    self.callback(f"无法为第{time_index}个时段生成预约URL")
-                    return False
-                    
-                self.driver.get(reservation_url)
-                # 增加等待时间，确保页面完全加载
-                self.auth.wait_for_page_load(timeout=30)
-                # 额外短暂等待，确保JS渲染完成
-                time.sleep(2)
-                
-                # 选择区域
+            with span('reserve.slot', user=self.user_key, slot=time_index, retry=retry_count):
+                coordinator = None
                 try:
-                    if 'selectArea' not in self.config:
-                        self.callback("错误: 配置中缺少selectArea")
-                        return False
-                    
-                    # 使用更稳定的等待策略
-                    select_area = WebDriverWait(self.driver, 20).until(
-                        EC.element_to_be_clickable((By.XPATH, self.config['selectArea']))
-                    )
-                    self.callback("找到区域选择按钮")
-                    select_area.click()
-                    time.sleep(1)  # 短暂等待点击效果
-                    self.auth.wait_for_page_load()
-                    
-                    # 选择东C
-                    if 'eastC' not in self.config:
-                        self.callback("错误: 配置中缺少eastC")
-                        return False
-                    
-                    # 刷新元素引用，避免stale元素
-                    east_c = WebDriverWait(self.driver, 20).until(
-                        EC.element_to_be_clickable((By.XPATH, self.config['eastC']))
-                    )
-                    self.callback("找到东C选项")
-                    east_c.click()
-                    time.sleep(1)  # 短暂等待点击效果
-                    self.auth.wait_for_page_load()
-                    
-                    # 选择座位
-                    if 'seat_xpath' not in self.user_config:
-                        self.callback("错误: 用户配置中缺少seat_xpath")
+                    # 预约URL在预约计划中已生成，重试时直接复用
+                    spec = self.get_slot(time_index)
+                    reservation_url = spec.url if spec else None
+                    self.callback(f"开始预约第{time_index}个时段 ({spec.time_area if spec else '未知'}){' - 重试尝试' + str(retry_count) if retry_count > 0 else ''}")
+                
+                    # 打开预约URL
+                    if not reservation_url:
+                        self.callback(f"无法为第{time_index}个时段生成预约URL")
                         return False
-                    
-                    preferred_seat_xpath = self.user_config['seat_xpath']
-                    self.callback(f"首选座位位置: {preferred_seat_xpath}")
-                    
-                    # 使用座位状态处理器
-                    seat_handler = SeatStatusHandler(self.driver, self.callback)
-                    
-                    # 获取是否允许尝试替代座位的配置
-                    try_alternatives = self.user_config.get('try_alternative_seats', True)
-                    
-                    # 处理座位选择
-                    success, status, used_seat_xpath = seat_handler.handle_seat_selection(
-                        preferred_seat_xpath, 
-                        try_alternatives=try_alternatives
-                    )
-                    
+                
+                    # 进入座位页面并选择座位
+                    coordinator = self.get_seat_coordinator(time_index)
+                    self.open_seat_page(reservation_url)
+                    success, status, used_seat_xpath = self.select_seat(coordinator, time_index)
+                
                     # 根据座位状态进行不同处理
                     if status == 2:  # 座位已被自己预约
                         self.callback(f"第{time_index}个时段座位已被您预约，视为成功")
+                        self.record_checkpoint(time_index, coordinator)
                         return True
-                        
+                    
                     elif not success:  # 座位选择失败
                         if status == 3:  # 座位已被他人预约且无法找到替代座位
                             self.callback(f"第{time_index}个时段座位已被他人预约，且无法找到替代座位")
                         else:
                             self.callback(f"第{time_index}个时段座位选择失败")
-                        
+                    
                         # 记录详细原因到日志，以供后续分析
                         logging.warning(f"时间段{time_index}预约失败，座位状态码: {status}")
-                        
-                        retry_count += 1
-                        if retry_count <= max_retries:
-                            self.callback(f"将进行第{retry_count}次重试...")
-                            time.sleep(2)  # 短暂等待后重试
-                            continue
-                        else:
-                            return False
-                    
+                
                     # 点击确定
-                    if 'confirmButton' not in self.config:
-                        self.callback("错误: 配置中缺少confirmButton")
-                        return False
-                    
-                    # 再次刷新元素引用
-                    confirm_button = WebDriverWait(self.driver, 20).until(
-                        EC.element_to_be_clickable((By.XPATH, self.config['confirmButton']))
-                    )
-                    confirm_button.click()
-                    
-                    # 等待预约完成
-                    time.sleep(2)  # 确保操作完成
-                    self.auth.wait_for_page_load()
-                    
-                    # 验证预约是否成功
-                    try:
-                        # 查找可能的成功提示消息
-                        success_message = WebDriverWait(self.driver, 5).until(
-                            EC.presence_of_element_located((By.XPATH, "//div[contains(text(), '成功') or contains(text(), '预约成功')]"))
-                        )
-                        self.callback(f"第{time_index}个时段预约成功 ({start_time}点)")
+                    elif self.confirm_reservation():
+                        self.callback(f"第{time_index}个时段预约成功 ({spec.time_area})")
+                        if coordinator:
+                            coordinator.commit()
+                        self.record_checkpoint(time_index, coordinator)
                         return True
-                    except:
-                        # 如果找不到成功消息，检查页面状态
-                        if "预约成功" in self.driver.page_source:
-                            self.callback(f"第{time_index}个时段预约成功 ({start_time}点)")
-                            return True
-                        else:
-                            self.callback(f"未找到成功提示，可能预约失败")
-                            
-                            # 再次尝试
-                            retry_count += 1
-                            if retry_count <= max_retries:
-                                self.callback(f"将进行第{retry_count}次重试...")
-                                time.sleep(2)  # 短暂等待后重试
-                                continue
-                            else:
-                                return False
+                    else:
+                        self.callback(f"未找到成功提示，可能预约失败")
+                    if coordinator:
+                        coordinator.release()
                 except Exception as e:
                     error_msg = f"预约第{time_index}个时段过程中出错: {e}"
                     self.callback(error_msg)
                     logging.error(error_msg)
-                    
-                    retry_count += 1
-                    if retry_count <= max_retries:
-                        self.callback(f"将进行第{retry_count}次重试...")
-                        time.sleep(2)  # 短暂等待后重试
-                        continue
-                    else:
-                        return False
+                    if coordinator:
+                        coordinator.release()
+            
+            # 再次尝试
+            retry_count += 1
+            if retry_count <= max_retries:
+                self.callback(f"将进行第{retry_count}次重试...")
+                time.sleep(2)  # 短暂等待后重试
+        
+        return False  # 所有重试都失败
+
+    def get_plan(self):
+        """
+        获取当前的预约计划（所有时间段的参数和URL只生成一次，目标日期变化时重新生成）
+
+        返回:
+            ReservationPlan，缺少用户配置或时间段表无效时返回None
+        """
+        if not self.user_config:
+            self.callback("错误: 缺少用户配置，无法构建预约URL")
+            return None
+        plan = self.plan
+        if plan is None or plan.days_ahead != self.days_ahead or plan.date != target_date_str(self.days_ahead):
+            try:
+                plan = self.plan = compile_plan(self.view, self.days_ahead)
             except Exception as e:
-                error_msg = f"预约第{time_index}个时段失败: {e}"
+                error_msg = f"生成预约计划时出错: {e}"
                 self.callback(error_msg)
                 logging.error(error_msg)
-                
-                retry_count += 1
-                if retry_count <= max_retries:
-                    self.callback(f"将进行第{retry_count}次重试...")
-                    time.sleep(2)  # 短暂等待后重试
-                    continue
-                else:
-                    return False
+                return None
+            self.callback(f"预约目标日期: {plan.date} (提前{plan.days_ahead}天)")
+        return plan
+
+    def get_slot(self, time_index):
+        """
+        获取时间段在当前预约计划中的参数，并记录该时段的预约日期
+
+        返回:
+            SlotSpec，时间段索引无效时返回None
+        """
+        plan = self.get_plan()
+        if plan is None:
+            return None
+        spec = plan.get(time_index)
+        if spec is None:
+            self.callback(f"错误: 无效的时间段索引 {time_index}，有效的时间段是{'、'.join(map(str, plan.indices))}")
+            return None
+        self.slot_dates[time_index] = spec.date
+        return spec
+
+    def build_slot_params(self, time_index):
+        """
+        构建时间段预约参数（预约页面URL和后端接口共用）
         
-        return False  # 所有重试都失败
+        参数:
+            time_index: 时间段索引
+        
+        返回:
+            dict: 未编码的预约参数，参数无效时返回None
+        """
+        spec = self.get_slot(time_index)
+        return dict(spec.params) if spec else None
 
-    def build_reservation_url(self, time_index, days_ahead=2):
+    def build_reservation_url(self, time_index):
         """
-        构建预约URL
+        获取预约URL（预约计划中预先生成）
         
         参数:
-            time_index: 时间段索引 (1-7)
-            days_ahead: 提前预约的天数，默认2天后
+            time_index: 时间段索引
         
         返回:
             str: 预约URL
         """
+        spec = self.get_slot(time_index)
+        if spec is None:
+            return None
+        self.callback(f"构建了预约URL，时间段: {spec.time_area}")
+        return spec.url
+
+    def get_parallel_limit(self):
+        """获取并行预约的标签页数量上限（1表示依次预约）"""
+        limit = self.view.option('parallel_slots', 1)
         try:
-            # 检查用户配置
-            if not self.user_config:
-                self.callback("错误: 缺少用户配置，无法构建预约URL")
-                return None
-                
-            # 获取指定天数后的日期
-            target_date = (datetime.datetime.now() + datetime.timedelta(days=days_ahead)).strftime('%Y-%m-%d')
-            self.callback(f"预约目标日期: {target_date} (提前{days_ahead}天)")
-            
-            # 获取时间段
-            if time_index < 1 or time_index > 7:
-                self.callback(f"错误: 无效的时间段索引 {time_index}，有效范围是1-7")
-                return None
-                
-            time_slot = self.index_arr[time_index]
-            start_hour, start_min = time_slot[0]
-            end_hour, end_min = time_slot[1]
-            
-            # 构建URL
-            base_url = "https://webvpn3.hebau.edu.cn/https/77726476706e69737468656265737421f5ff40902b7e60557c099ce29d51367b21a6/qljfwapp/sys/lwAppointmentPublicPlace/*default/index.do"
-            
-            url = f"{base_url}#/seatdetail?USER_ID={self.user_config['username']}&USER_NAME={self.user_config['real_name']}&DEPT_CODE=423&DEPT_NAME=%E4%BF%A1%E6%81%AF%E7%A7%91%E5%AD%A6%E4%B8%8E%E6%8A%80%E6%9C%AF%E5%AD%A6%E9%99%A2&PHONE_NUMBER={self.user_config['phone_number']}&PALCE_ID=fb9dedd807fc48a59dc19338a50ea099"
-            url += f"&BEGINNING_DATE={target_date}%20{start_hour}%3A{start_min}&ENDING_DATE={target_date}%20{end_hour}%3A{end_min}"
-            url += f"&SCHOOL_DISTRICT_CODE=1&SCHOOL_DISTRICT=%E4%B8%9C%E6%A0%A1%E5%8C%BA&LOCATION=%E4%BA%8C%E5%B1%82%E3%80%81%E4%B8%89%E5%B1%82&PLACE_NAME=%E4%B8%9C%E6%A0%A1%E5%8C%BA%E6%95%B0%E5%AD%97%E5%8C%96%E5%9B%BE%E4%B9%A6%E9%A6%86"
-            url += f"&IS_CANCELLED=0&APPLY_DATE={target_date}&APPLY_TIME_AREA={start_hour}%3A{start_min}-{end_hour}%3A{end_min}"
-            
-            self.callback(f"构建了预约URL，时间段: {start_hour}:{start_min}-{end_hour}:{end_min}")
-            return url
+            return max(1, int(limit))
+        except (TypeError, ValueError):
+            return 1
+
+    def get_seat_coordinator(self, time_index):
+        """
+        获取时段的座位协调器（配置 seat_coordination 为 false 时返回None）
+
+        需要先为该时段构建过预约参数（以确定预约日期）
+        """
+        enabled = self.view.option('seat_coordination', True)
+        if not enabled or time_index not in self.slot_dates:
+            return None
+        if self.seat_claims is None:
+            self.seat_claims = SeatClaimTable()
+        return SeatCoordinator(self.seat_claims, self.user_key, slot_key(self.slot_dates[time_index], time_index))
+
+    def get_checkpoint_store(self):
+        """获取预约检查点存储（配置 checkpoints 为 false 时返回None）"""
+        enabled = self.view.option('checkpoints', True)
+        if not enabled:
+            return None
+        if self.checkpoints is None:
+            self.checkpoints = CheckpointStore()
+        return self.checkpoints
+
+    def note_seat(self, time_index, seat):
+        """记录时间段选中的座位（座位记录或None）"""
+        if seat is None:
+            self.slot_seats.pop(time_index, None)
+        else:
+            self.slot_seats[time_index] = seat[SEAT_ID]
+
+    def record_checkpoint(self, time_index, coordinator=None, seat=None):
+        """记录时间段已预约成功（写入失败不影响预约结果）"""
+        store = self.get_checkpoint_store()
+        if store is None or time_index not in self.slot_dates:
+            return
+        try:
+            if seat is None and coordinator:
+                seat = coordinator.current
+            store.record(self.user_key, self.slot_dates[time_index], time_index, seat=seat,
+                         seat_id=self.slot_seats.get(time_index))
+        except Exception as e:
+            logging.warning(f"记录第{time_index}个时段的检查点失败: {e}")
+
+    def get_occupancy_store(self):
+        """获取座位占用历史存储（配置 occupancy_history 为 false 时返回None）"""
+        enabled = self.view.option('occupancy_history', True)
+        if not enabled:
+            return None
+        if self.occupancy is None:
+            self.occupancy = OccupancyStore()
+        return self.occupancy
+
+    def record_occupancy(self, time_index, snapshot):
+        """把一次座位网格观察写入占用历史（写入失败不影响预约）"""
+        store = self.get_occupancy_store()
+        spec = self.plan.get(time_index) if self.plan and time_index is not None else None
+        if store is None or spec is None or not snapshot:
+            return
+        try:
+            lead = (spec.start_datetime() - datetime.datetime.now()).total_seconds() // 60
+            store.record(spec.date, time_index, snapshot['seats'], lead)
+        except Exception as e:
+            logging.warning(f"记录第{time_index}个时段的座位占用失败: {e}")
+
+    def occupancy_observer(self, time_index):
+        """SeatStatusHandler的on_observation回调，不记录占用历史时返回None"""
+        if time_index is None or self.get_occupancy_store() is None:
+            return None
+        return lambda snapshot: self.record_occupancy(time_index, snapshot)
+
+    def flush_occupancy(self):
+        """把缓存的占用历史写入文件"""
+        if self.occupancy is None:
+            return
+        try:
+            self.occupancy.flush()
+        except Exception as e:
+            logging.warning(f"写入座位占用历史失败: {e}")
+
+    def get_prioritiser(self):
+        """获取按占用历史排序的排序器（配置 prioritise 为 false 或不记录占用历史时返回None）"""
+        enabled = self.view.option('prioritise', True)
+        store = self.get_occupancy_store()
+        plan = self.get_plan()
+        if not enabled or store is None or plan is None:
+            return None
+        if self.prioritiser is None or self.prioritiser.date != plan.date:
+            self.prioritiser = Prioritiser(store, plan.date)
+        return self.prioritiser
+
+    def order_slots(self, slot_indices):
+        """把历史上最紧张的时间段排在前面（没有历史时保持原顺序）"""
+        prioritiser = self.get_prioritiser()
+        if prioritiser is None:
+            return list(slot_indices)
+        try:
+            ordered = prioritiser.order_slots(slot_indices)
+        except Exception as e:
+            logging.warning(f"按占用历史排列时间段失败: {e}")
+            return list(slot_indices)
+        if ordered != list(slot_indices):
+            self.callback(f"按历史紧张程度调整预约顺序: 第{'、'.join(map(str, ordered))}个时段")
+        return ordered
+
+    def seat_preferences(self, time_index=None):
+        """用户的座位偏好，按该时间段的占用历史调整备选座位顺序"""
+        preferences = parse_seat_preferences(self.user_config)
+        prioritiser = self.get_prioritiser() if time_index is not None else None
+        if prioritiser is None:
+            return preferences
+        try:
+            return prioritiser.order_seats(time_index, preferences, preferred_seat_key(preferences, self.user_config))
+        except Exception as e:
+            logging.warning(f"按占用历史排列座位失败: {e}")
+            return preferences
+
+    def skip_completed_slots(self, slot_indices):
+        """
+        跳过检查点中已预约成功的时间段
+
+        返回:
+            (需要预约的时间段列表, 已完成的时间段列表)
+        """
+        store = self.get_checkpoint_store()
+        plan = self.get_plan()
+        if store is None or plan is None:
+            return list(slot_indices), []
+        target_date = plan.date
+        try:
+            done = store.completed(self.user_key, target_date)
+        except Exception as e:
+            logging.warning(f"读取预约检查点失败: {e}")
+            return list(slot_indices), []
+        completed = [i for i in slot_indices if i in done]
+        for i in completed:
+            self.slot_dates[i] = target_date
+        try:
+            seat_ids = store.seat_ids(self.user_key, target_date)
+        except Exception as e:
+            logging.warning(f"读取预约检查点失败: {e}")
+            seat_ids = {}
+        self.slot_seats.update((i, seat_ids[i]) for i in completed if i in seat_ids)
+        return [i for i in slot_indices if i not in done], completed
+
+    def skip_booked_slots(self, slot_indices):
+        """
+        一次查询自己在目标日期已有的预约，跳过已预约的时间段（配置 prefetch_reservations 为 false 时不查询）
+
+        返回:
+            (需要预约的时间段列表, 已预约的时间段列表)
+        """
+        enabled = self.view.option('prefetch_reservations', True)
+        plan = self.get_plan()
+        if not enabled or not slot_indices or plan is None:
+            return list(slot_indices), []
+        
+        target_date = plan.date
+        try:
+            reservations = self.get_http_engine().query_my_reservations(target_date)
         except Exception as e:
-            error_msg = f"构建预约URL时出错: {e}"
+            logging.warning(f"查询已有预约失败，将逐个时段检查: {e}")
+            return list(slot_indices), []
+        
+        booked = []
+        for i in slot_indices:
+            spec = plan.get(i)
+            seat = reservations.get((target_date, spec.time_area)) if spec else None
+            if seat is None:
+                continue
+            booked.append(i)
+            self.slot_dates[i] = target_date
+            self.callback(f"第{i}个时段已有预约（座位 {seat or '未知'}），跳过")
+            coordinator = self.get_seat_coordinator(i)
+            if coordinator and seat:
+                coordinator.current = seat
+                coordinator.commit()
+            self.record_checkpoint(i, seat=seat or None)
+        return [i for i in slot_indices if i not in booked], booked
+
+    def watch_slots(self, slot_indices):
+        """
+        监视预约失败的时间段，座位空出时立即预约（配置 watch_minutes 大于0时启用）
+
+        返回:
+            dict: 时间段索引 -> 是否预约成功，未启用时为空
+        """
+        try:
+            minutes = float(self.view.option('watch_minutes', 0) or 0)
+        except (TypeError, ValueError):
+            minutes = 0
+        if minutes <= 0 or self.driver is None:
+            return {}
+        self.callback(f"开始监视第{'、'.join(map(str, slot_indices))}个时段，最长{minutes:g}分钟")
+        try:
+            return SeatWatcher(self, watch_seconds=minutes * 60).watch(slot_indices)
+        except Exception as e:
+            error_msg = f"监视座位时出错: {e}"
             self.callback(error_msg)
             logging.error(error_msg)
-            return None
+            return {}
 
+    def get_engine(self):
+        """获取预约引擎类型：ui（页面操作）或 http（直接调用后端接口）"""
+        engine = self.view.option('engine', 'ui')
+        return engine
+
+    def get_http_engine(self):
+        """获取（或使用当前登录Cookie创建）HTTP预约引擎"""
+        if self.http_engine is None:
+            self.http_engine = HttpReserveEngine.from_auth(
+                self.auth,
+                http_config=self.config.get('httpEngine'),
+                callback=self.callback
+            )
+        return self.http_engine
+
+    def reserve_single_time_slot_http(self, time_index):
+        """
+        通过后端接口预约单个时间段
+        
+        参数:
+            time_index: 时间段索引（时间段表中的编号）
+        
+        返回:
+            bool: 预约是否成功
+        """
+        if not self.user_config:
+            self.callback("错误: 缺少用户配置")
+            return False
+        
+        preferences = self.seat_preferences(time_index)
+        preferred_key = preferred_seat_key(preferences, self.user_config)
+        try_alternatives = self.user_config.get('try_alternative_seats', True)
+        
+        max_retries = 2  # 最大重试次数
+        for retry_count in range(max_retries + 1):
+            with span('reserve.slot_http', user=self.user_key, slot=time_index, retry=retry_count):
+                coordinator = None
+                try:
+                    if retry_count > 0:
+                        self.callback(f"将进行第{retry_count}次重试...")
+                    self.callback(f"开始预约第{time_index}个时段 (接口)")
+                
+                    params = self.build_slot_params(time_index)
+                    if not params:
+                        return False
+                
+                    engine = self.get_http_engine()
+                    snapshot = engine.query_seats(params)
+                    self.record_occupancy(time_index, snapshot)
+                    index = SeatIndex(snapshot)
+                    coordinator = self.get_seat_coordinator(time_index)
+                
+                    # 该时段已有自己的预约
+                    mine = [seat for seat in index.seats if seat[SEAT_STATE] == 2]
+                    if mine:
+                        self.note_seat(time_index, mine[0])
+                        if coordinator:
+                            coordinator.commit(mine[0])
+                        self.callback(f"第{time_index}个时段座位已被您预约，视为成功")
+                        self.record_checkpoint(time_index, coordinator)
+                        return True
+                
+                    # 跳过同时预约的其他用户持有的座位
+                    exclude = coordinator.exclude_ids(index) if coordinator else set()
+                    order = coordinator.preference_order(preferences['preferences']) if coordinator else preferences['preferences']
+                    preferred = index.lookup(preferred_key) if preferred_key else None
+                    preferred_free = preferred is not None and preferred[SEAT_STATE] == 1 and preferred[SEAT_ID] not in exclude
+                    
+                    def pick_alternative(exclude):
+                        # 历史上总被抢先预约的座位只在没有其他座位时尝试
+                        avoid = index.ids_for(preferences.get('avoid', ()))
+                        while True:
+                            seat = index.pick_best(
+                                preferred_id=preferred[SEAT_ID] if preferred else None,
+                                preferences=order,
+                                scoring=preferences['scoring'],
+                                exclude=exclude | avoid
+                            )
+                            if seat is None and avoid:
+                                avoid = set()
+                                continue
+                            if seat is None or coordinator is None or coordinator.claim_seat(seat):
+                                return seat
+                            exclude.add(seat[SEAT_ID])
+                    
+                    target = None
+                    if preferred_free and (coordinator is None or coordinator.claim_seat(preferred)):
+                        target = preferred
+                    if target is None and try_alternatives:
+                        target = pick_alternative(exclude)
+                
+                    if target is None:
+                        self.callback(f"第{time_index}个时段座位已被他人预约，且无法找到替代座位")
+                        continue
+                
+                    self.callback(f"选择座位: {target[SEAT_LABEL] or target[SEAT_ID]}")
+                    success, message = engine.reserve_seat(params, target[SEAT_ID])
+                    if success:
+                        self.note_seat(time_index, target)
+                        if coordinator:
+                            coordinator.commit()
+                        self.callback(f"第{time_index}个时段预约成功")
+                        self.record_checkpoint(time_index, coordinator)
+                        return True
+                    if coordinator:
+                        coordinator.release()
+                    self.callback(f"第{time_index}个时段预约失败: {message}")
+                except Exception as e:
+                    error_msg = f"预约第{time_index}个时段过程中出错: {e}"
+                    self.callback(error_msg)
+                    logging.error(error_msg)
+                    if coordinator:
+                        coordinator.release()
+        
+        return False
+
+    @traced('reserve.all_slots')
+    def reserve_all_slots(self, slot_indices=None):
+        """
+        预约多个时间段（根据配置依次或并行执行）
+        
+        参数:
+            slot_indices: 时间段索引列表，默认为时间段表中的全部时段
+        
+        返回:
+            int: 预约成功的时段数量
+        """
+        if slot_indices is None:
+            plan = self.get_plan()
+            slot_indices = plan.indices if plan else []
+        
+        self.events.emit(OPERATION, ACTIVE, user=self.user_key, slots=list(slot_indices))
+        
+        # 之前的运行中已预约成功的时间段不再预约
+        pending, completed = self.skip_completed_slots(slot_indices)
+        results = {i: True for i in completed}
+        if completed:
+            self.callback(f"第{'、'.join(map(str, completed))}个时段已在之前的运行中预约成功，跳过")
+        pending, booked = self.skip_booked_slots(pending)
+        results.update((i, True) for i in booked)
+        for i in completed + booked:
+            self.events.emit(OPERATION, COMPLETED, user=self.user_key, slot=i, skipped=True)
+        
+        # 历史上紧张的时间段先预约
+        pending = self.order_slots(pending)
+        
+        use_http = self.get_engine() == 'http'
+        parallel_limit = self.get_parallel_limit()
+        if parallel_limit > 1 and not use_http:
+            if pending:
+                parallel_results = ParallelReserve(self, max_concurrency=parallel_limit).run(pending)
+                results.update(parallel_results)
+                for i, ok in parallel_results.items():
+                    self.events.emit(OPERATION, COMPLETED if ok else ERROR, user=self.user_key, slot=i)
+        else:
+            reserve_slot = self.reserve_single_time_slot_http if use_http else self.reserve_single_time_slot
+            for i in pending:
+                # 检查是否应该终止
+                if self.should_stop:
+                    break
+                    
+                try:
+                    results[i] = reserve_slot(i)
+                    if not results[i]:
+                        self.callback(f"第{i}个时段预约失败，将继续尝试下一个时段")
+                except Exception as e:
+                    results[i] = False
+                    self.callback(f"预约第{i}个时段时发生异常: {e}，将继续尝试下一个时段")
+                self.events.emit(OPERATION, COMPLETED if results[i] else ERROR, user=self.user_key, slot=i)
+        
+        # 没有抢到的时段继续监视，座位被取消时立即预约
+        failed = [i for i in pending if not results.get(i)]
+        if failed and not self.should_stop:
+            results.update(self.watch_slots(failed))
+        
+        self.slot_results = results
+        self.flush_occupancy()
+        success_count = sum(1 for ok in results.values() if ok)
+        
+        # 汇报结果
+        if self.should_stop:
+            self.callback(f"操作已终止，已成功预约{success_count}个时段")
+        elif success_count == len(slot_indices):
+            self.callback("所有时段预约成功")
+        else:
+            self.callback(f"共预约成功{success_count}个时段，{len(slot_indices)-success_count}个时段失败")
+        
+        summary = {'succeeded': success_count, 'failed': len(slot_indices) - success_count}
+        if success_count == len(slot_indices) and not self.should_stop:
+            self.events.emit(OPERATION, COMPLETED, user=self.user_key, **summary)
+            self.events.emit(FINISH, COMPLETED, user=self.user_key, **summary)
+        else:
+            self.events.emit(OPERATION, COMPLETED if success_count else ERROR, user=self.user_key, **summary)
+        
+        return success_count
 
     def run(self):
         """执行完整的预约流程"""
@@ -371,28 +786,8 @@ class LibraryReserve:
                 self.callback("登录失败，无法继续预约")
                 return False
             
-            # 依次预约每个时间段
-            success_count = 0
-            for i in range(1, 8):
-                # 检查是否应该终止
-                if self.should_stop:
-                    self.callback(f"操作已终止，已成功预约{success_count}个时段")
-                    return success_count > 0
-                    
-                try:
-                    if self.reserve_single_time_slot(i):
-                        success_count += 1
-                    else:
-                        self.callback(f"第{i}个时段预约失败，将继续尝试下一个时段")
-                except Exception as e:
-                    self.callback(f"预约第{i}个时段时发生异常: {e}，将继续尝试下一个时段")
-            
-            # 汇报结果
-            if success_count == 7:
-                self.callback("所有时段预约成功")
-            else:
-                self.callback(f"共预约成功{success_count}个时段，{7-success_count}个时段失败")
-            
+            # 预约所有时间段
+            success_count = self.reserve_all_slots(self.slot_indices)
             return success_count > 0
             
         except Exception as e:
@@ -417,23 +812,8 @@ class LibraryReserve:
                 self.callback("错误: 用户配置缺失，无法继续预约")
                 return False
             
-            # 依次预约每个时间段
-            success_count = 0
-            for i in range(1, 8):
-                try:
-                    if self.reserve_single_time_slot(i):
-                        success_count += 1
-                    else:
-                        self.callback(f"第{i}个时段预约失败，将继续尝试下一个时段")
-                except Exception as e:
-                    self.callback(f"预约第{i}个时段时发生异常: {e}，将继续尝试下一个时段")
-            
-            # 汇报结果
-            if success_count == 7:
-                self.callback("所有时段预约成功")
-            else:
-                self.callback(f"共预约成功{success_count}个时段，{7-success_count}个时段失败")
-            
+            # 预约所有时间段
+            success_count = self.reserve_all_slots(self.slot_indices)
             return success_count > 0
             
         except Exception as e:
@@ -442,9 +822,29 @@ class LibraryReserve:
             logging.error(error_msg)
             return False
     
+    def reserved_seat_id(self, time_index):
+        """时间段预约到的座位data-id，不知道时返回None"""
+        return self.slot_seats.get(time_index) if self.slot_results.get(time_index) else None
+
+    def reserved_slots(self):
+        """
+        本次预约成功的时间段
+
+        返回:
+            list: [(日期 YYYY-MM-DD, 时间段索引), ...]
+        """
+        return [
+            (self.slot_dates[i], i)
+            for i, ok in sorted(self.slot_results.items())
+            if ok and i in self.slot_dates
+        ]
+
     def close(self):
         """关闭预约模块（清理资源）"""
         try:
+            self.flush_occupancy()
+            if self.http_engine:
+                self.http_engine.close()
             self.auth.close()
         except Exception as e:
             logging.error(f"关闭预约模块时出错: {e}")
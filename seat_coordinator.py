@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import sys
+import time
+import logging
+from contextlib import contextmanager
+
+from seat_ranking import parse_seat_preferences, preferred_seat_key, SEAT_ID, SEAT_LABEL
+from utils import resource_path, file_lock
+
+# 认领状态：planned（放号前分配）、claimed（正在点击/确认）、booked（已预约成功）
+PLANNED, CLAIMED, BOOKED = 'planned', 'claimed', 'booked'
+
+def slot_key(date_str, time_index):
+    """时间段在认领表中的键"""
+    return f"{date_str}|{time_index}"
+
+def seat_key(seat):
+    """座位记录在认领表中的键（优先使用座位编号，没有编号时使用data-id）"""
+    return seat[SEAT_LABEL] or seat[SEAT_ID]
+
+class SeatClaimTable:
+    """
+    本机所有用户共享的座位认领表（seat_claims.json，读写时加文件锁）
+
+    格式:
+        {"时段键": {"seats": {座位键: {"user": 用户, "state": 状态, "at": 时间戳}},
+                    "plans": {用户: [首选座位, 备选座位, ...]}}}
+    """
+
+    def __init__(self, path='seat_claims.json', claim_ttl=300, keep_days=3):
+        """
+        初始化认领表
+
+        参数:
+            path: 认领表文件路径
+            claim_ttl: claimed状态的有效时间（秒），超时视为放弃（进程崩溃时不会一直占用）
+            keep_days: 保留最近几天的时段记录
+        """
+        self.path = resource_path(path)
+        self.lock_path = self.path + '.lock'
+        self.claim_ttl = claim_ttl
+        self.keep_days = keep_days
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"读取座位认领表失败: {e}")
+            return {}
+
+    def _write(self, data):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _expire(self, data, now):
+        """删除过期的claimed记录和过早的时段"""
+        cutoff = time.strftime('%Y-%m-%d', time.localtime(now - self.keep_days * 86400))
+        for key in list(data):
+            if key.split('|')[0] < cutoff:
+                del data[key]
+                continue
+            seats = data[key].setdefault('seats', {})
+            for seat, claim in list(seats.items()):
+                if claim['state'] == CLAIMED and now - claim['at'] > self.claim_ttl:
+                    del seats[seat]
+
+    @contextmanager
+    def transaction(self):
+        """加锁读取认领表，退出时写回"""
+        with file_lock(self.lock_path):
+            data = self._read()
+            self._expire(data, time.time())
+            yield data
+            self._write(data)
+
+    def snapshot(self):
+        """读取当前认领表（只读）"""
+        with file_lock(self.lock_path):
+            data = self._read()
+        self._expire(data, time.time())
+        return data
+
+    def held_by_others(self, slot, user_key):
+        """时段中被其他用户分配、认领或预约的座位键"""
+        seats = self.snapshot().get(slot, {}).get('seats', {})
+        return {seat for seat, claim in seats.items() if claim['user'] != user_key}
+
+    def plan_for(self, slot, user_key):
+        """用户在时段中的分配顺序（首选+备选），没有分配时返回空列表"""
+        return self.snapshot().get(slot, {}).get('plans', {}).get(user_key, [])
+
+    def claim(self, slot, seat, user_key, state=CLAIMED):
+        """
+        认领座位；同一用户在一个时段只保留一个座位，认领新座位时释放之前分配或认领的座位
+
+        返回:
+            bool: 是否认领成功（座位已被其他用户持有时返回False）
+        """
+        with self.transaction() as data:
+            seats = data.setdefault(slot, {'seats': {}, 'plans': {}}).setdefault('seats', {})
+            holder = seats.get(seat)
+            if holder and holder['user'] != user_key:
+                return False
+            for other_seat, claim in list(seats.items()):
+                if claim['user'] == user_key and other_seat != seat and claim['state'] != BOOKED:
+                    del seats[other_seat]
+            seats[seat] = {'user': user_key, 'state': state, 'at': time.time()}
+            return True
+
+    def release(self, slot, seat, user_key):
+        """释放用户认领（未预约成功）的座位"""
+        with self.transaction() as data:
+            seats = data.get(slot, {}).get('seats', {})
+            claim = seats.get(seat)
+            if claim and claim['user'] == user_key and claim['state'] != BOOKED:
+                del seats[seat]
+
+    def save_plan(self, slot, assignments):
+        """
+        保存一个时段的分配结果
+
+        参数:
+            assignments: {用户: [首选座位, 备选座位, ...]}
+        """
+        with self.transaction() as data:
+            entry = data.setdefault(slot, {'seats': {}, 'plans': {}})
+            seats = entry.setdefault('seats', {})
+            entry['plans'] = {user: list(order) for user, order in assignments.items()}
+            for seat, claim in list(seats.items()):
+                if claim['state'] == PLANNED:
+                    del seats[seat]
+            for user, order in assignments.items():
+                if order and order[0] not in seats:
+                    seats[order[0]] = {'user': user, 'state': PLANNED, 'at': time.time()}
+
+    def clear(self, slot=None):
+        """清空认领表或单个时段"""
+        with self.transaction() as data:
+            if slot is None:
+                data.clear()
+            else:
+                data.pop(slot, None)
+
+def plan_assignments(user_choices):
+    """
+    为多个用户分配互不相同的首选座位和备选列表
+
+    按名次轮流分配：先满足所有用户的第1志愿，冲突时按用户顺序，未分到的用户再看第2志愿，依此类推。
+    备选列表为用户剩余的志愿中未被分给其他用户作为首选的座位。
+
+    参数:
+        user_choices: {用户: [按志愿排序的座位键]}（按用户优先级排序的dict）
+
+    返回:
+        dict: {用户: [首选座位, 备选座位, ...]}，没有可分配座位的用户列表为空
+    """
+    primary = {}
+    taken = set()
+    depth = max((len(choices) for choices in user_choices.values()), default=0)
+    for rank in range(depth):
+        for user, choices in user_choices.items():
+            if user in primary or rank >= len(choices):
+                continue
+            if choices[rank] not in taken:
+                primary[user] = choices[rank]
+                taken.add(choices[rank])
+
+    result = {}
+    for user, choices in user_choices.items():
+        own = primary.get(user)
+        fallbacks = [seat for seat in choices if seat != own and seat not in taken]
+        result[user] = ([own] if own else []) + fallbacks
+    return result
+
+def user_seat_choices(reserve_config, users):
+    """从预约配置中取出各用户按志愿排序的座位键（首选座位+偏好列表）"""
+    choices = {}
+    for user in users:
+        user_config = reserve_config.get('reserveUrl', {}).get(user)
+        if not user_config:
+            continue
+        preferences = parse_seat_preferences(user_config)
+        order = []
+        primary = preferred_seat_key(dict(preferences, preferences=[]), user_config)
+        for key in [primary] + preferences['preferences']:
+            if key and key not in order:
+                order.append(key)
+        choices[user] = order
+    return choices
+
+def plan_slots(table, reserve_config, users, slots):
+    """
+    放号前为多个用户分配各时段的座位并写入认领表
+
+    参数:
+        table: SeatClaimTable
+        reserve_config: 预约配置
+        users: 按优先级排序的用户列表
+        slots: 时段键列表
+
+    返回:
+        dict: {时段键: {用户: [首选座位, 备选座位, ...]}}
+    """
+    choices = user_seat_choices(reserve_config, users)
+    plans = {}
+    for slot in slots:
+        plans[slot] = plan_assignments(choices)
+        table.save_plan(slot, plans[slot])
+    return plans
+
+class SeatCoordinator:
+    """单个用户在单个时段中与其他用户协调座位"""
+
+    def __init__(self, table, user_key, slot):
+        self.table = table
+        self.user_key = user_key
+        self.slot = slot
+        self.current = None  # 当前认领的座位键
+
+    def exclude_ids(self, index):
+        """其他用户持有的座位在当前网格中的data-id"""
+        ids = set()
+        for key in self.table.held_by_others(self.slot, self.user_key):
+            seat = index.lookup(key)
+            if seat is not None:
+                ids.add(seat[SEAT_ID])
+        return ids
+
+    def preference_order(self, preferences=()):
+        """分配结果在前、用户原有偏好在后的座位顺序"""
+        order = list(self.table.plan_for(self.slot, self.user_key))
+        return order + [key for key in preferences if key not in order]
+
+    def claim_seat(self, seat):
+        """认领座位记录，返回是否成功"""
+        key = seat_key(seat)
+        if self.table.claim(self.slot, key, self.user_key):
+            self.current = key
+            return True
+        logging.info(f"座位 {key} 已被其他用户占用（{self.slot}）")
+        return False
+
+    def commit(self, seat=None):
+        """预约成功后把座位标记为已预约"""
+        key = seat_key(seat) if seat is not None else self.current
+        if key:
+            self.table.claim(self.slot, key, self.user_key, state=BOOKED)
+            self.current = key
+
+    def release(self):
+        """预约失败时释放认领的座位"""
+        if self.current:
+            self.table.release(self.slot, self.current, self.user_key)
+            self.current = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多用户座位分配与认领表")
+    parser.add_argument('--table', default='seat_claims.json', help="认领表文件")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = subparsers.add_parser('plan', help="为用户分配互不冲突的座位")
+    plan_parser.add_argument('--config', default='reserveConfig.json', help="预约配置文件")
+    plan_parser.add_argument('--users', nargs='+', help="按优先级排序的用户，默认为配置中的所有用户")
+    plan_parser.add_argument('--date', required=True, help="预约日期 YYYY-MM-DD")
+    plan_parser.add_argument('--slots', type=int, nargs='+', help="时间段编号，默认为时间段表中的全部时段")
+
+    subparsers.add_parser('show', help="显示认领表")
+    clear_parser = subparsers.add_parser('clear', help="清空认领表")
+    clear_parser.add_argument('--slot', help="只清空某个时段，例如 2024-01-01|1")
+
+    args = parser.parse_args(argv)
+    table = SeatClaimTable(args.table)
+
+    if args.command == 'plan':
+        with open(resource_path(args.config), 'r', encoding='utf-8') as f:
+            reserve_config = json.load(f)
+        from reservation_plan import slot_table_for
+        users = args.users or list(reserve_config.get('reserveUrl', {}))
+        slots = args.slots or [index for index, start, end in slot_table_for(reserve_config)]
+        plans = plan_slots(table, reserve_config, users, [slot_key(args.date, i) for i in slots])
+        for slot, assignments in plans.items():
+            print(slot)
+            for user, order in assignments.items():
+                print(f"  {user:<10} " + (" > ".join(order) if order else "无可分配座位"))
+    elif args.command == 'show':
+        for slot, entry in sorted(table.snapshot().items()):
+            print(slot)
+            for seat, claim in sorted(entry.get('seats', {}).items()):
+                print(f"  {seat:<10} {claim['user']:<10} {claim['state']}")
+    else:
+        table.clear(args.slot)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import math
+import re
+
+# 快照中座位记录的字段下标（与seat_status中的GRID_SNAPSHOT_SCRIPT一致）
+SEAT_ID, SEAT_LABEL, SEAT_STATE, SEAT_X, SEAT_Y = 0, 1, 2, 3, 4
+
+# 未配置评分时，只按与首选座位的距离排序
+DEFAULT_SCORING = {
+    'preference_weight': 1000,
+    'zones': {},
+    'neighbour_weight': 0,
+    'distance_weight': 1,
+}
+
+def parse_seat_preferences(user_config):
+    """
+    解析用户的座位配置
+
+    seat_xpath 可以是字符串（首选座位XPath），也可以是对象:
+        {
+            "xpath": "首选座位XPath",
+            "preferences": ["A102", "A103"],   // 按顺序的备选座位编号或data-id
+            "scoring": {
+                "zones": {"A": 10, "B": 5},    // 按座位编号前缀加分
+                "neighbour_weight": 2,         // 每个已被预约的相邻座位扣分
+                "distance_weight": 1           // 与首选座位每格距离扣分
+            }
+        }
+
+    返回:
+        dict: {'xpath': ..., 'preferences': [...], 'scoring': {...}}
+    """
+    value = user_config.get('seat_xpath')
+    if isinstance(value, dict):
+        scoring = dict(DEFAULT_SCORING)
+        scoring.update(value.get('scoring', {}))
+        return {
+            'xpath': value.get('xpath'),
+            'preferences': [str(p) for p in value.get('preferences', [])],
+            'scoring': scoring,
+        }
+    return {'xpath': value, 'preferences': [], 'scoring': dict(DEFAULT_SCORING)}
+
+def preferred_seat_key(preferences, user_config):
+    """
+    获取首选座位的编号或data-id（HTTP引擎无法使用XPath定位座位时使用）
+
+    依次使用用户配置中的seat_id、偏好列表第一项、XPath中最后一个引号字面量
+    （例如 //p[@class='grid-cell-info' and text()='A101'] 中的 A101）
+    """
+    if user_config.get('seat_id'):
+        return str(user_config['seat_id'])
+    if preferences['preferences']:
+        return preferences['preferences'][0]
+    literals = re.findall(r"['\"]([^'\"]+)['\"]", preferences['xpath'] or '')
+    return literals[-1] if literals else None
+
+def seat_zone(label):
+    """座位编号的区域前缀，例如 A101 -> A"""
+    match = re.match(r'[A-Za-z]+', label or '')
+    return match.group(0).upper() if match else ''
+
+class SeatIndex:
+    """基于一次网格快照建立的座位索引，用于单次遍历选出最佳座位"""
+
+    def __init__(self, snapshot):
+        self.seats = snapshot['seats']
+        self.by_id = {}
+        self.by_label = {}
+        for seat in self.seats:
+            self.by_id[seat[SEAT_ID]] = seat
+            if seat[SEAT_LABEL]:
+                self.by_label[seat[SEAT_LABEL]] = seat
+
+        # 以相邻座位的最小间距作为网格单位，按格子坐标建立位置索引
+        self.unit = self._grid_unit()
+        self.cells = {}
+        for seat in self.seats:
+            self.cells[self._cell(seat)] = seat
+
+    def _grid_unit(self):
+        xs = sorted(set(seat[SEAT_X] for seat in self.seats if len(seat) > SEAT_X))
+        gaps = [b - a for a, b in zip(xs, xs[1:]) if b - a > 2]
+        return min(gaps) if gaps else 1
+
+    def _cell(self, seat):
+        if len(seat) <= SEAT_Y:
+            return None
+        return (round(seat[SEAT_X] / self.unit), round(seat[SEAT_Y] / self.unit))
+
+    def lookup(self, key):
+        """按data-id或座位编号查找座位"""
+        return self.by_id.get(key) or self.by_label.get(key)
+
+    def ids_for(self, keys):
+        """座位编号或data-id对应的data-id集合（网格中不存在的忽略）"""
+        return {seat[SEAT_ID] for seat in map(self.lookup, keys) if seat is not None}
+
+    def neighbours(self, seat):
+        """相邻（含对角）的座位"""
+        cell = self._cell(seat)
+        if cell is None:
+            return []
+        result = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx or dy:
+                    other = self.cells.get((cell[0] + dx, cell[1] + dy))
+                    if other is not None:
+                        result.append(other)
+        return result
+
+    def distance(self, seat, other):
+        """两个座位之间的网格距离"""
+        a, b = self._cell(seat), self._cell(other)
+        if a is None or b is None:
+            return 0
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+
+    def pick_best(self, preferred_id=None, preferences=(), scoring=None, exclude=()):
+        """
+        在可预约座位中选出评分最高的一个
+
+        参数:
+            preferred_id: 首选座位的data-id（用于计算距离）
+            preferences: 按顺序的备选座位编号或data-id
+            scoring: 评分配置
+            exclude: 需要跳过的座位data-id
+
+        返回:
+            座位记录，没有可用座位时返回None
+        """
+        scoring = scoring or DEFAULT_SCORING
+        preferred = self.by_id.get(preferred_id) if preferred_id else None
+
+        rank = {}
+        for i, key in enumerate(preferences):
+            seat = self.lookup(key)
+            if seat is not None and seat[SEAT_ID] not in rank:
+                rank[seat[SEAT_ID]] = len(preferences) - i
+
+        zones = scoring.get('zones', {})
+        preference_weight = scoring.get('preference_weight', 1000)
+        neighbour_weight = scoring.get('neighbour_weight', 0)
+        distance_weight = scoring.get('distance_weight', 0)
+
+        best, best_score = None, None
+        for seat in self.seats:
+            if seat[SEAT_STATE] != 1 or seat[SEAT_ID] in exclude:
+                continue
+            score = preference_weight * rank.get(seat[SEAT_ID], 0)
+            score += zones.get(seat_zone(seat[SEAT_LABEL]), 0)
+            if neighbour_weight:
+                booked = sum(1 for n in self.neighbours(seat) if n[SEAT_STATE] in (2, 3))
+                score -= neighbour_weight * booked
+            if distance_weight and preferred is not None:
+                score -= distance_weight * self.distance(seat, preferred)
+            if best_score is None or score > best_score:
+                best, best_score = seat, score
+        return best
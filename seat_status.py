@@ -1,108 +1,212 @@
 import logging
-import time
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
+from seat_ranking import SeatIndex, SEAT_ID, SEAT_LABEL, SEAT_STATE
+from utils import wait_until, click_and_await, class_changed, wait_for_page_load, POLL_INTERVAL
+from tracing import span
+
+# 一次性读取座位网格：返回首选座位的data-id和所有座位的[data-id, 编号, 状态码, x, y]
+GRID_SNAPSHOT_SCRIPT = """
+var preferredXpath = arguments[0];
+var preferred = null;
+if (preferredXpath) {
+    var node = document.evaluate(preferredXpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    var container = node && node.closest ? node.closest('div.grid-cell-container') : null;
+    if (container) { preferred = container.getAttribute('data-id'); }
+}
+var cells = document.querySelectorAll('div.grid-cell-container');
+var seats = [];
+for (var i = 0; i < cells.length; i++) {
+    var cl = cells[i].classList;
+    var state = cl.contains('myBooked') ? 2 : (cl.contains('booked') ? 3 : (cl.contains('active') ? 1 : 0));
+    var info = cells[i].querySelector('p.grid-cell-info');
+    var rect = cells[i].getBoundingClientRect();
+    seats.push([cells[i].getAttribute('data-id'), info ? info.textContent.trim() : '', state,
+                Math.round(rect.left + rect.width / 2), Math.round(rect.top + rect.height / 2)]);
+}
+return {preferred: preferred, seats: seats};
+"""
+
+def seat_xpath_by_id(seat_id):
+    """根据data-id构建座位容器的XPath"""
+    return f"//div[contains(@class, 'grid-cell-container') and @data-id='{seat_id}']"
 
 class SeatStatusHandler:
     """处理座位状态识别和相关操作的类"""
     
-    def __init__(self, driver, callback=None):
+    def __init__(self, driver, callback=None, on_observation=None):
+        """
+        参数:
+            driver: WebDriver实例
+            callback: 回调函数，用于报告状态更新
+            on_observation: 每个用于判断座位状态的网格快照都会传给该函数（例如写入占用历史）
+        """
         self.driver = driver
         self.callback = callback or (lambda msg: None)
+        self.on_observation = on_observation
+        self.snapshot = None
+        self.index = None
+        self._observed = None
+        self.selected = None  # 最近一次选中（或已被自己预约）的座位记录
         
     def log(self, message):
         """记录日志并通过回调通知"""
         self.callback(message)
         logging.info(message)
         
-    def detect_seat_status(self, seat_xpath):
+    def snapshot_grid(self, preferred_seat_xpath=None):
+        """
+        通过一次execute_script获取整个座位网格的状态
+        
+        参数:
+            preferred_seat_xpath: 首选座位XPath（可指向座位内的p元素或座位容器）
+        
+        返回:
+            dict: {'preferred': 首选座位data-id或None,
+                   'seats': [[data-id, 座位编号, 状态码, x, y], ...]}（按页面顺序）
+        """
+        snapshot = self.driver.execute_script(GRID_SNAPSHOT_SCRIPT, preferred_seat_xpath)
+        self.snapshot = snapshot
+        self.index = SeatIndex(snapshot)
+        return snapshot
+    
+    def wait_for_grid(self, preferred_seat_xpath=None, timeout=10, poll_interval=POLL_INTERVAL):
+        """
+        轮询座位网格快照，直到首选座位出现或超时
+        
+        返回:
+            最后一次获取的快照
+        """
+        def grid_ready(driver):
+            snapshot = self.snapshot_grid(preferred_seat_xpath)
+            if snapshot['seats'] and (preferred_seat_xpath is None or snapshot['preferred']):
+                return snapshot
+            return None
+        
+        try:
+            return wait_until(self.driver, grid_ready, timeout, name='seat_grid', poll_interval=poll_interval)
+        except TimeoutException:
+            return self.snapshot
+    
+    def observe(self, snapshot):
+        """把快照交给on_observation（同一快照只交一次，出错不影响选座）"""
+        if self.on_observation is None or snapshot is None or snapshot is self._observed:
+            return
+        self._observed = snapshot
+        try:
+            self.on_observation(snapshot)
+        except Exception as e:
+            logging.warning(f"记录座位网格观察失败: {e}")
+
+    def click_seat(self, seat_xpath):
+        """点击座位，并等待座位的选中状态发生变化（超时不视为失败）"""
+        seat = wait_until(self.driver, EC.element_to_be_clickable((By.XPATH, seat_xpath)), 10, name='seat_clickable')
+        try:
+            click_and_await(self.driver, seat, class_changed(seat), timeout=2, name='seat_click')
+        except TimeoutException:
+            logging.debug("点击座位后未检测到状态变化")
+    
+    def detect_seat_status(self, seat_xpath, snapshot=None):
         """
         检测座位状态
         
+        参数:
+            seat_xpath: 座位XPath
+            snapshot: 已获取的网格快照，为None时重新获取
+        
         返回:
             0: 未找到座位
             1: 座位可预约（蓝色，active）
             2: 座位已被自己预约（绿色+黄色边框，myBooked）
             3: 座位已被他人预约（绿色，booked）
         """
-        try:
-            # 当前问题：seat_xpath是指向p元素而不是外层div的
-            # 我们需要找到包含该p元素的外层div
-            
-            # 1. 首先确认元素存在
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, seat_xpath))
-            )
-            
-            # 2. 获取父元素div（包含类信息的容器）
-            # 假设seat_xpath指向的是p.grid-cell-info元素
-            container_xpath = f"({seat_xpath})/ancestor::div[contains(@class, 'grid-cell-container')]"
-            
-            container_element = WebDriverWait(self.driver, 5).until(
-                EC.presence_of_element_located((By.XPATH, container_xpath))
-            )
-            
-            # 获取class属性来判断状态
-            class_attr = container_element.get_attribute("class")
-            
-            self.log(f"座位容器class: {class_attr}")
-            
-            if "myBooked" in class_attr:
-                self.log("检测到座位已被自己预约")
-                return 2
-            elif "booked" in class_attr:
-                self.log("检测到座位已被他人预约")
-                return 3
-            elif "active" in class_attr:
-                self.log("检测到座位可预约")
-                return 1
-            else:
-                self.log(f"未能识别座位状态: {class_attr}")
-                return 0
-                
-        except TimeoutException:
+        if snapshot is None:
+            snapshot = self.wait_for_grid(seat_xpath)
+        self.observe(snapshot)
+        
+        seat_id = snapshot['preferred']
+        if not seat_id:
             self.log("等待座位元素超时，未找到座位")
-            return 0     
-    def find_alternative_seat(self, preferred_seat_xpath):
+            return 0
+        
+        status = self.index.by_id[seat_id][SEAT_STATE]
+        if status == 2:
+            self.log("检测到座位已被自己预约")
+        elif status == 3:
+            self.log("检测到座位已被他人预约")
+        elif status == 1:
+            self.log("检测到座位可预约")
+        else:
+            self.log(f"未能识别座位状态: {seat_id}")
+        return status
+    
+    def find_alternative_seat(self, preferred_seat_xpath, snapshot=None, preferences=None, coordinator=None):
         """
-        当首选座位不可用时，寻找替代座位
+        当首选座位不可用时，按偏好列表和评分选出最佳替代座位
+        
+        参数:
+            preferred_seat_xpath: 首选座位XPath
+            snapshot: 已获取的网格快照，为None时重新获取
+            preferences: parse_seat_preferences返回的座位偏好配置
+            coordinator: SeatCoordinator，跳过其他用户持有的座位并认领选中的座位
         
         返回:
             替代座位的xpath或None
         """
         try:
-            # 尝试获取所有可预约的座位
-            available_seats = self.driver.find_elements(By.XPATH, "//div[contains(@class, 'grid-cell-container active')]")
+            if snapshot is None:
+                snapshot = self.snapshot_grid(preferred_seat_xpath)
+            self.observe(snapshot)
             
-            if not available_seats:
+            available_count = sum(1 for seat in snapshot['seats'] if seat[SEAT_STATE] == 1)
+            if not available_count:
                 self.log("没有找到可用的替代座位")
                 return None
                 
-            self.log(f"找到 {len(available_seats)} 个可用替代座位")
+            self.log(f"找到 {available_count} 个可用替代座位")
             
-            # 返回第一个可用座位
-            first_seat = available_seats[0]
+            preferences = preferences or {}
+            order = preferences.get('preferences', ())
+            exclude = set()
+            if coordinator is not None:
+                order = coordinator.preference_order(order)
+                exclude = coordinator.exclude_ids(self.index)
+            # 历史上总被抢先预约的座位只在没有其他座位时尝试
+            avoid = self.index.ids_for(preferences.get('avoid', ()))
             
-            # 获取座位编号
-            try:
-                seat_info = first_seat.find_element(By.XPATH, ".//p[@class='grid-cell-info']").text
-                self.log(f"选择替代座位: {seat_info}")
-            except:
-                self.log("找到替代座位但无法获取座位编号")
+            while True:
+                best_seat = self.index.pick_best(
+                    preferred_id=snapshot['preferred'],
+                    preferences=order,
+                    scoring=preferences.get('scoring'),
+                    exclude=exclude | avoid
+                )
+                if best_seat is None and avoid:
+                    avoid = set()
+                    continue
+                if best_seat is None:
+                    self.log("可用的替代座位都已分配给其他用户")
+                    return None
+                if coordinator is None or coordinator.claim_seat(best_seat):
+                    break
+                exclude.add(best_seat[SEAT_ID])
             
-            # 直接返回这个座位元素的XPath
-            seat_id = first_seat.get_attribute("data-id")
-            alternative_xpath = f"//div[contains(@class, 'grid-cell-container') and @data-id='{seat_id}']"
+            if best_seat[SEAT_LABEL]:
+                self.log(f"选择替代座位: {best_seat[SEAT_LABEL]}")
+            else:
+                self.log("找到替代座位但无法获取座位编号")
             
-            return alternative_xpath
+            self.selected = best_seat
+            return seat_xpath_by_id(best_seat[SEAT_ID])
             
         except Exception as e:
             self.log(f"寻找替代座位时出错: {e}")
             return None
             
-    def handle_seat_selection(self, preferred_seat_xpath, try_alternatives=True, max_retries=3):
+    def handle_seat_selection(self, preferred_seat_xpath, try_alternatives=True, max_retries=3, preferences=None,
+                              coordinator=None):
         """
         处理座位选择，包括状态检测和处理
         
@@ -110,6 +214,8 @@ class SeatStatusHandler:
             preferred_seat_xpath: 首选座位XPath
             try_alternatives: 是否尝试寻找替代座位
             max_retries: 最大重试次数
+            preferences: 替代座位的偏好列表和评分配置
+            coordinator: SeatCoordinator，与同时预约的其他用户协调座位
             
         返回:
             (成功标志, 座位状态码, 使用的座位XPath)
@@ -117,87 +223,90 @@ class SeatStatusHandler:
         retry_count = 0
         
         while retry_count < max_retries:
-            # 等待页面加载完成
-            try:
-                WebDriverWait(self.driver, 15).until(
-                    lambda d: d.execute_script('return document.readyState') == 'complete'
-                )
-            except:
-                self.log("等待页面加载超时，继续尝试...")
-            
-            # 短暂等待确保JS渲染完成
-            time.sleep(2)
-            
-            # 检测首选座位状态
-            seat_status = self.detect_seat_status(preferred_seat_xpath)
-            
-            if seat_status == 1:  # 座位可预约
-                try:
-                    # 确保点击的是容器而不是内部元素
-                    container_xpath = f"({preferred_seat_xpath})/ancestor::div[contains(@class, 'grid-cell-container')]"
-                    
-                    seat = WebDriverWait(self.driver, 10).until(
-                        EC.element_to_be_clickable((By.XPATH, container_xpath))
-                    )
-                    seat.click()
-                    time.sleep(1)  # 等待点击效果
-                    
-                    self.log("成功选择首选座位")
+            with span('seat.selection_attempt', retry=retry_count):
+                # 等待页面加载完成
+                if not wait_for_page_load(self.driver, timeout=15):
+                    self.log("等待页面加载超时，继续尝试...")
+
+                # 一次获取整个网格（等到网格渲染出来），后续判断都在本地完成
+                snapshot = self.wait_for_grid(preferred_seat_xpath)
+
+                # 检测首选座位状态
+                seat_status = self.detect_seat_status(preferred_seat_xpath, snapshot)
+
+                if coordinator is not None and seat_status in (1, 2):
+                    preferred_seat = self.index.by_id[snapshot['preferred']]
+                    if seat_status == 2:
+                        coordinator.commit(preferred_seat)
+                    elif not coordinator.claim_seat(preferred_seat):
+                        # 首选座位已分配给同时预约的其他用户，按被占用处理
+                        self.log("首选座位已分配给其他用户")
+                        seat_status = 3
+
+                if seat_status == 1:  # 座位可预约
+                    try:
+                        # 确保点击的是容器而不是内部元素
+                        container_xpath = seat_xpath_by_id(snapshot['preferred'])
+
+                        self.click_seat(container_xpath)
+                        self.selected = self.index.by_id[snapshot['preferred']]
+
+                        self.log("成功选择首选座位")
+                        return True, seat_status, preferred_seat_xpath
+
+                    except Exception as e:
+                        self.log(f"点击首选座位时出错: {e}")
+                        if coordinator is not None:
+                            coordinator.release()
+                        retry_count += 1
+
+                elif seat_status == 2:  # 座位已被自己预约
+                    self.log("该座位已被您预约，无需再次预约")
+                    self.selected = self.index.by_id[snapshot['preferred']]
                     return True, seat_status, preferred_seat_xpath
-                    
-                except Exception as e:
-                    self.log(f"点击首选座位时出错: {e}")
-                    retry_count += 1
-                    
-            elif seat_status == 2:  # 座位已被自己预约
-                self.log("该座位已被您预约，无需再次预约")
-                return True, seat_status, preferred_seat_xpath
-                
-            elif seat_status == 3:  # 座位已被他人预约
-                self.log("该座位已被他人预约")
-                
-                if try_alternatives:
-                    self.log("正在寻找替代座位...")
-                    alternative_seat = self.find_alternative_seat(preferred_seat_xpath)
-                    
-                    if alternative_seat:
-                        self.log(f"尝试使用替代座位: {alternative_seat}")
-                        try:
-                            # 点击替代座位
-                            alt_seat = WebDriverWait(self.driver, 10).until(
-                                EC.element_to_be_clickable((By.XPATH, alternative_seat))
-                            )
-                            alt_seat.click()
-                            time.sleep(1)  # 等待点击效果
-                            
-                            self.log("成功选择替代座位")
-                            return True, 1, alternative_seat  # 返回状态为可预约
-                            
-                        except Exception as e:
-                            self.log(f"点击替代座位时出错: {e}")
-                            retry_count += 1
+
+                elif seat_status == 3:  # 座位已被他人预约
+                    self.log("该座位已被他人预约")
+
+                    if try_alternatives:
+                        self.log("正在寻找替代座位...")
+                        alternative_seat = self.find_alternative_seat(preferred_seat_xpath, snapshot, preferences, coordinator)
+
+                        if alternative_seat:
+                            self.log(f"尝试使用替代座位: {alternative_seat}")
+                            try:
+                                # 点击替代座位
+                                self.click_seat(alternative_seat)
+
+                                self.log("成功选择替代座位")
+                                return True, 1, alternative_seat  # 返回状态为可预约
+
+                            except Exception as e:
+                                self.log(f"点击替代座位时出错: {e}")
+                                if coordinator is not None:
+                                    coordinator.release()
+                                retry_count += 1
+                        else:
+                            self.log("未找到可用的替代座位")
+                            return False, seat_status, preferred_seat_xpath
                     else:
-                        self.log("未找到可用的替代座位")
+                        self.log("不尝试替代座位，返回失败")
                         return False, seat_status, preferred_seat_xpath
-                else:
-                    self.log("不尝试替代座位，返回失败")
-                    return False, seat_status, preferred_seat_xpath
-                    
-            else:  # 未找到座位或其他问题
-                self.log("座位状态未知或无法识别，尝试重新加载页面")
-                
-                # 尝试刷新页面
-                try:
-                    self.driver.refresh()
-                    time.sleep(3)  # 等待刷新完成
-                except:
-                    pass
-                    
-                retry_count += 1
-            
-            if retry_count < max_retries:
-                self.log(f"将进行第 {retry_count+1} 次座位选择尝试...")
-                time.sleep(2)  # 短暂等待后重试
+
+                else:  # 未找到座位或其他问题
+                    self.log("座位状态未知或无法识别，尝试重新加载页面")
+
+                    # 尝试刷新页面
+                    try:
+                        self.driver.refresh()
+                        wait_for_page_load(self.driver, timeout=15)
+                    except:
+                        pass
+
+                    retry_count += 1
+
+                if retry_count < max_retries:
+                    self.log(f"将进行第 {retry_count+1} 次座位选择尝试...")
         
         self.log(f"座位选择失败，已尝试 {max_retries} 次")
         return False, 0, preferred_seat_xpath
\ No newline at end of file
@@ -0,0 +1,288 @@
+import datetime
+import time
+import logging
+
+from seat_status import SeatStatusHandler, seat_xpath_by_id
+from seat_ranking import preferred_seat_key, SEAT_ID, SEAT_LABEL, SEAT_STATE
+from events import OPERATION, COMPLETED
+from tracing import span
+
+# 座位页面之间转发座位变化的BroadcastChannel名称
+CHANNEL_NAME = 'library-seat-watch'
+
+# 在座位页面中监听座位class变化：被监视的座位变为可预约（active）时发到频道
+INSTALL_OBSERVER_SCRIPT = """
+var slot = arguments[0], watched = arguments[1], channelName = arguments[2];
+var old = window.__seatWatch;
+if (old) { old.observer.disconnect(); old.channel.close(); }
+var w = window.__seatWatch = {
+    watched: watched ? new Set(watched) : null, reported: {}, channel: new BroadcastChannel(channelName)
+};
+function check(cell) {
+    var id = cell.getAttribute('data-id');
+    if (!id || (w.watched && !w.watched.has(id))) { return; }
+    var cl = cell.classList;
+    if (cl.contains('active') && !cl.contains('booked') && !cl.contains('myBooked')) {
+        if (!w.reported[id]) {
+            w.reported[id] = true;
+            var info = cell.querySelector('p.grid-cell-info');
+            w.channel.postMessage({slot: slot, seat: id, label: info ? info.textContent.trim() : '', at: Date.now()});
+        }
+    } else {
+        delete w.reported[id];
+    }
+}
+w.observer = new MutationObserver(function(mutations) {
+    for (var i = 0; i < mutations.length; i++) {
+        var m = mutations[i];
+        if (m.type === 'attributes') {
+            if (m.target.classList.contains('grid-cell-container')) { check(m.target); }
+            continue;
+        }
+        for (var j = 0; j < m.addedNodes.length; j++) {
+            var node = m.addedNodes[j];
+            if (node.nodeType !== 1) { continue; }
+            if (node.classList.contains('grid-cell-container')) { check(node); }
+            var cells = node.querySelectorAll('div.grid-cell-container');
+            for (var k = 0; k < cells.length; k++) { check(cells[k]); }
+        }
+    }
+});
+w.observer.observe(document.body, {subtree: true, childList: true, attributes: true, attributeFilter: ['class']});
+var cells = document.querySelectorAll('div.grid-cell-container');
+for (var i = 0; i < cells.length; i++) { check(cells[i]); }
+return cells.length;
+"""
+
+# 在汇总页（由座位页面打开的同源空白页）中收集所有座位页面发来的变化
+INSTALL_HUB_SCRIPT = """
+var w = window.__seatHub = window.__seatHub || {queue: [], waiter: null};
+if (!w.channel) {
+    w.channel = new BroadcastChannel(arguments[0]);
+    w.channel.onmessage = function(e) { w.queue.push(e.data); if (w.waiter) { w.waiter(); } };
+}
+return true;
+"""
+
+# 长轮询：有变化时立即返回，否则最多等待arguments[0]毫秒后返回空列表
+WAIT_SCRIPT = """
+var timeoutMs = arguments[0], done = arguments[arguments.length - 1];
+var w = window.__seatHub;
+if (!w) { done(null); return; }
+if (w.queue.length) { done(w.queue.splice(0)); return; }
+var timer = setTimeout(function() { w.waiter = null; done([]); }, timeoutMs);
+w.waiter = function() { clearTimeout(timer); w.waiter = null; done(w.queue.splice(0)); };
+"""
+
+class SeatWatcher:
+    """
+    监视已被预约的座位，座位被取消（重新变为可预约）时立即选座并确认
+
+    每个时间段在同一浏览器中打开一个座位页面并安装MutationObserver，座位变化通过BroadcastChannel
+    汇总到一个同源空白页；Python在该页上用execute_async_script长轮询，不刷新页面。
+    """
+
+    def __init__(self, reserver, watch_seconds=1800, poll_seconds=5):
+        """
+        初始化座位监视
+
+        参数:
+            reserver: 已登录的LibraryReserve实例（共享其浏览器和配置）
+            watch_seconds: 最长监视时间（秒），时间段结束后也不再监视
+            poll_seconds: 单次长轮询的最长等待时间（秒）
+        """
+        self.reserver = reserver
+        self.driver = reserver.driver
+        self.callback = reserver.callback
+        self.watch_seconds = watch_seconds
+        self.poll_seconds = poll_seconds
+        self.hub = None
+        self.handles = []  # 监视时打开的所有标签页
+        self.tasks = {}  # 正在监视的时间段索引 -> {'handle', 'url', 'ends_at', 'coordinator', 'watched'}
+
+    def _watched_ids(self, time_index, index):
+        """需要监视的座位data-id，None表示所有座位"""
+        user_config = self.reserver.user_config
+        keys = user_config.get('watch_seats')
+        if not keys:
+            preferences = self.reserver.seat_preferences(time_index)
+            keys = [preferred_seat_key(preferences, user_config)] + list(preferences['preferences'])
+        ids = index.ids_for(key for key in keys if key)
+        return sorted(ids) or None
+
+    def _arm(self, time_index, task, install=True, reopen=False):
+        """
+        在时间段的标签页中进入座位网格
+
+        参数:
+            install: 是否立即安装监听（汇总页打开后才能收到变化）
+            reopen: 是否先重新打开预约页面
+
+        返回:
+            是否成功
+        """
+        self.driver.switch_to.window(task['handle'])
+        if reopen:
+            self.reserver.navigate_to_slot(task['url'])
+        self.reserver.select_area()
+        seat_handler = SeatStatusHandler(self.driver, self.callback, self.reserver.occupancy_observer(time_index))
+        snapshot = seat_handler.wait_for_grid()
+        if not snapshot or not snapshot['seats']:
+            return False
+        seat_handler.observe(snapshot)
+        task['watched'] = self._watched_ids(time_index, seat_handler.index)
+        if install:
+            self._install(time_index, task)
+        return True
+
+    def _install(self, time_index, task):
+        """在时间段的标签页中安装MutationObserver（已可预约的被监视座位会立即发出）"""
+        self.driver.switch_to.window(task['handle'])
+        self.driver.execute_script(INSTALL_OBSERVER_SCRIPT, time_index, task['watched'], CHANNEL_NAME)
+        watched = task['watched']
+        self.callback(f"开始监视第{time_index}个时段的" + (f"{len(watched)}个座位" if watched else "所有座位"))
+
+    def _open(self, time_index):
+        """为时间段打开标签页，返回任务；无法打开时返回None"""
+        spec = self.reserver.get_slot(time_index)
+        if spec is None:
+            return None
+        before = set(self.driver.window_handles)
+        self.driver.execute_script("window.open(arguments[0], '_blank');", spec.url)
+        new_handles = [h for h in self.driver.window_handles if h not in before]
+        if not new_handles:
+            return None
+        self.handles.append(new_handles[0])
+        ends_at = datetime.datetime.strptime(f"{spec.date} {spec.end}", '%Y-%m-%d %H:%M').timestamp()
+        return {
+            'handle': new_handles[0],
+            'url': spec.url,
+            'ends_at': ends_at,
+            'coordinator': self.reserver.get_seat_coordinator(time_index),
+        }
+
+    def _open_hub(self, handle):
+        """从座位页面打开同源的空白汇总页并开始收集变化"""
+        self.driver.switch_to.window(handle)
+        before = set(self.driver.window_handles)
+        self.driver.execute_script("window.open('', 'seat-watch-hub');")
+        new_handles = [h for h in self.driver.window_handles if h not in before]
+        self.hub = new_handles[0]
+        self.handles.append(self.hub)
+        self.driver.switch_to.window(self.hub)
+        self.driver.execute_script(INSTALL_HUB_SCRIPT, CHANNEL_NAME)
+
+    def _wait(self):
+        """在汇总页上长轮询座位变化"""
+        self.driver.switch_to.window(self.hub)
+        events = self.driver.execute_async_script(WAIT_SCRIPT, int(self.poll_seconds * 1000))
+        if events is None:
+            raise RuntimeError("座位监视汇总页已失效")
+        return events
+
+    def _grab(self, time_index, task, event):
+        """座位变为可预约时选座并确认，返回是否预约成功"""
+        self.driver.switch_to.window(task['handle'])
+        seat_handler = SeatStatusHandler(self.driver, self.callback)
+        seat_handler.snapshot_grid()
+        seat = seat_handler.index.by_id.get(event['seat'])
+        if seat is None or seat[SEAT_STATE] != 1:
+            return False
+        coordinator = task['coordinator']
+        if coordinator is not None and not coordinator.claim_seat(seat):
+            return False
+        self.callback(f"第{time_index}个时段座位 {seat[SEAT_LABEL] or seat[SEAT_ID]} 已空出，立即预约")
+        try:
+            seat_handler.click_seat(seat_xpath_by_id(seat[SEAT_ID]))
+            if self.reserver.confirm_reservation():
+                self.reserver.note_seat(time_index, seat)
+                if coordinator is not None:
+                    coordinator.commit()
+                self.reserver.record_checkpoint(time_index, coordinator)
+                return True
+        except Exception as e:
+            logging.warning(f"监视预约第{time_index}个时段出错: {e}")
+        if coordinator is not None:
+            coordinator.release()
+        self.callback(f"第{time_index}个时段座位 {seat[SEAT_LABEL] or seat[SEAT_ID]} 被抢先预约，继续监视")
+        # 确认失败后页面状态未知，重新进入座位网格
+        self._arm(time_index, task, reopen=True)
+        return False
+
+    def watch(self, slot_indices):
+        """
+        监视多个时间段，直到全部预约成功、超时或被终止
+
+        返回:
+            dict: 时间段索引 -> 是否预约成功
+        """
+        results = {i: False for i in slot_indices}
+        origin_handle = self.driver.current_window_handle
+        deadline = time.time() + self.watch_seconds
+        # 浏览器来自共享的浏览器池，结束时恢复原来的脚本超时
+        script_timeout = self.driver.timeouts.script
+        self.driver.set_script_timeout(self.poll_seconds + 10)
+        try:
+            for time_index in slot_indices:
+                task = self._open(time_index)
+                try:
+                    if task is not None and self._arm(time_index, task, install=False):
+                        self.tasks[time_index] = task
+                        continue
+                except Exception as e:
+                    logging.warning(f"监视第{time_index}个时段时无法进入座位页面: {e}")
+                self.callback(f"无法监视第{time_index}个时段")
+            if not self.tasks:
+                return results
+
+            # 先打开汇总页再安装监听，安装时已可预约的座位也能收到
+            self._open_hub(next(iter(self.tasks.values()))['handle'])
+            for time_index, task in self.tasks.items():
+                self._install(time_index, task)
+
+            while self.tasks and time.time() < deadline and not self.reserver.should_stop:
+                for time_index in [i for i, task in self.tasks.items() if task['ends_at'] <= time.time()]:
+                    self.callback(f"第{time_index}个时段已结束，停止监视")
+                    del self.tasks[time_index]
+                for event in self._wait():
+                    time_index = event['slot']
+                    task = self.tasks.get(time_index)
+                    if task is None:
+                        continue
+                    with span('watch.grab', user=self.reserver.user_key, slot=time_index):
+                        try:
+                            grabbed = self._grab(time_index, task, event)
+                        except Exception as e:
+                            logging.error(f"监视预约第{time_index}个时段出错: {e}")
+                            self.callback(f"第{time_index}个时段的座位页面出错，停止监视")
+                            del self.tasks[time_index]
+                            continue
+                    if grabbed:
+                        results[time_index] = True
+                        del self.tasks[time_index]
+                        self.callback(f"第{time_index}个时段监视预约成功")
+                        self.reserver.events.emit(OPERATION, COMPLETED, user=self.reserver.user_key,
+                                                  slot=time_index, watched=True)
+            if self.tasks and not self.reserver.should_stop:
+                self.callback(f"监视结束，第{'、'.join(map(str, self.tasks))}个时段没有空出的座位")
+        finally:
+            open_handles = set(self.driver.window_handles)
+            for handle in self.handles:
+                if handle in open_handles:
+                    try:
+                        self.driver.switch_to.window(handle)
+                        self.driver.close()
+                    except Exception:
+                        pass
+            self.tasks = {}
+            self.handles = []
+            self.hub = None
+            try:
+                self.driver.switch_to.window(origin_handle)
+            except Exception:
+                pass
+            try:
+                self.driver.set_script_timeout(script_timeout)
+            except Exception:
+                pass
+        return results
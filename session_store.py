@@ -0,0 +1,82 @@
+import json
+import os
+import time
+import logging
+from utils import resource_path
+
+class SessionStore:
+    """按用户持久化登录会话Cookie，用于跳过重复登录和多因子验证"""
+
+    def __init__(self, store_dir='sessions', max_age=12 * 3600):
+        """
+        初始化会话存储
+
+        参数:
+            store_dir: 会话文件保存目录
+            max_age: 会话最长保留时间（秒），超过后视为失效
+        """
+        self.store_dir = resource_path(store_dir)
+        self.max_age = max_age
+
+    def _session_file(self, user_key):
+        """获取用户会话文件路径"""
+        safe_key = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(user_key))
+        return os.path.join(self.store_dir, f"{safe_key}.json")
+
+    def load(self, user_key):
+        """
+        读取用户保存的Cookie
+
+        返回:
+            list: 未过期的Cookie列表，没有可用会话时返回None
+        """
+        if not user_key:
+            return None
+        path = self._session_file(user_key)
+        try:
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            now = time.time()
+            if now - data.get('saved_at', 0) > self.max_age:
+                self.clear(user_key)
+                return None
+
+            # 过滤掉已过期的Cookie（会话Cookie没有过期时间）
+            cookies = []
+            for cookie in data.get('cookies', []):
+                expires = cookie.get('expires', cookie.get('expiry'))
+                if expires is not None and 0 < expires < now:
+                    continue
+                cookies.append(cookie)
+            return cookies or None
+        except Exception as e:
+            logging.warning(f"读取会话缓存失败: {e}")
+            return None
+
+    def save(self, user_key, cookies):
+        """保存用户Cookie"""
+        if not user_key or not cookies:
+            return False
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            path = self._session_file(user_key)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': time.time(), 'cookies': cookies}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logging.warning(f"保存会话缓存失败: {e}")
+            return False
+
+    def clear(self, user_key):
+        """删除用户会话缓存"""
+        try:
+            path = self._session_file(user_key)
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logging.warning(f"删除会话缓存失败: {e}")
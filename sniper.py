@@ -0,0 +1,251 @@
+import datetime
+import time
+import logging
+import urllib.error
+import urllib.request
+from email.utils import parsedate_to_datetime
+
+# 在页面内发起HEAD请求，返回发送/接收时刻和响应的Date头
+FETCH_DATE_SCRIPT = """
+var done = arguments[arguments.length - 1];
+var t0 = Date.now();
+fetch(arguments[0], {method: 'HEAD', cache: 'no-store', credentials: 'include'})
+    .then(function (r) { done([t0, Date.now(), r.headers.get('date')]); })
+    .catch(function (e) { done([t0, Date.now(), null]); });
+"""
+
+class ClockSync:
+    """通过HTTP Date头估算本机时钟与服务器时钟的偏差"""
+
+    def __init__(self, url, driver=None, samples=6):
+        """
+        初始化时钟同步
+
+        参数:
+            url: 用于采样的服务器URL
+            driver: 已登录的WebDriver，提供时在页面内采样（携带会话Cookie）
+            samples: 采样次数
+        """
+        self.url = url
+        self.driver = driver
+        self.samples = samples
+        self.offset = 0.0
+        self.error = None
+
+    def _sample_browser(self):
+        """在浏览器中采样，返回(发送时刻, 接收时刻, Date头)，时间单位为秒"""
+        t0, t1, date_header = self.driver.execute_async_script(FETCH_DATE_SCRIPT, self.url)
+        return t0 / 1000.0, t1 / 1000.0, date_header
+
+    def _sample_http(self):
+        """直接发送HEAD请求采样"""
+        request = urllib.request.Request(self.url, method='HEAD')
+        t0 = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                date_header = response.headers.get('Date')
+        except urllib.error.HTTPError as e:
+            date_header = e.headers.get('Date')
+        return t0, time.time(), date_header
+
+    def estimate(self):
+        """
+        估算时钟偏差（服务器时间 - 本机时间）
+
+        Date头精度为1秒，每次采样给出偏差的一个区间，
+        错开采样时刻后取所有区间的交集，可以把误差缩小到往返时延量级。
+
+        返回:
+            (偏差秒数, 误差秒数)，无法估算时返回(0.0, None)
+        """
+        lower, upper = None, None
+        for i in range(self.samples):
+            try:
+                if self.driver is not None:
+                    t0, t1, date_header = self._sample_browser()
+                else:
+                    t0, t1, date_header = self._sample_http()
+            except Exception as e:
+                logging.warning(f"时钟采样失败: {e}")
+                continue
+            if not date_header:
+                continue
+
+            server_second = parsedate_to_datetime(date_header).timestamp()
+            # 服务器在[t0, t1]之间某时刻生成Date，真实服务器时间在[D, D+1)之间
+            lo = server_second - t1
+            hi = server_second + 1 - t0
+            lower = lo if lower is None else max(lower, lo)
+            upper = hi if upper is None else min(upper, hi)
+
+            # 错开采样时刻，使秒边界落在不同位置
+            if i < self.samples - 1:
+                time.sleep(1.0 / self.samples + 0.013)
+
+        if lower is None:
+            return 0.0, None
+        if lower > upper:
+            # 区间不相交（网络抖动较大），退化为中点估计
+            lower, upper = upper, lower
+        self.offset = (lower + upper) / 2
+        self.error = (upper - lower) / 2
+        return self.offset, self.error
+
+    def to_local(self, server_timestamp):
+        """将服务器时间戳换算为本机时间戳"""
+        return server_timestamp - self.offset
+
+def parse_release_time(value, now=None):
+    """
+    解析放号时间（HH:MM 或 HH:MM:SS），返回下一个到达该时刻的datetime
+    """
+    now = now or datetime.datetime.now()
+    parts = [int(p) for p in value.strip().split(':')]
+    while len(parts) < 3:
+        parts.append(0)
+    release = now.replace(hour=parts[0], minute=parts[1], second=parts[2], microsecond=0)
+    if release <= now:
+        release += datetime.timedelta(days=1)
+    return release
+
+class ReleaseSniper:
+    """在放号时刻触发选座和确认的定时预约"""
+
+    def __init__(self, reserver, release_at, slot_indices=None, lead_seconds=60, spin_seconds=0.2):
+        """
+        初始化定时预约
+
+        参数:
+            reserver: LibraryReserve实例
+            release_at: 放号时间（datetime，服务器时间）
+            slot_indices: 需要预约的时间段，第一个在放号时刻抢占，其余随后依次预约
+            lead_seconds: 提前登录和进入座位页面的秒数
+            spin_seconds: 放号前改为忙等待的时间窗口（秒），用于降低触发抖动
+        """
+        self.reserver = reserver
+        self.release_at = release_at
+        if not slot_indices:
+            # 默认放号时刻抢占历史上最紧张的时间段
+            plan = reserver.get_plan()
+            slot_indices = reserver.order_slots(plan.indices) if plan else []
+        self.slot_indices = list(slot_indices)
+        self.lead_seconds = lead_seconds
+        self.spin_seconds = spin_seconds
+        self.clock = None
+        self.jitter_ms = None
+
+    def __getattr__(self, name):
+        # 其余属性（auth、driver、stop_operation等）委托给预约实例
+        return getattr(self.reserver, name)
+
+    def _sleep_until(self, local_ts):
+        """等待到指定的本机时间，可被终止；最后一小段忙等待以减小抖动"""
+        while True:
+            if self.reserver.should_stop:
+                return False
+            remaining = local_ts - time.time()
+            if remaining <= self.spin_seconds:
+                break
+            time.sleep(min(remaining - self.spin_seconds, 0.5))
+        while time.time() < local_ts:
+            pass
+        return True
+
+    def run(self):
+        """等待到放号前、登录、进入座位页面并在放号时刻触发"""
+        reserver = self.reserver
+        reserver.should_stop = False
+        reserver.callback(f"定时预约: 放号时间 {self.release_at.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        if not reserver.validate_reserve_config():
+            return False
+
+        # 等待到放号前的准备时刻
+        prepare_at = self.release_at.timestamp() - self.lead_seconds
+        if prepare_at > time.time():
+            reserver.callback(f"将在放号前{self.lead_seconds}秒开始登录")
+            if not self._sleep_until(prepare_at):
+                reserver.callback("操作已终止")
+                return False
+
+        reserver.callback("准备登录...")
+        login_result = reserver.auth.login(callback=reserver.callback)
+        if login_result == "MFA_REQUIRED":
+            reserver.callback("等待验证码输入...")
+            return "MFA_REQUIRED"
+        if not reserver.auth.is_logged_in:
+            reserver.callback("登录失败，无法继续预约")
+            return False
+
+        return self.arm_and_fire()
+
+    def continue_with_verification(self, code):
+        """提交验证码后继续定时预约"""
+        if not self.reserver.auth.submit_verification_code(code, callback=self.reserver.callback):
+            self.reserver.callback("验证码验证失败")
+            return False
+        return self.arm_and_fire()
+
+    def arm_and_fire(self):
+        """预先进入座位页面，校准时钟后在放号时刻选座并确认"""
+        reserver = self.reserver
+        time_index = self.slot_indices[0]
+        results = {}
+
+        try:
+            reservation_url = reserver.build_reservation_url(time_index)
+            if not reservation_url:
+                return False
+            reserver.open_seat_page(reservation_url)
+            reserver.callback(f"已进入第{time_index}个时段座位页面，等待放号")
+
+            # 估算服务器时钟偏差
+            self.clock = ClockSync(reservation_url.split('#')[0], driver=reserver.driver)
+            offset, error = self.clock.estimate()
+            if error is None:
+                reserver.callback("无法获取服务器时间，使用本机时间")
+            else:
+                reserver.callback(f"服务器时钟偏差 {offset * 1000:+.0f} ms (误差±{error * 1000:.0f} ms)")
+
+            # 在校准后的时刻触发
+            target = self.clock.to_local(self.release_at.timestamp())
+            if not self._sleep_until(target):
+                reserver.callback("操作已终止")
+                return False
+            fired_at = time.time()
+            self.jitter_ms = (fired_at - target) * 1000
+
+            # 与同时预约的其他用户协调座位（按认领表跳过其他用户持有的座位）
+            coordinator = reserver.get_seat_coordinator(time_index)
+            success, status, _ = reserver.select_seat(coordinator, time_index)
+            if status == 2:
+                results[time_index] = True
+            elif success:
+                results[time_index] = reserver.confirm_reservation()
+            else:
+                results[time_index] = False
+            reserver.callback(f"放号触发抖动 {self.jitter_ms:.1f} ms，首次点击耗时 {(time.time() - fired_at) * 1000:.0f} ms")
+
+            if results[time_index]:
+                if coordinator:
+                    coordinator.commit()
+                reserver.record_checkpoint(time_index, coordinator)
+                reserver.callback(f"第{time_index}个时段预约成功")
+            else:
+                if coordinator:
+                    coordinator.release()
+                # 抢占失败时交给常规流程重试
+                results[time_index] = reserver.reserve_single_time_slot(time_index)
+        except Exception as e:
+            error_msg = f"定时预约第{time_index}个时段出错: {e}"
+            reserver.callback(error_msg)
+            logging.error(error_msg)
+            results[time_index] = False
+
+        # 其余时段按常规流程预约
+        rest = self.slot_indices[1:]
+        success_count = reserver.reserve_all_slots(rest) if rest else 0
+        # reserve_all_slots只记录其余时段的结果，放号时刻抢到的时段也要计入（用于安排签到）
+        reserver.slot_results = dict(reserver.slot_results) if rest else {}
+        reserver.slot_results.update(results)
+        return success_count + (1 if results.get(time_index) else 0) > 0
@@ -0,0 +1,198 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+# 内存中保留的最大span数量（超出后丢弃最早的记录）
+MAX_SPANS = 100000
+
+# 设置该环境变量时，程序退出时把跟踪结果导出到该路径（Chrome trace格式）
+TRACE_ENV = 'LIBRARY_TRACE'
+
+_spans = deque(maxlen=MAX_SPANS)
+_lock = threading.Lock()
+_context = threading.local()
+_export_path = None
+
+def _attr_stack():
+    stack = getattr(_context, 'stack', None)
+    if stack is None:
+        stack = _context.stack = [{}]
+    return stack
+
+def current_attrs():
+    """当前线程中外层span的属性（内层span继承，例如 user、slot、retry）"""
+    return dict(_attr_stack()[-1])
+
+def record_span(name, start, duration, attrs=None):
+    """
+    记录一个已结束的span
+
+    参数:
+        name: 步骤名称
+        start: 开始时刻（time.perf_counter秒）
+        duration: 耗时（秒）
+        attrs: 附加属性
+    """
+    merged = current_attrs()
+    merged.update(attrs or {})
+    with _lock:
+        _spans.append((name, start, duration, os.getpid(), threading.get_ident(), merged))
+
+@contextmanager
+def span(name, **attrs):
+    """
+    记录代码块耗时的上下文管理器，属性会传递给块内的span
+
+    用法:
+        with span('reserve.slot', user='LZ', slot=1, retry=0):
+            ...
+    """
+    stack = _attr_stack()
+    merged = dict(stack[-1])
+    merged.update((key, value) for key, value in attrs.items() if value is not None)
+    stack.append(merged)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield merged
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        if error:
+            merged['error'] = error
+        with _lock:
+            _spans.append((name, start, duration, os.getpid(), threading.get_ident(), merged))
+
+def traced(name=None):
+    """
+    记录函数耗时的装饰器
+
+    被装饰的是方法且实例有 user_key 属性时，自动附加 user 属性
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            user = getattr(args[0], 'user_key', None) if args else None
+            with span(span_name, user=user):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def spans():
+    """已记录的span列表 [(名称, 开始, 耗时, pid, tid, 属性), ...]"""
+    with _lock:
+        return list(_spans)
+
+def drain():
+    """取出并清空已记录的span（用于从工作进程传回主进程）"""
+    with _lock:
+        result = list(_spans)
+        _spans.clear()
+    return result
+
+def extend(records):
+    """合并其他进程记录的span"""
+    with _lock:
+        _spans.extend(tuple(record) for record in records)
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+def percentile(values, pct):
+    """线性插值的百分位数"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def summary(records=None):
+    """
+    按步骤汇总耗时
+
+    返回:
+        dict: 名称 -> {'count', 'total_ms', 'p50_ms', 'p95_ms', 'max_ms'}
+    """
+    by_name = {}
+    for record in records if records is not None else spans():
+        by_name.setdefault(record[0], []).append(record[2] * 1000)
+    return {
+        name: {
+            'count': len(values),
+            'total_ms': round(sum(values), 1),
+            'p50_ms': round(percentile(values, 50), 1),
+            'p95_ms': round(percentile(values, 95), 1),
+            'max_ms': round(max(values), 1),
+        }
+        for name, values in sorted(by_name.items())
+    }
+
+def format_summary(stats=None):
+    """把汇总结果格式化为文本（按总耗时降序）"""
+    stats = summary() if stats is None else stats
+    lines = [f"{'步骤':<36} {'次数':>6} {'总计(ms)':>11} {'p50(ms)':>9} {'p95(ms)':>9} {'最大(ms)':>9}"]
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]['total_ms']):
+        lines.append(f"{name:<36} {s['count']:>6} {s['total_ms']:>11} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['max_ms']:>9}")
+    return "\n".join(lines)
+
+def chrome_trace(records=None):
+    """转换为Chrome trace-event格式（可在 chrome://tracing 或 Perfetto 中打开）"""
+    events = []
+    for name, start, duration, pid, tid, attrs in records if records is not None else spans():
+        events.append({
+            'name': name,
+            'cat': name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': round(start * 1e6, 1),
+            'dur': round(duration * 1e6, 1),
+            'pid': pid,
+            'tid': tid,
+            'args': {key: value if isinstance(value, (int, float, bool)) else str(value)
+                     for key, value in attrs.items()},
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def export_chrome_trace(path, records=None):
+    """把跟踪结果写入JSON文件，返回写入的span数量"""
+    trace = chrome_trace(records)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace, f, ensure_ascii=False)
+    return len(trace['traceEvents'])
+
+def _export_at_exit():
+    if not _export_path:
+        return
+    try:
+        count = export_chrome_trace(_export_path)
+        logging.info(f"已导出{count}个跟踪记录到 {_export_path}\n{format_summary()}")
+    except Exception as e:
+        logging.error(f"导出跟踪记录失败: {e}")
+
+def setup_tracing(path=None):
+    """
+    程序退出时导出跟踪结果并记录各步骤耗时汇总
+
+    参数:
+        path: 导出路径，默认读取环境变量 LIBRARY_TRACE，都没有时不导出
+    """
+    global _export_path
+    path = path or os.environ.get(TRACE_ENV)
+    if not path:
+        return None
+    if _export_path is None:
+        atexit.register(_export_at_exit)
+    _export_path = path
+    return path
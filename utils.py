@@ -2,7 +2,21 @@ import os
 import sys
 import time
 import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from selenium.webdriver.support.ui import WebDriverWait
+from tracing import record_span
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 预约应用首页（经webvpn转发），可通过配置项 app_url 覆盖（例如指向本地模拟服务器）
+APP_INDEX_URL = "https://webvpn3.hebau.edu.cn/https/77726476706e69737468656265737421f5ff40902b7e60557c099ce29d51367b21a6/qljfwapp/sys/lwAppointmentPublicPlace/*default/index.do"
 
 def resource_path(relative_path):
     """获取资源绝对路径（支持打包后的路径）"""
@@ -15,26 +29,147 @@ def resource_path(relative_path):
         
     return os.path.join(base_path, relative_path)
 
+@contextmanager
+def file_lock(path):
+    """跨进程的排他文件锁"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# 条件等待的默认轮询间隔（秒）
+POLL_INTERVAL = 0.05
+
+# 每类等待的实际耗时汇总：名称 -> [次数, 总秒数, 最大秒数]（只保留汇总，长时间运行时不会增长）
+WAIT_STATS = defaultdict(lambda: [0, 0.0, 0.0])
+_wait_stats_lock = threading.Lock()
+
+def record_wait(name, seconds):
+    """记录一次等待的实际耗时"""
+    with _wait_stats_lock:
+        stats = WAIT_STATS[name]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+    logging.debug(f"等待 {name} 耗时 {seconds * 1000:.0f} ms")
+
+def wait_stats_summary():
+    """
+    汇总各类等待的耗时
+
+    返回:
+        dict: 名称 -> {'count', 'total_ms', 'max_ms'}
+    """
+    with _wait_stats_lock:
+        return {
+            name: {
+                'count': count,
+                'total_ms': round(total * 1000, 1),
+                'max_ms': round(longest * 1000, 1),
+            }
+            for name, (count, total, longest) in WAIT_STATS.items() if count
+        }
+
+def wait_until(driver, condition, timeout=10, name=None, poll_interval=POLL_INTERVAL):
+    """
+    以较短的轮询间隔等待条件成立，并记录实际等待时间
+
+    参数:
+        driver: WebDriver实例
+        condition: 接收driver的条件函数（返回真值表示成立），可以是expected_conditions
+        timeout: 最长等待时间（秒）
+        name: 用于统计的等待名称
+        poll_interval: 轮询间隔（秒）
+
+    返回:
+        条件函数的返回值；超时抛出TimeoutException
+    """
+    name = name or getattr(condition, '__name__', 'wait')
+    start = time.perf_counter()
+    timed_out = True
+    try:
+        result = WebDriverWait(
+            driver, timeout, poll_frequency=poll_interval,
+            ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)
+        ).until(condition)
+        timed_out = False
+        return result
+    finally:
+        elapsed = time.perf_counter() - start
+        record_wait(name, elapsed)
+        record_span(f"wait.{name}", start, elapsed, {'timed_out': True} if timed_out else None)
+
+def click_and_await(driver, element, condition, timeout=10, name=None):
+    """
+    点击元素后等待点击产生的结果，而不是固定sleep
+
+    参数:
+        driver: WebDriver实例
+        element: 要点击的元素
+        condition: 点击后应当成立的条件
+        timeout: 最长等待时间（秒）
+        name: 用于统计的等待名称
+
+    返回:
+        条件函数的返回值；超时抛出TimeoutException
+    """
+    element.click()
+    return wait_until(driver, condition, timeout, name)
+
+def page_ready(driver):
+    """条件: 页面加载完成"""
+    return driver.execute_script('return document.readyState') == 'complete'
+
+def class_changed(element):
+    """条件: 元素的class发生变化（元素被重新渲染也视为变化）"""
+    try:
+        before = element.get_attribute('class')
+    except StaleElementReferenceException:
+        before = None
+
+    def condition(driver):
+        try:
+            return element.get_attribute('class') != before
+        except StaleElementReferenceException:
+            return True
+    return condition
+
+def url_not_contains(text):
+    """条件: 当前URL不包含指定文本"""
+    return lambda driver: text not in driver.current_url
+
 def wait_for_page_load(driver, timeout=30):
     """等待页面完全加载"""
     try:
-        WebDriverWait(driver, timeout).until(
-            lambda d: d.execute_script('return document.readyState') == 'complete'
-        )
-        # 额外等待确保JS渲染完成
-        time.sleep(1)
+        wait_until(driver, page_ready, timeout, name='page_load')
         return True
     except Exception as e:
         logging.warning(f"页面加载超时: {e}")
         return False
 
-def safe_click(element, wait_time=1):
-    """安全点击元素并等待"""
+def safe_click(element, driver=None, condition=None, timeout=10):
+    """安全点击元素，提供条件时等待点击结果出现"""
     try:
-        element.click()
-        time.sleep(wait_time)  # 等待点击效果
+        if driver is not None and condition is not None:
+            click_and_await(driver, element, condition, timeout)
+        else:
+            element.click()
         return True
     except Exception as e:
         logging.error(f"点击元素时出错: {e}")
         return False
-    
\ No newline at end of file